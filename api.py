@@ -1,84 +1,172 @@
 import os
 import json
+import logging
 import uuid
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-import google.generativeai as genai
+
+# Structured, queued logging before anything else logs at import
+import logs
+logs.setup()
 
 # FIREBASE ONLY: Import Firebase for complete data storage
-from firebase_init import firebase
+from firebase_init import firebase, IS_PRODUCTION
 from firebase_models import (
     User, Field, DiseaseReport, IrrigationRecord, FertilizerRecord,
     MarketPrice, MarketFavorite, WeatherForecast, ChatHistory
 )
+import market_stats
+import price_alerts
+import market_refresher
+import http_cache
+import json_provider
+import sync
+import image_preprocess
+import detection_cache
+import detection_jobs
+import upload_storage
+import thumbnails
+import disease_analysis
+import metrics
+import local_classifier
+import disease_stats
+import chat_cache
+import intent_matcher
+import prompts
+import chat_summary
+import chat_writes
+import field_context
+import flows
+import startup
+
+logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = json_provider.FastJSONProvider(app)
 CORS(app)  # Enable CORS
 
+
+@app.before_request
+def bind_request_id():
+    """Correlation id for this request's log records (X-Request-ID or generated)"""
+    logs.bind_request_id(request.headers.get(logs.REQUEST_ID_HEADER))
+
+
+@app.after_request
+def add_request_id_header(response):
+    request_id = logs.request_id()
+    if request_id:
+        response.headers[logs.REQUEST_ID_HEADER] = request_id
+    return response
+
+
+@app.teardown_request
+def clear_request_id(error=None):
+    logs.clear_request_id()
+
+
 # FIREBASE ONLY: We've fully migrated to Firebase, no longer using PostgreSQL
-print("FIREBASE MIGRATION COMPLETE: Using Firebase exclusively for all data storage")
+logger.info("FIREBASE MIGRATION COMPLETE: Using Firebase exclusively for all data storage")
 
 # Skip PostgreSQL initialization
-print("PostgreSQL database integration has been removed")
+logger.info("PostgreSQL database integration has been removed")
 
 # No migration needed as we're fully on Firebase now
-print("No migration needed - fully operating on Firebase")
+logger.info("No migration needed - fully operating on Firebase")
 
 # Configure Google Gemini API if API key is available
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 
+
+def _configure_gemini(module):
+    if GEMINI_API_KEY:
+        module.configure(api_key=GEMINI_API_KEY)
+
+
+# The Gemini SDK takes most of a second to import; it is loaded on first use
+genai = startup.LazyModule('google.generativeai', on_load=_configure_gemini)
+
+# The chat cache embeds questions through the same configured SDK
+if GEMINI_API_KEY:
+    chat_cache.cache.embed_content = lambda **kwargs: genai.embed_content(**kwargs)
+
 # Rate limit tracker to avoid quota issues
 last_api_call_time = {}
 rate_limit_interval = 10  # Seconds between API calls to avoid quota issues
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # Use the latest available Gemini model
-    try:
-        # List available models
-        available_models = [m.name for m in genai.list_models()]
-        print(f"Available Gemini models: {available_models}")
-        
-        # Try to use Flash models first as they have higher quotas
-        if 'models/gemini-1.5-flash-latest' in available_models:
-            gemini_model = genai.GenerativeModel('models/gemini-1.5-flash-latest')
-            print("Using gemini-1.5-flash-latest model to avoid quota issues")
-        elif 'models/gemini-1.5-flash' in available_models:
-            gemini_model = genai.GenerativeModel('models/gemini-1.5-flash')
-            print("Using gemini-1.5-flash model to avoid quota issues")
-        elif 'models/gemini-1.5-pro-latest' in available_models:
-            gemini_model = genai.GenerativeModel('models/gemini-1.5-pro-latest')
-            print("Using gemini-1.5-pro-latest model")
-        else:
-            # Fallback to any available Gemini model
-            for model_name in available_models:
-                if 'gemini' in model_name and 'flash' in model_name:
-                    gemini_model = genai.GenerativeModel(model_name)
-                    print(f"Using fallback Gemini Flash model: {model_name}")
-                    break
+if not GEMINI_API_KEY:
+    logger.warning("No Gemini API key available")
+
+# Preferred Gemini model, discovered on first use (see get_gemini_model)
+gemini_model = None
+_gemini_model_lock = threading.Lock()
+
+
+def get_gemini_model():
+    """Pick the preferred available Gemini model; one list_models round trip per process"""
+    global gemini_model
+    if gemini_model is not None or not GEMINI_API_KEY:
+        return gemini_model
+    with _gemini_model_lock:
+        if gemini_model is not None:
+            return gemini_model
+        try:
+            # List available models
+            available_models = [m.name for m in genai.list_models()]
+            logger.info("Available Gemini models: %s", available_models)
+
+            # Try to use Flash models first as they have higher quotas
+            if 'models/gemini-1.5-flash-latest' in available_models:
+                gemini_model = genai.GenerativeModel('models/gemini-1.5-flash-latest')
+                logger.info("Using gemini-1.5-flash-latest model to avoid quota issues")
+            elif 'models/gemini-1.5-flash' in available_models:
+                gemini_model = genai.GenerativeModel('models/gemini-1.5-flash')
+                logger.info("Using gemini-1.5-flash model to avoid quota issues")
+            elif 'models/gemini-1.5-pro-latest' in available_models:
+                gemini_model = genai.GenerativeModel('models/gemini-1.5-pro-latest')
+                logger.info("Using gemini-1.5-pro-latest model")
             else:
+                # Fallback to any available Gemini model
                 for model_name in available_models:
-                    if 'gemini' in model_name:
+                    if 'gemini' in model_name and 'flash' in model_name:
                         gemini_model = genai.GenerativeModel(model_name)
-                        print(f"Using fallback Gemini model: {model_name}")
+                        logger.info("Using fallback Gemini Flash model: %s", model_name)
                         break
                 else:
-                    print("No suitable Gemini model found, using first available model")
-                    gemini_model = genai.GenerativeModel(available_models[0])
-    except Exception as e:
-        print(f"Error initializing Gemini model: {str(e)}")
-        gemini_model = None
-        # Set a dummy model that will be replaced on first use
-        gemini_model = None
-else:
-    print("No Gemini API key available")
+                    for model_name in available_models:
+                        if 'gemini' in model_name:
+                            gemini_model = genai.GenerativeModel(model_name)
+                            logger.info("Using fallback Gemini model: %s", model_name)
+                            break
+                    else:
+                        logger.info("No suitable Gemini model found, using first available model")
+                        gemini_model = genai.GenerativeModel(available_models[0])
+        except Exception as e:
+            logger.error("Error initializing Gemini model: %s", e)
+            gemini_model = None
+    return gemini_model
+
+
+# Slow start-up steps, run in the background once the process serves (see startup.py)
+startup.warmup.add('gemini_sdk', genai.load)
+startup.warmup.add('firebase', firebase.load)
+if GEMINI_API_KEY:
+    startup.warmup.add('gemini_models', get_gemini_model)
 
 # ------ Helper Functions ------
 
 def generate_farm_guidance(field):
+    """Generate farming guidance for a field (see generate_farm_guidance_with_source)"""
+    return generate_farm_guidance_with_source(field)[0]
+
+
+def generate_farm_guidance_with_source(field):
     """
     Generate AI-powered farming guidance based on field details
     
@@ -86,8 +174,9 @@ def generate_farm_guidance(field):
         field: Field object with crop_type, soil_type, location, etc.
     
     Returns:
-        dict: Structured guidance including general recommendations, crop-specific advice,
-              fertilizer recommendations, pest management, and sustainable practices
+        tuple: (guidance, source). guidance is a dict of general recommendations, crop-specific
+               advice, fertilizer recommendations, pest management, and sustainable practices;
+               source is 'gemini' for an AI answer or 'knowledge_base' for the rule-based fallback
     """
     # Default structured response
     guidance = {
@@ -105,26 +194,15 @@ def generate_farm_guidance(field):
             model = genai.GenerativeModel('gemini-pro')
             
             # Construct the prompt for the AI model with field details
-            prompt = f"""
-            As an agricultural expert, provide comprehensive farming guidance for the following field:
-            
-            Field Name: {field.name}
-            Location: {field.location or 'Unknown'}
-            Area: {field.area or 'Unknown'} hectares
-            Crop Type: {field.crop_type or 'Unknown'}
-            Soil Type: {field.soil_type or 'Unknown'}
-            Planting Date: {field.planting_date.strftime('%Y-%m-%d') if field.planting_date else 'Not specified'}
-            
-            Please provide structured farming recommendations in the following categories:
-            1. General Recommendations: Overall management practices for this field
-            2. Crop-Specific Advice: Best practices for growing {field.crop_type} successfully
-            3. Fertilizer Recommendations: What fertilizers to use, when and how much
-            4. Pest Management: Common pests/diseases for {field.crop_type} and how to prevent/treat them
-            5. Irrigation Guidance: Best irrigation practices for {field.crop_type} in {field.soil_type or 'this'} soil
-            6. Sustainable Practices: Environmentally friendly farming techniques
-            
-            Format the response in JSON with arrays of advice for each category.
-            """
+            prompt = prompts.FARM_GUIDANCE.render(
+                name=field.name,
+                location=field.location or 'Unknown',
+                area=field.area or 'Unknown',
+                crop_type=field.crop_type or 'Unknown',
+                soil_type=field.soil_type or 'Unknown',
+                planting_date=field.planting_date.strftime('%Y-%m-%d') if field.planting_date else 'Not specified',
+                soil_description=field.soil_type or 'this'
+            )
             
             response = model.generate_content(prompt)
             
@@ -154,7 +232,7 @@ def generate_farm_guidance(field):
                             guidance[key] = parsed_guidance[key]
                 
                 except (json.JSONDecodeError, ValueError, KeyError) as e:
-                    print(f"Error parsing AI response: {str(e)}")
+                    logger.error("Error parsing AI response: %s", e)
                     # Manually parse the text response if JSON parsing fails
                     sections = response.text.split('\n\n')
                     current_section = None
@@ -181,6 +259,8 @@ def generate_farm_guidance(field):
                                 if points and current_section in guidance:
                                     guidance[current_section] = points
         
+        source = 'gemini' if GEMINI_API_KEY and any(guidance.values()) else 'knowledge_base'
+        
         # If no AI is available, or if AI fails, use structured knowledge base
         if not GEMINI_API_KEY or not any(guidance.values()):
             # Provide basic guidance based on crop type and soil type
@@ -199,10 +279,10 @@ def generate_farm_guidance(field):
                 if key in guidance and value:
                     guidance[key].extend(value)
         
-        return guidance
+        return guidance, source
     
     except Exception as e:
-        print(f"Error generating farm guidance: {str(e)}")
+        logger.error("Error generating farm guidance: %s", e)
         # Return basic guidance in case of error
         return {
             'general_recommendations': [
@@ -230,7 +310,7 @@ def generate_farm_guidance(field):
                 "Minimize soil disturbance to reduce erosion", 
                 "Consider cover crops to improve soil health"
             ]
-        }
+        }, 'knowledge_base'
 
 def get_crop_specific_guidance(crop_type):
     """Provide guidance specific to crop type"""
@@ -532,24 +612,47 @@ def get_soil_specific_guidance(soil_type, crop_type):
 
 # ------ API Routes ------
 
+# Hardcoded Hindi replies used when no Gemini API key is configured
+HINDI_FALLBACK_RESPONSES = {
+    "hello": "नमस्ते! मैं आपका AI किसान सहायक हूँ। मैं आपकी कैसे मदद कर सकता हूँ?",
+    "hi": "नमस्ते! आज आप किस प्रकार की कृषि जानकारी के बारे में पूछना चाहेंगे?",
+    "how are you": "मैं एक AI सहायक हूँ और सदैव आपकी सेवा के लिए तैयार हूँ। आपको खेती से संबंधित क्या जानकारी चाहिए?",
+    "help": "मैं फसल चुनाव, रोग निदान, मौसम सलाह, और उर्वरक सिफारिशों जैसे विषयों पर मदद कर सकता हूँ। कृपया विशेष प्रश्न पूछें।",
+    "weather": "आपके क्षेत्र के मौसम की जानकारी के लिए, कृपया अपना स्थान बताएं। मैं वहां के मौसम पूर्वानुमान प्रदान करूंगा।",
+    "crops": "भारत में मुख्य फसलें चावल, गेहूं, मक्का, ज्वार, बाजरा, दालें, तिलहन, गन्ना और कपास हैं। किस फसल के बारे में जानकारी चाहिए?",
+    "fertilizer": "उर्वरक सिफारिशों के लिए, मुझे आपकी फसल, मिट्टी का प्रकार और फसल का चरण बताएं। उचित उर्वरक प्रबंधन फसल उत्पादन में महत्वपूर्ण है।"
+}
+
+# Chat keywords compiled once; the canned responses above are keyed by their trigger
+chat_matcher = intent_matcher.IntentMatcher(response_keywords=list(HINDI_FALLBACK_RESPONSES))
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Process chat message and return AI response with context awareness - FIREBASE ONLY"""
+    payload, status = flows.run_sync(chat_flow(request.get_json(silent=True)))
+    return jsonify(payload), status
+
+
+def chat_flow(data):
+    """Chat turn as an I/O-agnostic flow (see flows.py), also served by asgi.py"""
     try:
-        data = request.json
+        if not isinstance(data, dict):
+            return {'error': 'Request body must be a JSON object'}, 400
+        
         user_message = data.get('message', '')
         user_id = data.get('user_id', 'anonymous')
         session_id = data.get('session_id', str(uuid.uuid4()))  # Generate a session ID if none provided
-        context_window = data.get('context_window', 5)  # Number of previous messages to include for context
+        context_window = data.get('context_window', 5)  # Number of recent messages to include verbatim
         
         if not user_message:
-            return jsonify({'error': 'No message provided'}), 400
+            return {'error': 'No message provided'}, 400
         
         # Default response in case AI is not available - in Hindi
         default_response = "मैं AI किसान, आपका कृषि सहायक हूँ। मैं फसल की सलाह, रोग पहचान, मौसम की व्याख्या, और अधिक में आपकी मदद कर सकता हूँ। बेहतर सहायता के लिए कृपया अपने कृषि प्रश्न के बारे में विशिष्ट विवरण प्रदान करें।"
         
-        # Detect topic/intent (simple keyword-based for now)
-        context_data = detect_chat_intent(user_message)
+        # Intents, canned-response trigger and field-context trigger in one pass
+        message_match = chat_matcher.classify(user_message)
+        context_data = detect_chat_intent(user_message, message_match)
         
         # Save message to chat history using Firebase
         try:
@@ -563,63 +666,40 @@ def chat():
                 'context_data': context_data
             }
             
-            # Use Firebase model
-            ChatHistory.create(chat_data)
-            print(f"Saved chat message to Firebase for user {user_id}")
+            # Buffered write-behind; flushed to Firebase in batches off the request path
+            yield flows.Blocking(chat_writes.writer.append, chat_data)
+            logger.debug("Queued chat message for Firebase for user %s", user_id)
         except Exception as e:
-            print(f"Error in chat save: {str(e)}")
-            return jsonify({'error': f'Failed to save chat message: {str(e)}'}), 500
+            logger.error("Error in chat save: %s", e)
+            return {'error': f'Failed to save chat message: {str(e)}'}, 500
         
         # Get conversation history from Firebase
         try:
             # Get conversation history from Firebase model
-            print(f"Using Firebase to get chat history for user {user_id}, session {session_id}")
-            chat_history = ChatHistory.get_by_user_and_session(user_id, session_id)
+            logger.debug("Using Firebase to get chat history for user %s, session %s", user_id, session_id)
+            chat_history = yield flows.ChatHistoryQuery(user_id, session_id)
+            # Include messages still waiting in the write-behind buffer
+            chat_history = chat_writes.writer.merge(chat_history, user_id, session_id)
             
             # Sort by timestamp
             chat_history.sort(key=lambda x: x.get('timestamp', ''))
-            
-            # Limit to context window
-            if len(chat_history) > context_window:
-                chat_history = chat_history[-context_window:]
         except Exception as e:
-            print(f"Error in chat history retrieval: {str(e)}")
+            logger.error("Error in chat history retrieval: %s", e)
             chat_history = []
         
-        # Format chat history for AI context
-        conversation_context = ""
-        if chat_history and len(chat_history) > 1:  # If there's more than just the current message
-            conversation_context = "Previous conversation:\n"
-            for entry in chat_history[:-1]:  # Exclude the current message which we just saved
-                role = "किसान" if entry.get('sender') == "user" else "AI किसान"
-                conversation_context += f"{role}: {entry.get('message', '')}\n"
+        # Older turns come from the session's running summary; only messages after it
+        # are sent, the last context_window of them verbatim (the current message,
+        # which we just saved, is excluded)
+        session_context = yield flows.Blocking(chat_summary.summarizer.context, user_id, session_id, chat_history[:-1])
+        history = prompts.build_history(session_context['messages'], summary=session_context['summary'],
+                                        max_messages=max(context_window - 1, 0))
+        conversation_context = history['text']
         
         # If Gemini API key is available, use AI for chat
         if GEMINI_API_KEY:
             try:
                 # Define the system prompt for farming assistant
-                system_prompt = """
-                You are AI Kisan, an expert agricultural assistant for farmers in India. 
-                You provide helpful, practical advice on farming practices, crop management, disease identification, 
-                weather interpretations, and market trends. Your responses should be:
-                
-                1. Practical and actionable for farmers
-                2. Based on scientific agricultural knowledge
-                3. Relevant to Indian farming conditions
-                4. Considerate of both traditional and modern farming approaches
-                5. Clear and easy to understand
-                6. ALWAYS IN HINDI LANGUAGE using Devanagari script
-                7. Contextually aware of the ongoing conversation
-                
-                When responding to queries about crop problems, ask for specifics like symptoms, 
-                affected plant parts, and growth stage. For weather-related queries, explain implications 
-                for farming activities. Always suggest sustainable practices when appropriate.
-                
-                IMPORTANT: Reference previous messages in the conversation to maintain context.
-                If the farmer is asking follow-up questions, make sure to connect your answer to previous exchanges.
-                REMEMBER: You MUST respond in Hindi language. Your users are rural Indian farmers who primarily speak Hindi.
-                Even if the question is in English, always respond in Hindi.
-                """
+                system_prompt = prompts.CHAT_SYSTEM.render()
                 
                 # Use the latest available Gemini model
                 try:
@@ -631,45 +711,38 @@ def chat():
                         "max_output_tokens": 1024,  # Increased token limit for more comprehensive answers
                     }
                     
-                    # Construct a clear prompt for Hindi responses with context
-                    improved_prompt = f"""
-                    {system_prompt}
-                    
-                    {conversation_context}
-                    
-                    किसान का वर्तमान प्रश्न: {user_message}
-                    
-                    कृपया हिंदी में विस्तृत और संदर्भ के अनुसार मददगार उत्तर दें:
-                    """
                     
                     # Use one of the available Gemini models - gemini-1.5-pro-latest
                     model = genai.GenerativeModel('models/gemini-1.5-pro-latest')
                     
-                    # Try detecting and incorporating user context (field info, previous interactions)
-                    try:
-                        # If the message mentions crops or fields, try to augment with user's field data
-                        field_data = None
-                        if any(keyword in user_message.lower() for keyword in ['field', 'crop', 'farm', 'खेत', 'फसल']):
-                            # Try to get the user's field data if they're a registered user
-                            if user_id.isdigit():
-                                fields = Field.query.filter_by(user_id=int(user_id)).all()
-                                if fields:
-                                    field_data = "\nउपयोगकर्ता के खेत की जानकारी:\n"
-                                    for field in fields:
-                                        field_data += f"- नाम: {field.name}, स्थान: {field.location or 'अज्ञात'}, फसल: {field.crop_type or 'अज्ञात'}, मिट्टी: {field.soil_type or 'अज्ञात'}\n"
-                        
-                        # Add field data to prompt if available
-                        if field_data:
-                            improved_prompt += f"\n{field_data}"
-                    except Exception as context_error:
-                        print(f"Error adding field context: {str(context_error)}")
+                    # If the message mentions crops or fields, augment with the user's
+                    # pre-rendered field profile (one cache hit per turn)
+                    field_data = (yield flows.Blocking(field_context.cache.get, user_id)) if message_match['field_context'] else None
                     
-                    response = model.generate_content(improved_prompt)
+                    # Construct a clear prompt for Hindi responses with context
+                    improved_prompt = prompts.CHAT.render(
+                        system=system_prompt,
+                        conversation=conversation_context,
+                        message=user_message,
+                        field_context=field_data
+                    )
                     
-                    if response and response.text:
-                        ai_response = response.text
-                        print("Successfully generated Gemini response")
-                        
+                    # Paraphrased first questions reuse an earlier answer
+                    cacheable = chat_cache.is_context_free(conversation_context, field_data)
+                    cached = (yield flows.Blocking(chat_cache.cache.lookup, user_message, context_data['intents'])) if cacheable else None
+                    if cached:
+                        ai_response = cached['answer']
+                        logger.debug("Chat answer served from semantic cache (%s, %s)",
+                                     cached['match'], cached['similarity'])
+                    else:
+                        response = yield flows.Generate(model, improved_prompt)
+                        ai_response = response.text if response and response.text else None
+                        if ai_response:
+                            logger.debug("Successfully generated Gemini response")
+                            if cacheable:
+                                yield flows.Blocking(chat_cache.cache.store, user_message, context_data['intents'], ai_response)
+                    
+                    if ai_response:
                         # Save AI response to chat history using Firebase model
                         try:
                             # Create new chat message document in Firebase
@@ -682,27 +755,29 @@ def chat():
                                 'context_data': context_data
                             }
                             
-                            # Use Firebase model
-                            ChatHistory.create(ai_chat_data)
-                            print(f"Saved AI response to Firebase for user {user_id}")
+                            # Buffered write-behind
+                            yield flows.Blocking(chat_writes.writer.append, ai_chat_data)
+                            logger.debug("Queued AI response for Firebase for user %s", user_id)
                         except Exception as e:
-                            print(f"Error saving AI response: {str(e)}")
+                            logger.error("Error saving AI response: %s", e)
                             # Continue anyway - the response is still valid even if we couldn't save it
                         
-                        return jsonify({'reply': ai_response})
+                        return {'reply': ai_response}, 200
                     else:
-                        print("No valid response from Gemini model")
-                        return jsonify({'reply': default_response})
+                        logger.debug("No valid response from Gemini model")
+                        return {'reply': default_response}, 200
                         
                 except Exception as inner_e:
-                    print(f"Error with primary model generation: {str(inner_e)}")
+                    logger.warning("Error with primary model generation: %s", inner_e)
                     # Try a different model as fallback
                     try:
                         # Try gemini-1.5-flash model as fallback
                         fallback_model = genai.GenerativeModel('models/gemini-1.5-flash-latest')
-                        response = fallback_model.generate_content(
-                            f"{system_prompt}\n\n{conversation_context}\n\nFarmer's current question: {user_message}\n\nYour expert response in Hindi:",
-                            generation_config={"temperature": 0.7, "max_output_tokens": 800}
+                        response = yield flows.Generate(
+                            fallback_model,
+                            prompts.CHAT_FALLBACK.render(system=system_prompt, conversation=conversation_context,
+                                                         message=user_message),
+                            {"temperature": 0.7, "max_output_tokens": 800}
                         )
                         
                         if response and response.text:
@@ -720,43 +795,27 @@ def chat():
                                     'context_data': context_data
                                 }
                                 
-                                # Use Firebase model
-                                ChatHistory.create(ai_chat_data)
-                                print(f"Saved fallback AI response to Firebase for user {user_id}")
+                                # Buffered write-behind
+                                yield flows.Blocking(chat_writes.writer.append, ai_chat_data)
+                                logger.debug("Queued fallback AI response for Firebase for user %s", user_id)
                             except Exception as e:
-                                print(f"Error saving fallback AI response: {str(e)}")
+                                logger.error("Error saving fallback AI response: %s", e)
                                 # Continue anyway - the response is still valid even if we couldn't save it
                             
-                            return jsonify({'reply': ai_response})
+                            return {'reply': ai_response}, 200
                         else:
-                            return jsonify({'reply': default_response})
+                            return {'reply': default_response}, 200
                     except Exception as fallback_error:
-                        print(f"Final fallback error: {str(fallback_error)}")
-                        return jsonify({'reply': default_response})
+                        logger.error("Final fallback error: %s", fallback_error)
+                        return {'reply': default_response}, 200
                     
             except Exception as e:
-                print(f"Error calling Gemini API: {str(e)}")
-                return jsonify({'reply': default_response})
+                logger.error("Error calling Gemini API: %s", e)
+                return {'reply': default_response}, 200
         else:
-            print("No Gemini API key available")
+            logger.warning("No Gemini API key available")
             # Creating a hardcoded Hindi response since API key is not available
-            hindi_responses = {
-                "hello": "नमस्ते! मैं आपका AI किसान सहायक हूँ। मैं आपकी कैसे मदद कर सकता हूँ?",
-                "hi": "नमस्ते! आज आप किस प्रकार की कृषि जानकारी के बारे में पूछना चाहेंगे?",
-                "how are you": "मैं एक AI सहायक हूँ और सदैव आपकी सेवा के लिए तैयार हूँ। आपको खेती से संबंधित क्या जानकारी चाहिए?",
-                "help": "मैं फसल चुनाव, रोग निदान, मौसम सलाह, और उर्वरक सिफारिशों जैसे विषयों पर मदद कर सकता हूँ। कृपया विशेष प्रश्न पूछें।",
-                "weather": "आपके क्षेत्र के मौसम की जानकारी के लिए, कृपया अपना स्थान बताएं। मैं वहां के मौसम पूर्वानुमान प्रदान करूंगा।",
-                "crops": "भारत में मुख्य फसलें चावल, गेहूं, मक्का, ज्वार, बाजरा, दालें, तिलहन, गन्ना और कपास हैं। किस फसल के बारे में जानकारी चाहिए?",
-                "fertilizer": "उर्वरक सिफारिशों के लिए, मुझे आपकी फसल, मिट्टी का प्रकार और फसल का चरण बताएं। उचित उर्वरक प्रबंधन फसल उत्पादन में महत्वपूर्ण है।"
-            }
-            
-            # Check if the user message contains any keywords, with case-insensitive matching
-            user_message_lower = user_message.lower()
-            ai_response = default_response
-            for keyword, response in hindi_responses.items():
-                if keyword in user_message_lower:
-                    ai_response = response
-                    break
+            ai_response = HINDI_FALLBACK_RESPONSES.get(message_match['response_key'], default_response)
             
             # Save AI response to chat history using Firebase model
             try:
@@ -770,57 +829,42 @@ def chat():
                     'context_data': context_data
                 }
                 
-                # Use Firebase model
-                ChatHistory.create(ai_chat_data)
-                print(f"Saved default AI response to Firebase for user {user_id}")
+                # Buffered write-behind
+                yield flows.Blocking(chat_writes.writer.append, ai_chat_data)
+                logger.debug("Queued default AI response for Firebase for user %s", user_id)
             except Exception as e:
-                print(f"Error saving default AI response: {str(e)}")
+                logger.error("Error saving default AI response: %s", e)
                 # Continue anyway - the response is still valid even if we couldn't save it
             
-            return jsonify({'reply': ai_response})
+            return {'reply': ai_response}, 200
             
     except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
-        return jsonify({'error': 'Failed to process chat message'}), 500
+        logger.error("Error in chat endpoint: %s", e)
+        return {'error': 'Failed to process chat message'}, 500
+
 
+def summarize_chat(prompt):
+    """Model call behind the rolling chat summaries (run by the summary worker)"""
+    if not GEMINI_API_KEY:
+        return None
+    model = genai.GenerativeModel('models/gemini-1.5-flash-latest')
+    response = model.generate_content(prompt, generation_config={"temperature": 0.2, "max_output_tokens": 512})
+    return response.text if response and response.text else None
 
-def detect_chat_intent(message):
+
+
+def detect_chat_intent(message, match=None):
     """
     Detect the user's intent from chat message to provide better context-aware responses
     """
-    message_lower = message.lower()
-    
-    # Define intent categories with keywords (both English and Hindi)
-    intent_keywords = {
-        'greeting': ['hello', 'hi', 'hey', 'नमस्ते', 'नमस्कार', 'प्रणाम'],
-        'weather': ['weather', 'rain', 'temperature', 'forecast', 'climate', 'मौसम', 'बारिश', 'तापमान'],
-        'crop_info': ['crop', 'plant', 'cultivation', 'grow', 'फसल', 'बीज', 'खेती', 'उगाना'],
-        'disease': ['disease', 'pest', 'infection', 'रोग', 'कीट', 'संक्रमण', 'बीमारी'],
-        'fertilizer': ['fertilizer', 'manure', 'nutrition', 'उर्वरक', 'खाद'],
-        'market': ['price', 'market', 'sell', 'buy', 'बाजार', 'मूल्य', 'कीमत', 'बेचना', 'खरीदना'],
-        'irrigation': ['water', 'irrigation', 'moisture', 'पानी', 'सिंचाई', 'नमी'],
-        'farming_tech': ['technology', 'machine', 'equipment', 'तकनीक', 'मशीन', 'उपकरण'],
-        'help': ['help', 'support', 'मदद', 'सहायता']
-    }
-    
-    # Extract the top 3 likely intents
-    intents = []
-    for intent, keywords in intent_keywords.items():
-        for keyword in keywords:
-            if keyword in message_lower:
-                intents.append(intent)
-                break
-    
-    # If no specific intent is found, classify as 'general_query'
-    if not intents:
-        intents.append('general_query')
+    match = match or chat_matcher.classify(message)
     
     # Return metadata with identified intents and original message properties
     return {
-        'intents': intents[:3],  # Top 3 intents max
+        'intents': match['intents'][:3],  # Top 3 intents max
         'message_length': len(message),
         'timestamp': datetime.utcnow().isoformat(),
-        'contains_question': '?' in message or 'क्या' in message_lower or 'कौन' in message_lower or 'कब' in message_lower
+        'contains_question': match['contains_question']
     }
 
 
@@ -833,7 +877,7 @@ def get_chat_history():
     
     # Get chat history using Firebase models
     try:
-        print(f"Using Firebase to get chat history for user {user_id}, session {session_id}")
+        logger.debug("Using Firebase to get chat history for user %s, session %s", user_id, session_id)
         
         if session_id:
             # Get history for a specific session
@@ -841,6 +885,7 @@ def get_chat_history():
         else:
             # Get all history for the user
             chat_history = ChatHistory.get_by_user_id(user_id)
+        chat_history = chat_writes.writer.merge(chat_history, user_id, session_id)
         
         # Process the records
         if chat_history:
@@ -851,6 +896,12 @@ def get_chat_history():
             if len(chat_history) > limit:
                 # Get most recent messages
                 chat_history = chat_history[-limit:]
+            
+            # Older messages were stored without intents; classify them in one batch
+            untagged = [entry for entry in chat_history
+                        if entry.get('sender') == 'user' and not (entry.get('context_data') or {}).get('intents')]
+            for entry, match in zip(untagged, chat_matcher.classify_many(item.get('message', '') for item in untagged)):
+                entry['context_data'] = dict(entry.get('context_data') or {}, intents=match['intents'][:3])
                 
             # Format the response
             return jsonify({
@@ -865,12 +916,37 @@ def get_chat_history():
                 } for entry in chat_history]
             })
     except Exception as e:
-        print(f"Firebase chat history error: {e}")
+        logger.error("Firebase chat history error: %s", e)
         
     # Return empty history on error
     return jsonify({'history': []})
 
 
+@app.route('/api/chat_history/intents', methods=['GET'])
+def get_chat_intent_summary():
+    """Intent counts over a user's stored questions, optionally for one session"""
+    user_id = request.args.get('user_id', 'anonymous')
+    session_id = request.args.get('session_id')
+    
+    try:
+        if session_id:
+            chat_history = ChatHistory.get_by_user_and_session(user_id, session_id)
+        else:
+            chat_history = ChatHistory.get_by_user_id(user_id)
+        chat_history = chat_writes.writer.merge(chat_history, user_id, session_id)
+    except Exception as e:
+        logger.error("Firebase chat history error: %s", e)
+        return jsonify({'error': 'Failed to load chat history'}), 500
+    
+    questions = [entry.get('message', '') for entry in chat_history if entry.get('sender') == 'user']
+    return jsonify({
+        'user_id': user_id,
+        'session_id': session_id,
+        'messages': len(questions),
+        'intents': chat_matcher.intent_counts(questions)
+    })
+
+
 @app.route('/api/chat_sessions', methods=['GET'])
 def get_chat_sessions():
     """Get unique chat sessions for a user"""
@@ -878,10 +954,10 @@ def get_chat_sessions():
     
     # Get chat sessions using Firebase models
     try:
-        print(f"Using Firebase to get chat sessions for user {user_id}")
+        logger.debug("Using Firebase to get chat sessions for user %s", user_id)
         
-        # Get sessions directly from ChatHistory model
-        sessions = ChatHistory.get_sessions(user_id)
+        # Get sessions from ChatHistory, plus messages still waiting to be flushed
+        sessions = chat_writes.writer.merge_sessions(ChatHistory.get_sessions(user_id), user_id)
         
         # If sessions were found, format and return them
         if sessions:
@@ -910,7 +986,7 @@ def get_chat_sessions():
             
             return jsonify({'sessions': result})
     except Exception as e:
-        print(f"Firebase chat sessions error: {e}")
+        logger.error("Firebase chat sessions error: %s", e)
     
     # Return empty sessions on error
     return jsonify({'sessions': []})
@@ -945,21 +1021,27 @@ def get_weather():
             # Sort by date
             recent_forecasts.sort(key=lambda x: x.get('forecast_date', ''))
             
-            return jsonify({
-                'location': location,
-                'forecasts': [{
-                    'date': datetime.fromisoformat(f.get('forecast_date', '')).strftime('%Y-%m-%d') \
-                        if f.get('forecast_date', '') else '',
-                    'temp_min': f.get('temperature_min', 0),
-                    'temp_max': f.get('temperature_max', 0),
-                    'humidity': f.get('humidity', 0),
-                    'precipitation': f.get('precipitation', 0),
-                    'wind_speed': f.get('wind_speed', 0),
-                    'description': f.get('weather_description', '')
-                } for f in recent_forecasts]
-            })
+            # Forecast versions identify the payload, so unchanged polls get a 304
+            return http_cache.conditional_json(
+                ['weather', location] + [(f.get('forecast_date'), f.get('updated_at')) for f in recent_forecasts],
+                lambda: {
+                    'location': location,
+                    'forecasts': [{
+                        'date': datetime.fromisoformat(f.get('forecast_date', '')).strftime('%Y-%m-%d') \
+                            if f.get('forecast_date', '') else '',
+                        'temp_min': f.get('temperature_min', 0),
+                        'temp_max': f.get('temperature_max', 0),
+                        'humidity': f.get('humidity', 0),
+                        'precipitation': f.get('precipitation', 0),
+                        'wind_speed': f.get('wind_speed', 0),
+                        'description': f.get('weather_description', '')
+                    } for f in recent_forecasts]
+                },
+                last_modified=http_cache.latest_timestamp(f.get('updated_at') for f in recent_forecasts),
+                cache_body=True
+            )
     except Exception as e:
-        print(f"Error fetching weather from Firebase: {str(e)}")
+        logger.error("Error fetching weather from Firebase: %s", e)
     
     # Otherwise, generate location-specific weather data
     try:
@@ -1013,6 +1095,7 @@ def get_weather():
             })
         
         # Save new forecasts to Firebase
+        updated_at = datetime.utcnow().isoformat()
         try:
             # First, try to delete the old forecasts
             WeatherForecast.delete_by_location(location)
@@ -1031,142 +1114,98 @@ def get_weather():
                     'precipitation': forecast['precipitation'],
                     'wind_speed': forecast['wind_speed'],
                     'weather_description': forecast['description'],
-                    'updated_at': datetime.utcnow().isoformat()
+                    'updated_at': updated_at
                 }
                 
                 WeatherForecast.create(forecast_data)
             
-            print(f"Successfully stored weather forecasts for {location} in Firebase")
+            logger.debug("Successfully stored weather forecasts for %s in Firebase", location)
         except Exception as save_error:
-            print(f"Error saving weather forecasts to Firebase: {str(save_error)}")
+            logger.error("Error saving weather forecasts to Firebase: %s", save_error)
         
-        return jsonify({
-            'location': location,
-            'forecasts': forecasts_data
-        })
+        # Same version parts as the cached path so the next poll can revalidate
+        return http_cache.conditional_json(
+            ['weather', location] + [(datetime.strptime(f['date'], '%Y-%m-%d').isoformat(), updated_at)
+                                     for f in forecasts_data],
+            lambda: {
+                'location': location,
+                'forecasts': forecasts_data
+            },
+            last_modified=updated_at,
+            cache_body=True
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/market_prices', methods=['GET'])
 def get_market_prices():
-    """Get market prices for crops"""
+    """Get the latest market price snapshot for crops"""
     crop_type = request.args.get('crop_type')
-    results = []
+    snapshots = []
     
-    # Try to get prices from Firebase
+    # Prices are ingested by the background refresher; this is a cheap read
     try:
-        # Get latest market prices, optionally filtered by crop type
-        if crop_type:
-            prices = MarketPrice.get_by_crop_type(crop_type)
-        else:
-            prices = MarketPrice.get_latest()
-            
-        if prices:
-            # Format the results for API response
-            for price in prices:
+        snapshots = market_refresher.refresher.latest(crop_type)
+    except Exception as e:
+        logger.error("Error reading market price snapshots from Firebase: %s", e)
+    
+    # Nothing ingested yet (cold start or a new crop): refresh in the background
+    if not snapshots:
+        market_refresher.refresher.request_refresh(crop_type)
+    
+    def build_response():
+        results = []
+        for snapshot in snapshots:
+            date = snapshot.get('date', '')
+            for price in snapshot.get('prices', []):
                 results.append({
-                    'crop_type': price.get('crop_type', ''),
+                    'crop_type': snapshot.get('crop_type', ''),
                     'market_name': price.get('market_name', ''),
                     'price': price.get('price', 0),
                     'min_price': price.get('min_price', 0),
                     'max_price': price.get('max_price', 0),
-                    'date': datetime.fromisoformat(price.get('date', '')).strftime('%Y-%m-%d') if price.get('date', '') else '',
-                    'source': price.get('source', '')
+                    'date': date,
+                    'source': snapshot.get('source', '')
                 })
-    except Exception as e:
-        print(f"Error fetching market prices from Firebase: {str(e)}")
-    
-    # If no data in Firebase or there was an error, generate new data
-    if not results:
-        # Generate market price data
-        supported_crops = [
-            'Rice', 'Wheat', 'Cotton', 'Sugarcane', 'Maize', 
-            'Soybean', 'Potato', 'Tomato', 'Chickpea', 'Mustard',
-            'Groundnut', 'Chilli', 'Onion', 'Turmeric', 'Ginger',
-            'Millet', 'Barley', 'Jute', 'Sunflower'
-        ]
         
-        markets = ['Delhi', 'Mumbai', 'Kolkata', 'Chennai', 'Lucknow', 'Bangalore', 'Hyderabad']
-        
-        # Generate data based on crop types
-        crops_to_process = [crop_type] if crop_type else supported_crops
-        
-        # Use realistic base prices for different crops (in ₹ per quintal)
-        base_prices = {
-            'Rice': 2200,
-            'Wheat': 2000,
-            'Cotton': 6000,
-            'Sugarcane': 300,
-            'Maize': 1800,
-            'Soybean': 4000,
-            'Potato': 1500,
-            'Tomato': 2000,
-            'Chickpea': 5000,
-            'Mustard': 5500,
-            'Groundnut': 5800,
-            'Chilli': 8000,
-            'Onion': 1200,
-            'Turmeric': 7500,
-            'Ginger': 6500,
-            'Millet': 2800,
-            'Barley': 2200,
-            'Jute': 4500,
-            'Sunflower': 5600
-        }
+        # Staleness is reported for the oldest snapshot in the response
+        oldest = min(snapshots, key=lambda snap: snap.get('generated_at', '')) if snapshots else None
         
-        try:
-            # Add realistic variation
-            import random
-            
-            for crop in crops_to_process:
-                base_price = base_prices.get(crop, 2000)
-                variation_pct = random.uniform(-0.1, 0.1)
-                
-                for market in markets:
-                    # Add market-specific variation
-                    market_variation = random.uniform(-0.05, 0.05)
-                    final_price = base_price * (1 + variation_pct + market_variation)
-                    final_price = round(final_price, 0)
-                    
-                    min_price = round(final_price * 0.95, 0)
-                    max_price = round(final_price * 1.1, 0)
-                    
-                    # Create price data dictionary
-                    price_data = {
-                        'crop_type': crop,
-                        'market_name': market,
-                        'price': final_price,
-                        'min_price': min_price,
-                        'max_price': max_price,
-                        'date': datetime.utcnow().isoformat(),
-                        'source': 'Generated Data'
-                    }
-                    
-                    # Save to Firebase for future use
-                    try:
-                        MarketPrice.create(price_data)
-                    except Exception as save_error:
-                        print(f"Error saving market price to Firebase: {str(save_error)}")
-                    
-                    # Add to results
-                    results.append({
-                        'crop_type': crop,
-                        'market_name': market,
-                        'price': final_price,
-                        'min_price': min_price,
-                        'max_price': max_price,
-                        'date': datetime.utcnow().strftime('%Y-%m-%d'),
-                        'source': 'Generated Data'
-                    })
-        except Exception as e:
-            print(f"Error generating market prices: {str(e)}")
+        # Return results in the expected format for the frontend
+        # Frontend expects: { prices: [...] }
+        return {
+            'prices': results,
+            'snapshot': market_refresher.snapshot_staleness(oldest)
+        }
     
-    # Return results in the expected format for the frontend
-    # Frontend expects: { prices: [...] }
-    return jsonify({
-        'prices': results
-    })
+    # Snapshot versions identify the payload, so unchanged polls get a 304
+    return http_cache.conditional_json(
+        ['market_prices', crop_type] + [(snap.get('id'), snap.get('version')) for snap in snapshots],
+        build_response,
+        last_modified=http_cache.latest_timestamp(snap.get('generated_at') for snap in snapshots)
+    )
+
+@app.route('/api/market_prices/stats', methods=['GET'])
+def get_market_price_stats():
+    """Get aggregated market price statistics and rolling trends"""
+    crop_type = request.args.get('crop_type')
+    window = request.args.get('window', 7, type=int)
+    
+    if not window or window < 1 or window > market_stats.MAX_WINDOW_DAYS:
+        return jsonify({'error': f'window must be between 1 and {market_stats.MAX_WINDOW_DAYS} days'}), 400
+    
+    try:
+        group_by = market_stats.parse_group_by(request.args.get('group_by', 'crop'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        stats = market_stats.get_market_stats(window, group_by, crop_type)
+        return jsonify(stats)
+    except Exception as e:
+        logger.error("Error aggregating market prices: %s", e)
+        return jsonify({'error': f'Failed to aggregate market prices: {str(e)}'}), 500
 
 @app.route('/api/disease_detect', methods=['POST'])
 def detect_disease():
@@ -1181,138 +1220,261 @@ def detect_disease():
         field_id = data.get('field_id')
         user_id = data.get('user_id')
         
-        print(f"Using pre-uploaded image: {image_path}")
+        logger.debug("Using pre-uploaded image: %s", image_path)
         
-        if not os.path.exists(image_path):
+        # Accepts a storage key (ab/cd/<sha256>) or a path under uploads/
+        local_path = upload_storage.resolve_local_path(image_path)
+        if not local_path:
             return jsonify({'error': f'Image file not found at path: {image_path}'}), 400
-    
-    elif 'image' in request.files:
-        # Direct image upload
-        image = request.files['image']
-        crop_type = request.form.get('crop_type', 'unknown')
-        field_id = request.form.get('field_id')
-        user_id = request.form.get('user_id')
-        
-        if not image.filename:
-            return jsonify({'error': 'Empty image file'}), 400
-            
-        # Save the image to a temporary location
-        image_path = f"uploads/{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{image.filename}"
-        os.makedirs('uploads', exist_ok=True)
-        image.save(image_path)
+        image_path = local_path
+    
+    elif 'image' in request.files or (request.mimetype or '').startswith('image/'):
+        if 'image' in request.files:
+            # Multipart upload
+            image = request.files['image']
+            stream, filename = image.stream, image.filename
+            crop_type = request.form.get('crop_type', 'unknown')
+            field_id = request.form.get('field_id')
+            user_id = request.form.get('user_id')
+            
+            if not image.filename:
+                return jsonify({'error': 'Empty image file'}), 400
+        else:
+            # Raw image body, streamed straight from the socket without form parsing
+            stream, filename = request.stream, None
+            crop_type = request.args.get('crop_type', 'unknown')
+            field_id = request.args.get('field_id')
+            user_id = request.args.get('user_id')
         
-        print(f"Image uploaded and saved to: {image_path}")
+        # Stream to content-addressed storage; identical uploads are stored once
+        try:
+            stored = upload_storage.get_storage().save_stream(stream, filename)
+        except upload_storage.UploadTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        image_path = stored['path']
+        if not stored['deduplicated']:
+            thumbnails.schedule(image_path)
+        
+        logger.debug("Image uploaded and saved to: %s%s", image_path,
+                     ' (already stored)' if stored['deduplicated'] else '')
     
     else:
         # No image provided
         return jsonify({'error': 'No image provided. Send either an image file or an image_path.'}), 400
     
+    # Job mode: accept the upload now and run inference on the worker pool
+    if _wants_async(data):
+        try:
+            job = detection_jobs.queue.submit(
+                {'image_path': image_path, 'crop_type': crop_type, 'field_id': field_id, 'user_id': user_id},
+                user_id=user_id,
+                callback_url=(data or request.form).get('callback_url')
+            )
+        except detection_jobs.QueueFull as e:
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, e.status
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify({
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/api/disease_detect/jobs/{job['id']}",
+            'events_url': f"/api/disease_detect/jobs/{job['id']}/events"
+        })
+        response.headers['Location'] = f"/api/disease_detect/jobs/{job['id']}"
+        return response, 202
+    
+    result, status = run_disease_detection(image_path, crop_type, field_id, user_id)
+    return jsonify(result), status
+
+def _wants_async(data):
+    """Job mode is requested with ?mode=async, an async form/JSON flag or Prefer: respond-async"""
+    flag = request.args.get('mode') or (data or request.form).get('mode')
+    if flag == 'async' or str((data or request.form).get('async', '')).lower() in ('1', 'true'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+# Returned when the model's answer does not contain a diagnosis
+UNKNOWN_DETECTION = {'disease_name': "Unknown Disease", 'confidence': 0.0, 'symptoms': "", 'treatment': "",
+                     'disease_code': 'unknown'}
+
+_vision_model = None
+_vision_model_lock = threading.Lock()
+
+def get_vision_model():
+    """Select and build the Gemini vision model once, then reuse it for every image"""
+    global _vision_model
+    with _vision_model_lock:
+        if _vision_model is not None:
+            return _vision_model
+        
+        model = None
+        try:
+            # Try to use the newer multimodal model first
+            model = genai.GenerativeModel('gemini-1.5-pro')
+            logger.debug("Using gemini-1.5-pro for disease detection")
+        except:
+            # Fallback model selection logic
+            vision_model = None
+            for m in genai.list_models():
+                if 'gemini' in m.name and 'vision' in m.name and 'generateContent' in m.supported_generation_methods:
+                    vision_model = m.name.replace('models/', '')
+                    logger.debug("Using fallback vision model: %s", vision_model)
+                    model = genai.GenerativeModel(vision_model)
+                    break
+            
+            if not vision_model:
+                for m in genai.list_models():
+                    if 'gemini' in m.name and 'generateContent' in m.supported_generation_methods:
+                        model_name = m.name.replace('models/', '')
+                        logger.debug("Using general model: %s", model_name)
+                        model = genai.GenerativeModel(model_name)
+                        break
+        
+        _vision_model = model
+        return model
+
+def analyze_prepared_image(prepared, crop_type):
+    """
+    Diagnose a preprocessed image with Gemini, reusing cached results.
+    
+    Returns (detection or None, image_stats).
+    """
+    image_stats = prepared['stats']
+    
+    # Re-uploads of the same (or a near-identical) photo reuse the earlier result
+    cache_hit = detection_cache.cache.lookup(prepared['data'], crop_type, prepared['dhash'])
+    if cache_hit:
+        detection, match_type = cache_hit
+        image_stats['cache'] = match_type
+        logger.debug("Disease detection served from cache (%s)", match_type)
+        return detection, image_stats
+    
+    # Confident local answers skip the Gemini call; the rest are escalated
+    local = None
+    if local_classifier.classifier.covers(crop_type):
+        try:
+            local = local_classifier.classifier.predict(prepared['data'], crop_type)
+        except Exception as e:
+            logger.error("Local disease classifier error: %s", e)
+    if local:
+        image_stats['local_classifier'] = {key: local.get(key) for key in
+                                           ('confident', 'agreement', 'similarity', 'elapsed_ms')}
+        if local['confident']:
+            logger.debug("Disease detection answered locally in %s ms", local['elapsed_ms'])
+            return local['detection'], image_stats
+    
+    # For gemini-1.5-pro and newer models
+    # Format the content specifically for image analysis
+    inference_started = time.perf_counter()
+    response = get_vision_model().generate_content(
+        contents=[
+            {
+                "role": "user",
+                "parts": [
+                    {"text": prompts.DISEASE_ANALYSIS.render()},
+                    {"inline_data": {"mime_type": prepared['mime_type'], "data": prepared['data']}},
+                    {"text": prompts.DISEASE_IMAGE_CONTEXT.render(crop_type=crop_type)}
+                ]
+            }
+        ],
+        # JSON constrained by a schema, validated in one pass by disease_analysis
+        generation_config=disease_analysis.GENERATION_CONFIG
+    )
+    image_stats['inference_ms'] = round((time.perf_counter() - inference_started) * 1000, 1)
+    logger.debug("Disease image %s -> %s bytes (%s%% saved), preprocess %s ms, Gemini %s ms",
+                 image_stats['original_bytes'], image_stats['processed_bytes'], image_stats['saved_pct'],
+                 image_stats['preprocess_ms'], image_stats['inference_ms'])
+    
+    detection = disease_analysis.parse_analysis(response.text)
+    if detection:
+        # Only cache answers that parsed into a diagnosis
+        detection_cache.cache.store(prepared['data'], crop_type, detection, prepared['dhash'])
+        if local:
+            # Gemini's answer becomes a training example for the local stage
+            local_classifier.classifier.learn(local['features'], crop_type, detection)
+    return detection, image_stats
+
+def fallback_disease_detection(crop_type, image_path):
+    """Detection used when no Gemini API key is configured"""
+    # Prefer the local classifier's best guess when it has examples for this crop
+    try:
+        local = local_classifier.classifier.predict(image_path, crop_type)
+        if local and local['detection']:
+            return local['detection']
+    except Exception as e:
+        logger.error("Local disease classifier error: %s", e)
+    
+    # This is a simple simulation - in a real app without AI, you would
+    # use computer vision or other detection methods
+    common_diseases = {
+        "rice": ["Rice Blast", "Brown Spot", "Bacterial Leaf Blight"],
+        "wheat": ["Wheat Rust", "Powdery Mildew", "Septoria Leaf Spot"],
+        "cotton": ["Cotton Boll Rot", "Verticillium Wilt", "Target Spot"],
+        "tomato": ["Early Blight", "Late Blight", "Leaf Mold"],
+        "potato": ["Late Blight", "Early Blight", "Black Scurf"]
+    }
+    
+    crop = crop_type.lower()
+    if crop in common_diseases:
+        disease_index = hash(image_path) % len(common_diseases[crop])
+        disease_name = common_diseases[crop][disease_index]
+        return {
+            'disease_name': disease_name,
+            'confidence': 0.7,  # Moderate confidence
+            'symptoms': f"Visible symptoms include discoloration and lesions typical of {disease_name}.",
+            'treatment': f"Recommended treatment includes fungicide application and improved field drainage. Consult a local agricultural extension for specific treatments for {disease_name}."
+        }
+    return {
+        'disease_name': "Possible Disease Detected",
+        'confidence': 0.5,
+        'symptoms': "Some discoloration and spots visible on leaves.",
+        'treatment': "Recommend consulting with a local agricultural extension for proper diagnosis and treatment."
+    }
+
+def get_report_field(field_id):
+    """Field document a disease report belongs to, if it can be read"""
+    try:
+        return Field.get(field_id)
+    except Exception as e:
+        logger.error("Error reading field %s for disease report: %s", field_id, e)
+        return None
+
+def run_disease_detection(image_path, crop_type, field_id, user_id):
+    """
+    Run detection on a saved image and store the report.
+    
+    Returns (payload, status_code); shared by the synchronous endpoint and the
+    detection job workers.
+    """
     # AI detection logic - using Gemini API if available
-    disease_name = "Unknown Disease"
-    confidence = 0.0
-    symptoms = ""
-    treatment = ""
+    image_stats = None
     
     try:
         if GEMINI_API_KEY:
-            # Use Gemini for image analysis with proper model selection
+            # Upright, downscale and re-encode the photo before uploading it inline
             try:
-                # Try to use the newer multimodal model first
-                model = genai.GenerativeModel('gemini-1.5-pro')
-                print(f"Using gemini-1.5-pro for disease detection")
-            except:
-                # Fallback model selection logic
-                vision_model = None
-                for m in genai.list_models():
-                    if 'gemini' in m.name and 'vision' in m.name and 'generateContent' in m.supported_generation_methods:
-                        vision_model = m.name.replace('models/', '')
-                        print(f"Using fallback vision model: {vision_model}")
-                        model = genai.GenerativeModel(vision_model)
-                        break
-                
-                if not vision_model:
-                    for m in genai.list_models():
-                        if 'gemini' in m.name and 'generateContent' in m.supported_generation_methods:
-                            model_name = m.name.replace('models/', '')
-                            print(f"Using general model: {model_name}")
-                            model = genai.GenerativeModel(model_name)
-                            break
-            
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-            
-            # For gemini-1.5-pro and newer models
-            # Format the content specifically for image analysis
-            response = model.generate_content(
-                contents=[
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": "You are an expert agricultural pathologist. Analyze this crop image and identify any diseases. If you see a disease, provide the following information in a structured format:\n\nDisease name: [Name of the disease]\nConfidence level: [0.7-0.9 depending on your certainty]\nSymptoms: [List the visible symptoms in the image]\nRecommended treatments: [Provide 2-3 specific treatment recommendations]\n\nIf you cannot identify a specific disease with certainty, make your best educated guess based on the visible symptoms. Do not say 'Unknown Disease' or that you cannot identify it."},
-                            {"inline_data": {"mime_type": "image/jpeg", "data": image_data}},
-                            {"text": f"This is a {crop_type} plant. Please analyze it for diseases and provide the information as requested above."}
-                        ]
-                    }
-                ],
-                generation_config={"temperature": 0.2}
-            )
-            
-            # Parse the response
-            analysis = response.text
-            
-            # Simple parsing - in a real app you'd want more robust extraction
-            if "Disease name:" in analysis:
-                disease_name = analysis.split("Disease name:")[1].split("\n")[0].strip()
-                confidence = 0.85  # Default high confidence
-                
-                if "Confidence level:" in analysis:
-                    conf_text = analysis.split("Confidence level:")[1].split("\n")[0].strip()
-                    try:
-                        # Try to extract a decimal confidence
-                        conf_text = conf_text.replace("%", "").strip()
-                        if "/" in conf_text:
-                            num, denom = conf_text.split("/")
-                            confidence = float(num) / float(denom)
-                        else:
-                            confidence = float(conf_text)
-                            if confidence > 1:  # If it's a percentage
-                                confidence /= 100
-                    except:
-                        pass  # Keep default confidence
-                
-                if "Symptoms:" in analysis:
-                    symptoms = analysis.split("Symptoms:")[1].split("Recommended treatments:")[0].strip()
-                    
-                if "Recommended treatments:" in analysis:
-                    treatment = analysis.split("Recommended treatments:")[1].strip()
+                prepared = image_preprocess.preprocess_image(image_path)
+            except ValueError as e:
+                return {'error': str(e)}, 400
+            detection, image_stats = analyze_prepared_image(prepared, crop_type)
+            detection = detection or UNKNOWN_DETECTION
         else:
             # Fallback detection
-            # This is a simple simulation - in a real app without AI, you would
-            # use computer vision or other detection methods
-            common_diseases = {
-                "rice": ["Rice Blast", "Brown Spot", "Bacterial Leaf Blight"],
-                "wheat": ["Wheat Rust", "Powdery Mildew", "Septoria Leaf Spot"],
-                "cotton": ["Cotton Boll Rot", "Verticillium Wilt", "Target Spot"],
-                "tomato": ["Early Blight", "Late Blight", "Leaf Mold"],
-                "potato": ["Late Blight", "Early Blight", "Black Scurf"]
-            }
-            
-            crop = crop_type.lower()
-            if crop in common_diseases:
-                import random
-                disease_index = hash(image_path) % len(common_diseases[crop])
-                disease_name = common_diseases[crop][disease_index]
-                confidence = 0.7  # Moderate confidence
-                symptoms = f"Visible symptoms include discoloration and lesions typical of {disease_name}."
-                treatment = f"Recommended treatment includes fungicide application and improved field drainage. Consult a local agricultural extension for specific treatments for {disease_name}."
-            else:
-                disease_name = "Possible Disease Detected"
-                confidence = 0.5
-                symptoms = "Some discoloration and spots visible on leaves."
-                treatment = "Recommend consulting with a local agricultural extension for proper diagnosis and treatment."
+            detection = fallback_disease_detection(crop_type, image_path)
     
     except Exception as e:
-        return jsonify({'error': f'Disease detection failed: {str(e)}'}), 500
+        return {'error': f'Disease detection failed: {str(e)}'}, 500
+    
+    disease_name = detection['disease_name']
+    disease_code = detection.get('disease_code') or disease_analysis.disease_code(disease_name)
+    confidence = detection['confidence']
+    symptoms = detection['symptoms']
+    treatment = detection['treatment']
     
     # Save to database if user_id and field_id provided
     report = None
@@ -1320,11 +1482,12 @@ def detect_disease():
         try:
             # First try to save to Firebase
             try:
-                print(f"Saving disease report to Firebase for user {user_id}, field {field_id}")
+                logger.debug("Saving disease report to Firebase for user %s, field %s", user_id, field_id)
                 report_data = {
                     'user_id': user_id,
                     'field_id': field_id,
                     'disease_name': disease_name,
+                    'disease_code': disease_code,
                     'confidence_score': confidence,
                     'image_path': image_path,
                     'symptoms': symptoms,
@@ -1332,15 +1495,17 @@ def detect_disease():
                     'status': 'detected',
                     'detection_date': datetime.utcnow().isoformat(),
                 }
+                disease_stats.annotate_report(report_data, crop_type, get_report_field(field_id))
                 
                 # Create report in Firebase
                 firebase_report = DiseaseReport.create(report_data)
                 if firebase_report:
                     report = firebase_report
-                    print("Successfully saved disease report to Firebase")
+                    logger.debug("Successfully saved disease report to Firebase")
+                    disease_stats.record_reports([firebase_report])
             except Exception as firebase_error:
-                print(f"Failed to save disease report to Firebase: {str(firebase_error)}")
-                print("Falling back to PostgreSQL for disease report storage")
+                logger.error("Failed to save disease report to Firebase: %s", firebase_error)
+                logger.warning("Falling back to PostgreSQL for disease report storage")
                 
                 # Fallback to PostgreSQL if Firebase fails
                 from models import DiseaseReport as SQLDiseaseReport
@@ -1357,25 +1522,191 @@ def detect_disease():
                 db.session.add(sql_report)
                 db.session.commit()
                 report = sql_report
-                print("Successfully saved disease report to PostgreSQL")
+                logger.debug("Successfully saved disease report to PostgreSQL")
                 
         except Exception as e:
-            print(f"Failed to save disease report: {str(e)}")
-            return jsonify({'error': f'Failed to save report: {str(e)}'}), 500
+            logger.error("Failed to save disease report: %s", e)
+            return {'error': f'Failed to save report: {str(e)}'}, 500
     
     # Return detection results
     result = {
         'disease_name': disease_name,
+        'disease_code': disease_code,
         'confidence': confidence,
         'symptoms': symptoms,
         'treatment': treatment,
         'image_path': image_path
     }
     
+    if image_stats:
+        result['image_stats'] = image_stats
+    
     if report:
-        result['report_id'] = report.id
+        result['report_id'] = report['id'] if isinstance(report, dict) else report.id
+    
+    return result, 200
+
+@app.route('/api/disease_detect/jobs/<job_id>', methods=['GET'])
+def get_disease_job(job_id):
+    """Poll an asynchronous disease detection job"""
+    job = detection_jobs.queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+@app.route('/api/disease_detect/jobs/<job_id>/events', methods=['GET'])
+def stream_disease_job(job_id):
+    """Server-Sent Events stream of job status changes, closed once the job finishes"""
+    job = detection_jobs.queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events(job):
+        while True:
+            yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            if job['status'] in detection_jobs.TERMINAL_STATES:
+                return
+            seen = job['updated_at']
+            # Comment lines keep proxies from closing an idle stream
+            while job and job['updated_at'] == seen:
+                job = detection_jobs.queue.wait_for_change(job_id, seen, timeout=15)
+                if job and job['updated_at'] == seen:
+                    yield ": keep-alive\n\n"
+            if not job:
+                return
+    
+    return Response(stream_with_context(events(job)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Limits for /api/disease_detect/batch
+DISEASE_BATCH_MAX_IMAGES = int(os.environ.get('DISEASE_BATCH_MAX_IMAGES', '30'))
+DISEASE_BATCH_CONCURRENCY = int(os.environ.get('DISEASE_BATCH_CONCURRENCY', '4'))
+
+def summarize_field_detections(detections):
+    """Aggregate per-image detections into a per-field disease summary"""
+    by_disease = {}
+    for detection in detections:
+        entry = by_disease.setdefault(detection['disease_name'], {'count': 0, 'confidences': []})
+        entry['count'] += 1
+        entry['confidences'].append(detection['confidence'] or 0.0)
+    
+    diseases = [
+        {
+            'disease_name': name,
+            'count': entry['count'],
+            'share': round(entry['count'] / len(detections), 3),
+            'mean_confidence': round(sum(entry['confidences']) / entry['count'], 3),
+            'max_confidence': round(max(entry['confidences']), 3)
+        }
+        for name, entry in by_disease.items()
+    ]
+    diseases.sort(key=lambda d: (d['count'], d['mean_confidence']), reverse=True)
     
-    return jsonify(result)
+    return {
+        'images_analyzed': len(detections),
+        'primary_disease': diseases[0]['disease_name'] if diseases else None,
+        'diseases': diseases
+    }
+
+@app.route('/api/disease_detect/batch', methods=['POST'])
+def detect_disease_batch():
+    """
+    Detect diseases in several photos of one field.
+    
+    Multipart form: images (repeated), crop_type, field_id, user_id. Images are
+    preprocessed in a process pool, analyzed with bounded concurrency, summarized
+    per field and their reports written in one batched commit.
+    """
+    images = [image for image in request.files.getlist('images') if image.filename]
+    crop_type = request.form.get('crop_type', 'unknown')
+    field_id = request.form.get('field_id')
+    user_id = request.form.get('user_id')
+    
+    if not images:
+        return jsonify({'error': 'No images provided. Send one or more files as "images".'}), 400
+    if len(images) > DISEASE_BATCH_MAX_IMAGES:
+        return jsonify({'error': f'Too many images (max {DISEASE_BATCH_MAX_IMAGES} per batch)'}), 400
+    
+    # Stream every upload to content-addressed storage first
+    storage = upload_storage.get_storage()
+    image_paths = []
+    for image in images:
+        try:
+            stored = storage.save_stream(image.stream, image.filename)
+            image_paths.append(stored['path'])
+            if not stored['deduplicated']:
+                thumbnails.schedule(stored['path'])
+        except upload_storage.UploadTooLarge as e:
+            return jsonify({'error': f'{image.filename}: {str(e)}'}), 413
+        except ValueError as e:
+            return jsonify({'error': f'{image.filename}: {str(e)}'}), 400
+    
+    started = time.perf_counter()
+    results = [{'image_path': path, 'filename': image.filename} for path, image in zip(image_paths, images)]
+    
+    def analyze(index, prepared):
+        try:
+            detection, image_stats = analyze_prepared_image(prepared, crop_type)
+            return index, detection or UNKNOWN_DETECTION, image_stats, None
+        except Exception as e:
+            return index, None, prepared.get('stats'), f'Disease detection failed: {str(e)}'
+    
+    if GEMINI_API_KEY:
+        prepared_images = image_preprocess.preprocess_many(image_paths)
+        with ThreadPoolExecutor(max_workers=DISEASE_BATCH_CONCURRENCY) as executor:
+            futures = []
+            for index, prepared in enumerate(prepared_images):
+                if 'error' in prepared:
+                    results[index]['error'] = prepared['error']
+                else:
+                    futures.append(executor.submit(analyze, index, prepared))
+            for future in futures:
+                index, detection, image_stats, error = future.result()
+                results[index]['image_stats'] = image_stats
+                if error:
+                    results[index]['error'] = error
+                else:
+                    results[index].update(detection)
+    else:
+        for result in results:
+            result.update(fallback_disease_detection(crop_type, result['image_path']))
+    
+    detections = [result for result in results if 'error' not in result]
+    
+    # One batched commit for all reports instead of a write per photo
+    if user_id and field_id and detections:
+        detection_date = datetime.utcnow().isoformat()
+        reports = [{
+            'user_id': user_id,
+            'field_id': field_id,
+            'disease_name': result['disease_name'],
+            'disease_code': result.get('disease_code') or disease_analysis.disease_code(result['disease_name']),
+            'confidence_score': result['confidence'],
+            'image_path': result['image_path'],
+            'symptoms': result['symptoms'],
+            'treatment_recommendations': result['treatment'],
+            'status': 'detected',
+            'detection_date': detection_date,
+        } for result in detections]
+        field = get_report_field(field_id)
+        for report in reports:
+            disease_stats.annotate_report(report, crop_type, field)
+        try:
+            DiseaseReport.create_many(reports)
+        except Exception as e:
+            logger.error("Failed to save batch disease reports: %s", e)
+            return jsonify({'error': f'Failed to save reports: {str(e)}'}), 500
+        disease_stats.record_reports(reports)
+        for result, report in zip(detections, reports):
+            result['report_id'] = report['id']
+    
+    summary = summarize_field_detections(detections)
+    summary['images_failed'] = len(results) - len(detections)
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.debug("Batch disease detection for field %s: %s/%s images in %s ms",
+                 field_id, len(detections), len(results), summary['elapsed_ms'])
+    
+    return jsonify({'field_id': field_id, 'crop_type': crop_type, 'summary': summary, 'results': results}), 200
 
 @app.route('/api/field_monitoring', methods=['GET'])
 def get_field_monitoring():
@@ -1388,7 +1719,7 @@ def get_field_monitoring():
     # Try to get field from Firebase first
     field_data = None
     try:
-        print(f"Using Firebase to get field monitoring data for field {field_id}")
+        logger.debug("Using Firebase to get field monitoring data for field %s", field_id)
         field_data = Field.get(field_id)
         
         if not field_data:
@@ -1396,7 +1727,7 @@ def get_field_monitoring():
             raise Exception("Field not found in Firebase")
             
     except Exception as firebase_error:
-        print(f"Firebase field monitoring error: {firebase_error}, falling back to PostgreSQL")
+        logger.warning("Firebase field monitoring error: %s, falling back to PostgreSQL", firebase_error)
         
         # Fallback to PostgreSQL
         try:
@@ -1419,7 +1750,7 @@ def get_field_monitoring():
                 'last_updated': field.last_updated.isoformat() if field.last_updated else None
             }
         except Exception as pg_error:
-            print(f"PostgreSQL field monitoring error: {pg_error}")
+            logger.error("PostgreSQL field monitoring error: %s", pg_error)
             return jsonify({'error': 'Field not found in either database'}), 404
     
     # Check if we have cached satellite data that's recent (within 7 days)
@@ -1467,11 +1798,12 @@ def get_field_monitoring():
             }
             
             # Update in Firebase
-            Field.update(field_id, updated_data)
-            print(f"Updated satellite data in Firebase for field {field_id}")
+            updated_field = Field.update(field_id, updated_data)
+            field_context.cache.invalidate((updated_field or {}).get('user_id'))
+            logger.debug("Updated satellite data in Firebase for field %s", field_id)
             
         except Exception as firebase_update_error:
-            print(f"Firebase update error: {firebase_update_error}, falling back to PostgreSQL")
+            logger.warning("Firebase update error: %s, falling back to PostgreSQL", firebase_update_error)
             
             # Fallback to PostgreSQL
             try:
@@ -1481,15 +1813,15 @@ def get_field_monitoring():
                     field.satellite_data = satellite_data
                     field.last_updated = datetime.utcnow()
                     db.session.commit()
-                    print(f"Updated satellite data in PostgreSQL for field {field_id}")
+                    logger.debug("Updated satellite data in PostgreSQL for field %s", field_id)
             except Exception as pg_update_error:
-                print(f"PostgreSQL update error: {pg_update_error}")
+                logger.error("PostgreSQL update error: %s", pg_update_error)
                 # Continue anyway, we'll still return the generated data
         
         return jsonify(satellite_data)
         
     except Exception as e:
-        print(f"Error generating satellite data: {str(e)}")
+        logger.error("Error generating satellite data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/fertilizer_recommendations', methods=['GET'])
@@ -1503,7 +1835,7 @@ def get_fertilizer_recommendations():
     # Try to get field from Firebase first
     field_data = None
     try:
-        print(f"Using Firebase to get field for fertilizer recommendations {field_id}")
+        logger.debug("Using Firebase to get field for fertilizer recommendations %s", field_id)
         field_data = Field.get(field_id)
         
         if not field_data:
@@ -1511,7 +1843,7 @@ def get_fertilizer_recommendations():
             raise Exception("Field not found in Firebase")
             
     except Exception as firebase_error:
-        print(f"Firebase field error: {firebase_error}, falling back to PostgreSQL")
+        logger.warning("Firebase field error: %s, falling back to PostgreSQL", firebase_error)
         
         # Fallback to PostgreSQL
         try:
@@ -1523,7 +1855,7 @@ def get_fertilizer_recommendations():
             # Use the PostgreSQL field object directly
             return generate_fertilizer_recommendations_from_sql_field(field)
         except Exception as pg_error:
-            print(f"PostgreSQL field error: {pg_error}")
+            logger.error("PostgreSQL field error: %s", pg_error)
             return jsonify({'error': 'Field not found in either database'}), 404
     
     # If we got here, we're using Firebase field data
@@ -1562,19 +1894,11 @@ def generate_fertilizer_recommendations_from_sql_field(field):
                     for app in recent_applications:
                         context += f"- {app.date.strftime('%Y-%m-%d')}: {app.fertilizer_type} at {app.application_rate} kg/ha\n"
             except Exception as e:
-                print(f"Error getting fertilizer records: {e}")
+                logger.error("Error getting fertilizer records: %s", e)
                 # Continue without fertilizer records
                 
             # Generate fertilizer recommendations
-            prompt = (
-                f"{context}\n\n"
-                "Based on the above information, provide fertilizer recommendations including:\n"
-                "1. Recommended fertilizer types\n"
-                "2. Application rates in kg/hectare\n"
-                "3. Timing of application\n"
-                "4. Application method\n"
-                "5. Special considerations for this crop and soil type"
-            )
+            prompt = prompts.FIELD_FERTILIZER.render(context=context)
             
             response = model.generate_content(prompt)
             recommendations = response.text
@@ -1593,7 +1917,7 @@ def generate_fertilizer_recommendations_from_sql_field(field):
             return generate_rule_based_fertilizer_recommendations(crop_type, soil_type, "mid-season")
             
     except Exception as e:
-        print(f"Error generating fertilizer recommendations from SQL field: {e}")
+        logger.error("Error generating fertilizer recommendations from SQL field: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # Helper function to generate fertilizer recommendations from a Firebase field document
@@ -1636,15 +1960,7 @@ def generate_fertilizer_recommendations_from_firebase_field(field_data):
                 )
             
             # Generate fertilizer recommendations
-            prompt = (
-                f"{context}\n\n"
-                "Based on the above information, provide fertilizer recommendations including:\n"
-                "1. Recommended fertilizer types\n"
-                "2. Application rates in kg/hectare\n"
-                "3. Timing of application\n"
-                "4. Application method\n"
-                "5. Special considerations for this crop and soil type"
-            )
+            prompt = prompts.FIELD_FERTILIZER.render(context=context)
             
             response = model.generate_content(prompt)
             recommendations = response.text
@@ -1722,6 +2038,7 @@ def handle_market_favorites():
             
             # Save to Firebase
             new_favorite = MarketFavorite.create(favorite_data)
+            price_alerts.engine.add_favorite(new_favorite)
             
             # Return the saved data with the generated ID
             if isinstance(new_favorite, dict):
@@ -1742,7 +2059,7 @@ def handle_market_favorites():
                 })
             
         except Exception as e:
-            print(f"Error creating market favorite in Firebase: {str(e)}")
+            logger.error("Error creating market favorite in Firebase: %s", e)
             return jsonify({'error': f'Failed to create market favorite: {str(e)}'}), 500
     
     else:
@@ -1778,7 +2095,7 @@ def handle_market_favorites():
             })
             
         except Exception as e:
-            print(f"Error retrieving market favorites from Firebase: {str(e)}")
+            logger.error("Error retrieving market favorites from Firebase: %s", e)
             return jsonify({'error': f'Failed to retrieve market favorites: {str(e)}'}), 500
 
 @app.route('/api/users/register', methods=['POST'])
@@ -1832,7 +2149,7 @@ def register_user():
         }), 201
         
     except Exception as e:
-        print(f"Firebase user registration error: {str(e)}")
+        logger.error("Firebase user registration error: %s", e)
         return jsonify({'error': f'Failed to register user: {str(e)}'}), 500
 
 @app.route('/api/users/login', methods=['POST'])
@@ -1868,7 +2185,7 @@ def login_user():
         })
         
     except Exception as e:
-        print(f"Firebase login error: {str(e)}")
+        logger.error("Firebase login error: %s", e)
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
 
 @app.route('/api/fields', methods=['GET', 'POST'])
@@ -1882,11 +2199,18 @@ def handle_fields():
     # Get all fields for a user
     if request.method == 'GET':
         try:
-            print(f"Using Firebase to get fields for user {user_id}")
-            fields_data = Field.get_by_user_id(user_id)
-            return jsonify({'fields': fields_data or []})
+            logger.debug("Using Firebase to get fields for user %s", user_id)
+            fields_data = Field.get_by_user_id(user_id) or []
+            
+            # Field versions identify the payload, so unchanged polls get a 304
+            return http_cache.conditional_json(
+                ['fields', user_id] + sorted((f.get('id', ''), http_cache.document_version(f)) for f in fields_data),
+                lambda: {'fields': fields_data},
+                last_modified=http_cache.latest_timestamp(http_cache.document_version(f) for f in fields_data),
+                cache_body=True
+            )
         except Exception as e:
-            print(f"Firebase fields error: {e}")
+            logger.error("Firebase fields error: %s", e)
             return jsonify({'error': f'Failed to retrieve fields: {str(e)}'}), 500
     
     # Create a new field
@@ -1900,7 +2224,7 @@ def handle_fields():
             return jsonify({'error': 'Field name is required'}), 400
         
         try:
-            print(f"Using Firebase to create field for user {user_id}")
+            logger.debug("Using Firebase to create field for user %s", user_id)
             
             # Parse planting date if provided
             planting_date = None
@@ -1923,6 +2247,7 @@ def handle_fields():
             
             # Create the field in Firebase
             firebase_field = Field.create(field_data)
+            field_context.cache.invalidate(user_id)
             
             if firebase_field:
                 # Create a Field-like object for guidance generation
@@ -1957,7 +2282,7 @@ def handle_fields():
                 }), 201
                 
         except Exception as e:
-            print(f"Firebase field creation error: {e}")
+            logger.error("Firebase field creation error: %s", e)
             return jsonify({'error': f'Failed to create field: {str(e)}'}), 500
 
 @app.route('/api/farm_guidance/<field_id>', methods=['GET'])
@@ -1965,11 +2290,14 @@ def get_farm_guidance(field_id):
     """Get AI-powered farm management guidance for a specific field - FIREBASE ONLY"""
     
     try:
-        print(f"Using Firebase to get field {field_id}")
+        logger.debug("Using Firebase to get field %s", field_id)
         firebase_field = Field.get(field_id)
         
         if not firebase_field:
             return jsonify({'error': 'Field not found'}), 404
+        
+        # Guidance only changes when the field does
+        field_version = http_cache.document_version(firebase_field)
             
         # Create a Field-like object with the required attributes
         class FieldObject:
@@ -1992,19 +2320,32 @@ def get_farm_guidance(field_id):
         
         field = FieldObject(firebase_field)
         
-        # Generate guidance
-        guidance = generate_farm_guidance(field)
+        # Expected source; a 304 skips regenerating the guidance (and the Gemini call)
+        expected_source = 'gemini' if GEMINI_API_KEY else 'knowledge_base'
+        sources = []
         
-        # Return structured guidance
-        return jsonify({
-            'field_id': field.id,
-            'field_name': field.name,
-            'crop_type': field.crop_type,
-            'guidance': guidance
-        })
+        def build():
+            guidance, source = generate_farm_guidance_with_source(field)
+            sources.append(source)
+            return {
+                'field_id': field.id,
+                'field_name': field.name,
+                'crop_type': field.crop_type,
+                'guidance': guidance
+            }
+        
+        response = http_cache.conditional_json(
+            ['farm_guidance', field_id, field_version, expected_source],
+            build,
+            last_modified=field_version
+        )
+        if sources and sources[0] != expected_source:
+            # Gemini failed and this is the fallback; don't let a 304 pin it until the field changes
+            http_cache.no_store(response)
+        return response
             
     except Exception as e:
-        print(f"Firebase farm guidance error: {str(e)}")
+        logger.error("Firebase farm guidance error: %s", e)
         return jsonify({'error': f'Failed to generate farm guidance: {str(e)}'}), 500
 
 # Helper function for generating detailed crop articles
@@ -2175,18 +2516,23 @@ Sugarcane is a perennial grass that thrives in tropical and subtropical regions.
 @app.route('/api/guidance/quick', methods=['POST'])
 def get_quick_farm_guidance():
     """Get AI-powered farm management guidance based on crop and soil type only"""
-    
+    payload, status = flows.run_sync(quick_guidance_flow(request.get_json(silent=True)))
+    return jsonify(payload), status
+
+
+def quick_guidance_flow(data):
+    """Quick guidance as an I/O-agnostic flow (see flows.py), also served by asgi.py"""
     try:
-        data = request.json
-        
         if not data:
-            return jsonify({'error': 'No data provided'}), 400
+            return {'error': 'No data provided'}, 400
+        if not isinstance(data, dict):
+            return {'error': 'Request body must be a JSON object'}, 400
             
         crop_type = data.get('crop_type')
         soil_type = data.get('soil_type')
         
         if not crop_type or not soil_type:
-            return jsonify({'error': 'Crop type and soil type are required'}), 400
+            return {'error': 'Crop type and soil type are required'}, 400
         
         # Use a more detailed approach for quick guidance with narrative content
         guidance = {
@@ -2221,134 +2567,13 @@ def get_quick_farm_guidance():
         try:
             # If Gemini API key is available, use AI for detailed guidance
             if GEMINI_API_KEY:
-                # List available models to see what we can use
-                print("\n\n--- AVAILABLE GEMINI MODELS ---")
-                for m in genai.list_models():
-                    if 'generateContent' in m.supported_generation_methods:
-                        print(f"Model name: {m.name}")
-                print("--- END AVAILABLE MODELS ---\n\n")
-                
-                # Use the newer model names that are available
-                # Use a more reliable approach to find an available model
-                available_model = None
-                
-                # First, try gemini-1.5-flash-latest which has higher quota limits
-                try:
-                    available_model = 'gemini-1.5-flash-latest'
-                    model = genai.GenerativeModel(available_model)
-                    print(f"Using model: {available_model}")
-                except Exception as e:
-                    print(f"Error with {available_model}: {str(e)}")
-                    available_model = None
-                
-                # If that fails, try gemini-1.5-flash
-                if available_model is None:
-                    try:
-                        available_model = 'gemini-1.5-flash'
-                        model = genai.GenerativeModel(available_model)
-                        print(f"Using model: {available_model}")
-                    except Exception as e:
-                        print(f"Error with {available_model}: {str(e)}")
-                        available_model = None
-                
-                # Last resort - try to find any available model
-                if available_model is None:
-                    for m in genai.list_models():
-                        if 'gemini' in m.name and 'generateContent' in m.supported_generation_methods:
-                            try:
-                                available_model = m.name.replace('models/', '')
-                                print(f"Using fallback model: {available_model}")
-                                model = genai.GenerativeModel(available_model)
-                                break
-                            except Exception as e:
-                                print(f"Error with {available_model}: {str(e)}")
-                                continue
-                
-                # If we still don't have a model, we'll use our fallback data
+                # Model picked once per process by the warm-up (get_gemini_model); until
+                # then, or if listing failed, the flash model, which has the highest quota.
+                # Neither needs a round trip on the request path.
+                model = gemini_model or genai.GenerativeModel('gemini-1.5-flash-latest')
                 
                 # Create a more comprehensive prompt for detailed guidance
-                prompt = f"""
-                You are an agricultural expert commissioned to write a comprehensive farming manual. Create a detailed, practical guide for {crop_type} cultivation in {soil_type} soil that combines traditional practices and modern techniques.
-                
-                FORMAT YOUR RESPONSE AS A COMPLETE ARTICLE WITH HEADINGS AND SUBHEADINGS. DO NOT include any JSON content or code blocks in the main article. Write in clear, professional language suitable for publishing in an agricultural journal.
-
-                ## ARTICLE STRUCTURE AND CONTENT:
-
-                # {crop_type} Cultivation Guide for {soil_type} Soil
-                Begin with a thorough introduction (250-300 words) explaining why {crop_type} is well-suited (or what challenges it faces) in {soil_type} soil. Include regional considerations and economic importance.
-
-                ## Detailed Cultivation Timeline
-                Create a chronological, month-by-month or season-by-season breakdown of the complete growing cycle with SPECIFIC DATES AND TIMINGS:
-                - Pre-planting soil preparation (beginning 45-60 days before planting date)
-                - Seed selection and treatment recommendations with EXACT seed rates (kg/ha)
-                - Planting window with PRECISE spacing measurements (e.g., 45cm between rows, 15cm between plants)
-                - Post-planting care with timing
-                - Critical growth stages with SPECIFIC DURATION of each stage
-                - Harvest timing indicators with EXACT maturity signs
-                - Post-harvest handling and storage recommendations
-
-                ## Soil Management Techniques
-                Provide soil-specific guidance:
-                - Detailed analysis of {soil_type} soil properties and how they affect {crop_type}
-                - Step-by-step soil preparation procedures with SPECIFIC amendment quantities
-                - Optimal pH range with EXACT adjustment methods (e.g., "Add 500kg/ha of agricultural lime to raise pH from 5.5 to 6.5")
-                - Organic matter incorporation with EXACT rates and timing
-                - Tillage recommendations (depth, frequency, tools)
-
-                ## Precise Irrigation Strategy
-                Develop a complete irrigation plan:
-                - Water requirements throughout each growth stage with EXACT quantities (mm or L/plant)
-                - Irrigation frequency with SPECIFIC intervals based on crop stage and weather conditions
-                - Irrigation system recommendations specifically for {soil_type} soil
-                - Water conservation techniques with implementation details
-                - Signs of water stress or excess with remediation strategies
-                - Drainage considerations specific to {soil_type} soil
-
-                ## Comprehensive Fertilization Plan
-                Create a complete nutritional program:
-                - SPECIFIC NPK ratio requirements for each growth stage (e.g., 12-24-12 at planting)
-                - PRECISE application rates in kg/ha for each application
-                - Detailed timing of fertilizer applications tied to growth stages
-                - Micronutrient requirements with SPECIFIC products and rates
-                - Organic fertilization alternatives with EXACT application rates
-                - Foliar feeding recommendations with SPECIFIC dilution rates
-
-                ## Integrated Pest and Disease Management
-                Provide a complete protection strategy:
-                - List of common pests specific to {crop_type} in {soil_type} soil with IDENTIFICATION FEATURES
-                - List of common diseases with EARLY SYMPTOMS
-                - Preventive measures with SPECIFIC timing relative to growth stages
-                - Monitoring techniques with EXACT frequency (e.g., "Scout fields twice weekly")
-                - Organic control options with PRECISE application rates and timing
-                - Conventional chemical options with SPECIFIC active ingredients, rates, and safety intervals
-                - Resistance management strategies
-
-                ## Modern Farming Technologies
-                Detail relevant technological innovations:
-                - Appropriate mechanization options for different farm sizes
-                - Precision agriculture techniques applicable to {crop_type} in {soil_type} soil
-                - Sensor and monitoring technologies with implementation guidance
-                - Digital tools and software recommendations for farm management
-                - Cost-benefit analysis of technology adoption
-
-                ## Sustainable Farming Practices
-                Outline environmental conservation approaches:
-                - SPECIFIC crop rotation recommendations with exact crop sequences
-                - Cover cropping strategies with NAMED species recommendations
-                - Soil conservation practices tailored to {soil_type}
-                - Biodiversity enhancement techniques around fields
-                - Carbon sequestration approaches for {crop_type} cultivation
-                - Water conservation strategies beyond irrigation management
-
-                ## Economic Considerations
-                Provide business guidance:
-                - Estimated yields for {crop_type} in {soil_type} soil under different management intensities
-                - Production costs breakdown with REALISTIC figures
-                - Market opportunities and value-addition possibilities
-                - Storage and handling for market timing
-
-                IMPORTANT: Your response should be as comprehensive as a book chapter. Write the COMPLETE ARTICLE. Include SPECIFIC, ACTIONABLE information with EXACT measurements, timing, and application rates. Avoid generalizations - be precise throughout. Emphasize PRACTICAL IMPLEMENTATION.
-                """
+                prompt = prompts.QUICK_GUIDANCE.render(crop_type=crop_type, soil_type=soil_type)
                 
                 # Set default temperature and max_output_tokens for more detailed content
                 generation_config = {
@@ -2360,17 +2585,12 @@ def get_quick_farm_guidance():
                 }
                 
                 # Generate content with specified configuration
-                response = model.generate_content(
-                    prompt,
-                    generation_config=generation_config
-                )
+                response = yield flows.Generate(model, prompt, generation_config)
                 
-                # Print the response to debug it
-                print("\n\n--- GEMINI RESPONSE START ---")
-                print("Response status:", response._result.candidates[0].finish_reason)
-                print("Response text preview:", response.text[:500] if response.text else "No text")
-                print("Response text length:", len(response.text) if response.text else 0)
-                print("--- GEMINI RESPONSE END ---\n\n")
+                # Log a preview of the response to debug it
+                logger.debug("Gemini guidance response (%s chars): %.500s",
+                             len(response.text) if response and response.text else 0,
+                             response.text if response and response.text else "No text")
                 
                 # Process the response
                 if response and response.text:
@@ -2392,7 +2612,7 @@ def get_quick_farm_guidance():
                                     guidance[key] = parsed_guidance[key]
                     except:
                         # If JSON extraction fails, use basic guidance
-                        print("JSON extraction failed, using basic rule-based guidance")
+                        logger.warning("JSON extraction failed, using basic rule-based guidance")
                         from types import SimpleNamespace
                         temp_field = SimpleNamespace(
                             name="Quick Analysis",
@@ -2405,12 +2625,12 @@ def get_quick_farm_guidance():
                         )
                         
                         # Get structured bullet points only
-                        basic_guidance = generate_farm_guidance(temp_field)
+                        basic_guidance = yield flows.Blocking(generate_farm_guidance, temp_field)
                         for key in basic_guidance:
                             if key in guidance and key != 'detailed_article':
                                 guidance[key] = basic_guidance[key]
         except Exception as e:
-            print(f"Error generating detailed guidance: {str(e)}")
+            logger.error("Error generating detailed guidance: %s", e)
             # Fallback to simple guidance
             from types import SimpleNamespace
             temp_field = SimpleNamespace(
@@ -2424,20 +2644,20 @@ def get_quick_farm_guidance():
             )
             
             # Generate basic guidance using the same function used for regular fields
-            basic_guidance = generate_farm_guidance(temp_field)
+            basic_guidance = yield flows.Blocking(generate_farm_guidance, temp_field)
             for key in basic_guidance:
                 if key in guidance:
                     guidance[key] = basic_guidance[key]
         
         # Return structured guidance
-        return jsonify({
+        return {
             'crop_type': crop_type,
             'soil_type': soil_type,
             'guidance': guidance
-        })
+        }, 200
         
     except Exception as e:
-        return jsonify({'error': f'Failed to generate quick farm guidance: {str(e)}'}), 500
+        return {'error': f'Failed to generate quick farm guidance: {str(e)}'}, 500
 
 # Advanced AI-powered fertilizer recommendations
 @app.route('/api/advanced_fertilizer_recommendations', methods=['POST'])
@@ -2476,11 +2696,11 @@ def get_advanced_fertilizer_recommendations():
             try:
                 # Use the best available model
                 try:
-                    print("Initializing model for fertilizer recommendations...")
+                    logger.debug("Initializing model for fertilizer recommendations...")
                     model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                    print("Successfully initialized gemini-1.5-pro-latest model for fertilizer recommendations")
+                    logger.debug("Successfully initialized gemini-1.5-pro-latest model for fertilizer recommendations")
                 except Exception as model_error:
-                    print(f"Error initializing gemini-1.5-pro-latest model: {str(model_error)}")
+                    logger.error("Error initializing gemini-1.5-pro-latest model: %s", model_error)
                     # Fallback model selection logic
                     try:
                         # Get list of available models
@@ -2493,60 +2713,35 @@ def get_advanced_fertilizer_recommendations():
                                 matching_models = [m for m in gemini_models if preferred_model in m.name]
                                 if matching_models:
                                     model_name = matching_models[0].name
-                                    print(f"Using fallback model: {model_name}")
+                                    logger.debug("Using fallback model: %s", model_name)
                                     model = genai.GenerativeModel(model_name)
                                     break
                             else:
                                 # If none of the preferred models are found, use the first available gemini model
                                 model_name = gemini_models[0].name
-                                print(f"Using alternative model: {model_name}")
+                                logger.debug("Using alternative model: %s", model_name)
                                 model = genai.GenerativeModel(model_name)
                         else:
                             raise Exception("No suitable Gemini models available")
                     except Exception as fallback_error:
-                        print(f"Error selecting fallback model: {str(fallback_error)}")
+                        logger.error("Error selecting fallback model: %s", fallback_error)
                         raise
                 
                 # Construct the prompt for fertilizer recommendations
-                prompt = f"""
-                As an agricultural expert, provide detailed fertilizer recommendations for:
-                
-                Crop: {crop_type}
-                Soil Type: {soil_type}
-                Growth Stage: {growth_stage}
-                Field Size: {field_size} hectares
-                {"Planting Date: " + planting_date if planting_date else ""}
-                {"Location: " + location if location else ""}
-                
-                Soil Test Results:
-                - Nitrogen Level: {nitrogen_level}
-                - Phosphorus Level: {phosphorus_level}
-                - Potassium Level: {potassium_level}
-                - pH Level: {ph_level}
-                - Organic Matter: {organic_matter}
-                
-                Previous Fertilizer Applications:
-                {previous_applications if previous_applications else "None recorded"}
-                
-                Provide a comprehensive fertilizer application plan with:
-                1. Specific NPK fertilizer ratios and brands/types for each growth stage
-                2. Precise application rates in kg/hectare
-                3. Exact timing of applications related to growth stages
-                4. Application methods (broadcast, banding, foliar, etc.)
-                5. Secondary nutrients and micronutrients if needed
-                6. Both organic and conventional fertilizer options
-                7. Cost-effective fertilizer combinations to maximize yield
-                
-                Format your response as a JSON object with these keys:
-                "primary_recommendations": [array of main fertilizer recommendations with product, ratio, rate, timing, method]
-                "secondary_nutrients": [recommendations for secondary nutrients if needed]
-                "micronutrients": [recommendations for micronutrients if needed]
-                "organic_alternatives": [organic fertilizer options]
-                "application_schedule": [detailed timing of applications]
-                "expected_benefits": [expected yield impact]
-                "precautions": [warnings and precautions]
-                "cost_estimate": estimated cost per hectare
-                """
+                prompt = prompts.FERTILIZER_PLAN.render(
+                    crop_type=crop_type,
+                    soil_type=soil_type,
+                    growth_stage=growth_stage,
+                    field_size=field_size,
+                    planting_line="Planting Date: " + planting_date if planting_date else "",
+                    location_line="Location: " + location if location else "",
+                    nitrogen_level=nitrogen_level,
+                    phosphorus_level=phosphorus_level,
+                    potassium_level=potassium_level,
+                    ph_level=ph_level,
+                    organic_matter=organic_matter,
+                    previous_applications=previous_applications if previous_applications else "None recorded"
+                )
                 
                 # Generate recommendations
                 response = model.generate_content(prompt)
@@ -2584,7 +2779,7 @@ def get_advanced_fertilizer_recommendations():
                     })
                     
                 except Exception as e:
-                    print(f"Error processing fertilizer recommendations: {str(e)}")
+                    logger.error("Error processing fertilizer recommendations: %s", e)
                     return jsonify({
                         'fertilizer_recommendations': {
                             'notes': 'Error processing detailed recommendations',
@@ -2594,7 +2789,7 @@ def get_advanced_fertilizer_recommendations():
                     })
                     
             except Exception as e:
-                print(f"Error generating fertilizer recommendations with AI: {str(e)}")
+                logger.error("Error generating fertilizer recommendations with AI: %s", e)
                 # Fall back to rule-based recommendations
         
         # Fallback rule-based fertilizer recommendations
@@ -2613,6 +2808,46 @@ def get_advanced_fertilizer_recommendations():
         return jsonify({'error': f'Failed to generate fertilizer recommendations: {str(e)}'}), 500
 
 # Advanced AI-powered irrigation recommendations
+@app.route('/api/thumbnails/<int:size>/<path:image_key>', methods=['GET'])
+def get_thumbnail(size, image_key):
+    """Serve a WebP thumbnail of an uploaded image, generating it on first request"""
+    if size not in thumbnails.THUMBNAIL_SIZES:
+        return jsonify({'error': f'Unsupported thumbnail size, use one of {list(thumbnails.THUMBNAIL_SIZES)}'}), 400
+    
+    source = thumbnails.source_path(image_key)
+    if not source:
+        return jsonify({'error': 'Image not found'}), 404
+    
+    try:
+        digest = thumbnails.source_digest(image_key, source)
+        path = thumbnails.ensure_thumbnail(source, digest, size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 415
+    except Exception as e:
+        logger.error("Error generating thumbnail for %s: %s", image_key, e)
+        return jsonify({'error': f'Failed to generate thumbnail: {str(e)}'}), 500
+    
+    immutable = upload_storage.is_storage_key(image_key)
+    response = send_file(path, mimetype='image/webp', etag=f"{digest}-{size}", conditional=True,
+                         max_age=thumbnails.IMMUTABLE_MAX_AGE if immutable else thumbnails.LEGACY_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = immutable
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Operational counters for this worker process"""
+    return jsonify({
+        'counters': metrics.snapshot(),
+        'chat_cache': chat_cache.cache.stats(),
+        'field_context': field_context.cache.stats(),
+        'http_body_cache': http_cache.body_cache.stats(),
+        'json_backend': json_provider.BACKEND,
+        'prompt_versions': prompts.versions(),
+        'startup': startup.warmup.status(),
+        'disease_analysis_parse_failure_rate': disease_analysis.parse_failure_rate()
+    }), 200
+
 @app.route('/api/disease_reports', methods=['GET'])
 def get_disease_reports():
     """Get disease reports for a user"""
@@ -2624,15 +2859,18 @@ def get_disease_reports():
         
         # Try to get disease reports using Firebase model first
         try:
-            print(f"Using Firebase to get disease reports for user {user_id}")
+            logger.debug("Using Firebase to get disease reports for user %s", user_id)
             
             # Get reports from Firebase model
             firebase_reports = DiseaseReport.get_by_user_id(user_id)
             
             if firebase_reports:
+                # Lists render thumbnails instead of downloading the originals
+                for report in firebase_reports:
+                    report['thumbnails'] = thumbnails.thumbnail_urls(report.get('image_path'))
                 return jsonify({'reports': firebase_reports}), 200
         except Exception as firebase_error:
-            print(f"Firebase disease reports error: {firebase_error}, falling back to PostgreSQL")
+            logger.warning("Firebase disease reports error: %s, falling back to PostgreSQL", firebase_error)
         
         # Fallback to PostgreSQL
         try:
@@ -2657,6 +2895,7 @@ def get_disease_reports():
                     'detection_date': report.detection_date.isoformat() if report.detection_date else None,
                     'confidence_score': report.confidence_score,
                     'image_path': report.image_path,
+                    'thumbnails': thumbnails.thumbnail_urls(report.image_path),
                     'symptoms': report.symptoms,
                     'treatment_recommendations': report.treatment_recommendations,
                     'status': report.status,
@@ -2665,14 +2904,94 @@ def get_disease_reports():
                 
             return jsonify({'reports': reports_list}), 200
         except Exception as pg_error:
-            print(f"PostgreSQL disease reports error: {pg_error}")
+            logger.error("PostgreSQL disease reports error: %s", pg_error)
             return jsonify({'reports': []}), 200
     
     except Exception as e:
-        print(f"Error in get_disease_reports endpoint: {str(e)}")
+        logger.error("Error in get_disease_reports endpoint: %s", e)
         # Return empty array instead of error to prevent UI issues
         return jsonify({'reports': []}), 200
 
+def parse_stats_weeks():
+    """Validated 'weeks' query parameter for the disease stats endpoints"""
+    weeks = request.args.get('weeks', disease_stats.DEFAULT_WEEKS, type=int)
+    if not weeks or weeks < 1 or weeks > disease_stats.MAX_WEEKS:
+        raise ValueError(f'weeks must be between 1 and {disease_stats.MAX_WEEKS}')
+    return weeks
+
+@app.route('/api/disease_stats/heatmap', methods=['GET'])
+def get_disease_heatmap():
+    """Disease report counts per region for outbreak heatmaps"""
+    try:
+        weeks = parse_stats_weeks()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    crop_type = (request.args.get('crop_type') or '').strip().lower() or None
+    disease_code = request.args.get('disease_code')
+    
+    try:
+        return jsonify(disease_stats.heatmap(weeks, crop_type, disease_code))
+    except Exception as e:
+        logger.error("Error building disease heatmap: %s", e)
+        return jsonify({'error': f'Failed to build disease heatmap: {str(e)}'}), 500
+
+@app.route('/api/disease_stats/trends', methods=['GET'])
+def get_disease_trends():
+    """Weekly disease report trend lines for a region, a field or everywhere"""
+    try:
+        weeks = parse_stats_weeks()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    field_id = request.args.get('field_id')
+    region = request.args.get('region')
+    if field_id and region:
+        return jsonify({'error': 'Pass either field_id or region, not both'}), 400
+    
+    if field_id:
+        scope, scope_key = disease_stats.FIELD, field_id
+    else:
+        scope, scope_key = disease_stats.REGION, disease_stats.normalize_region(region) if region else None
+    crop_type = (request.args.get('crop_type') or '').strip().lower() or None
+    disease_code = request.args.get('disease_code')
+    
+    try:
+        return jsonify(disease_stats.trends(weeks, scope, scope_key, crop_type, disease_code))
+    except Exception as e:
+        logger.error("Error building disease trends: %s", e)
+        return jsonify({'error': f'Failed to build disease trends: {str(e)}'}), 500
+
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """
+    Delta sync for the app's offline cache.
+    
+    Query params: user_id, since (watermark from the previous sync, omit for a
+    full sync), collections (comma-separated, default all) and limit (per
+    collection). Keep calling with the returned watermark while has_more is true.
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+    
+    collections = [name.strip() for name in request.args.get('collections', '').split(',') if name.strip()]
+    try:
+        limit = int(request.args.get('limit', sync.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, sync.MAX_PAGE_SIZE))
+    
+    try:
+        result = sync.collect_changes(user_id, request.args.get('since'), collections or None, limit)
+        return jsonify(result), 200
+    except ValueError as e:
+        # Bad watermark or unknown collection name
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Error in sync endpoint: %s", e)
+        return jsonify({'error': f'Sync failed: {str(e)}'}), 500
+
 @app.route('/api/irrigation_recommendations', methods=['POST'])
 def get_irrigation_recommendations():
     """Get AI-powered irrigation recommendations based on crop, soil, and weather conditions"""
@@ -2710,11 +3029,11 @@ def get_irrigation_recommendations():
             try:
                 # Use the best available model
                 try:
-                    print("Initializing model for irrigation recommendations...")
+                    logger.debug("Initializing model for irrigation recommendations...")
                     model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                    print("Successfully initialized gemini-1.5-pro-latest model for irrigation recommendations")
+                    logger.debug("Successfully initialized gemini-1.5-pro-latest model for irrigation recommendations")
                 except Exception as model_error:
-                    print(f"Error initializing gemini-1.5-pro-latest model: {str(model_error)}")
+                    logger.error("Error initializing gemini-1.5-pro-latest model: %s", model_error)
                     # Fallback model selection logic
                     try:
                         # Get list of available models
@@ -2727,62 +3046,36 @@ def get_irrigation_recommendations():
                                 matching_models = [m for m in gemini_models if preferred_model in m.name]
                                 if matching_models:
                                     model_name = matching_models[0].name
-                                    print(f"Using fallback model: {model_name}")
+                                    logger.debug("Using fallback model: %s", model_name)
                                     model = genai.GenerativeModel(model_name)
                                     break
                             else:
                                 # If none of the preferred models are found, use the first available gemini model
                                 model_name = gemini_models[0].name
-                                print(f"Using alternative model: {model_name}")
+                                logger.debug("Using alternative model: %s", model_name)
                                 model = genai.GenerativeModel(model_name)
                         else:
                             raise Exception("No suitable Gemini models available")
                     except Exception as fallback_error:
-                        print(f"Error selecting fallback model: {str(fallback_error)}")
+                        logger.error("Error selecting fallback model: %s", fallback_error)
                         raise
                 
                 # Construct the prompt for irrigation recommendations
-                prompt = f"""
-                As an irrigation expert, provide detailed irrigation recommendations for:
-                
-                Crop: {crop_type}
-                Soil Type: {soil_type}
-                Growth Stage: {growth_stage}
-                Field Size: {field_size} hectares
-                Current Soil Moisture: {current_soil_moisture}
-                Irrigation System: {irrigation_system}
-                {"Location: " + location if location else ""}
-                Season: {season}
-                
-                Weather Data:
-                - Temperature: {temperature}°C
-                - Humidity: {humidity}%
-                - 5-day Precipitation Forecast (mm): {precipitation_forecast}
-                - Evapotranspiration: {evapotranspiration} mm/day
-                
-                Previous Irrigation:
-                {previous_irrigation if previous_irrigation else "None recorded"}
-                
-                Provide a comprehensive irrigation plan with:
-                1. Exact water requirements in mm or liters per hectare
-                2. Frequency of irrigation (daily, every 2 days, weekly, etc.)
-                3. Duration of each irrigation session in minutes or hours
-                4. Best time of day to irrigate
-                5. Adjustments needed based on weather forecast
-                6. Water conservation techniques
-                7. Signs of over/under irrigation to monitor
-                
-                Format your response as a JSON object with these keys:
-                "water_requirement": daily water requirement in mm
-                "frequency": recommended irrigation frequency
-                "duration": duration of each irrigation session
-                "best_time": optimal time of day for irrigation
-                "weather_adjustments": adjustments based on forecast
-                "conservation_techniques": water conservation methods
-                "monitoring_indicators": signs to watch for
-                "irrigation_schedule": detailed schedule for next 7 days
-                "expected_benefits": expected benefits of following this plan
-                """
+                prompt = prompts.IRRIGATION_PLAN.render(
+                    crop_type=crop_type,
+                    soil_type=soil_type,
+                    growth_stage=growth_stage,
+                    field_size=field_size,
+                    soil_moisture=current_soil_moisture,
+                    irrigation_system=irrigation_system,
+                    location_line="Location: " + location if location else "",
+                    season=season,
+                    temperature=temperature,
+                    humidity=humidity,
+                    precipitation_forecast=precipitation_forecast,
+                    evapotranspiration=evapotranspiration,
+                    previous_irrigation=previous_irrigation if previous_irrigation else "None recorded"
+                )
                 
                 # Generate recommendations
                 response = model.generate_content(prompt)
@@ -2814,7 +3107,7 @@ def get_irrigation_recommendations():
                     })
                     
                 except Exception as e:
-                    print(f"Error processing irrigation recommendations: {str(e)}")
+                    logger.error("Error processing irrigation recommendations: %s", e)
                     return jsonify({
                         'irrigation_recommendations': {
                             'notes': 'Error processing detailed recommendations',
@@ -2824,7 +3117,7 @@ def get_irrigation_recommendations():
                     })
                     
             except Exception as e:
-                print(f"Error generating irrigation recommendations with AI: {str(e)}")
+                logger.error("Error generating irrigation recommendations with AI: %s", e)
                 # Fall back to rule-based recommendations
         
         # Fallback rule-based irrigation recommendations
@@ -3143,6 +3436,31 @@ def generate_rule_based_irrigation_recommendations(crop_type, soil_type, growth_
     
     return recommendations
 
+def start_background_workers(refresh_market_prices=market_refresher.REFRESH_ENABLED):
+    """
+    Start this process's background threads and warm-up (each start is idempotent).
+
+    Called at import, or by gunicorn.conf.py in every worker after the fork,
+    since threads started in a preloading master do not survive it.
+    """
+    # Market price ingestion
+    if refresh_market_prices:
+        market_refresher.refresher.start()
+    # Chat persistence and rolling summaries
+    chat_writes.writer.start()
+    chat_summary.summarizer.start(summarize_chat)
+    # Detection jobs run on the bounded worker pool in this process
+    detection_jobs.queue.start(run_disease_detection)
+    # SDK imports, Firebase and model discovery
+    startup.warmup.start()
+
+
+if os.environ.get('START_BACKGROUND_WORKERS', '1') == '1':
+    start_background_workers()
+
 # Run the Flask app
 if __name__ == '__main__':
+    if IS_PRODUCTION:
+        # Fail at startup, not on the first request, when Firebase is misconfigured
+        firebase.load()
     app.run(host='0.0.0.0', port=5004, debug=True)
\ No newline at end of file
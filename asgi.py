@@ -0,0 +1,188 @@
+"""
+ASGI entry point: async chat and guidance, everything else through Flask.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5004
+
+POST /api/chat and POST /api/guidance/quick run their flows (see flows.py)
+on the event loop. While a request waits on Gemini it holds no thread, so
+one process can keep hundreds of them in flight. Every other request goes
+to the Flask app on a bounded thread pool (ASGI_WSGI_THREADS). Streaming
+responses such as the detection job event stream are forwarded chunk by
+chunk and stopped when the client disconnects.
+
+The bridge runs Flask requests on a real pool. asgiref's WsgiToAsgi would
+run them all on one shared thread.
+"""
+import io
+import os
+import logging
+import sys
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import api
+import logs
+import flows
+import chat_writes
+
+logger = logging.getLogger(__name__)
+
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '32'))
+
+# Endpoints served natively on the event loop
+FLOW_ROUTES = {
+    ('POST', '/api/chat'): api.chat_flow,
+    ('POST', '/api/guidance/quick'): api.quick_guidance_flow,
+}
+
+_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    route = FLOW_ROUTES.get((scope['method'], scope['path']))
+    if route is not None:
+        # Each request runs in its own task, so the id stays with this request
+        request_id = logs.bind_request_id(_header(scope, b'x-request-id'))
+        await _run_flow(route, body, send, request_id)
+    else:
+        await _run_wsgi(scope, body, receive, send)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Persist buffered chat messages before the process goes away
+            await asyncio.get_running_loop().run_in_executor(_pool, chat_writes.writer.flush)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def _run_flow(route, body: bytes, send, request_id: str):
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        payload, status = {'error': 'Request body is not valid JSON'}, 400
+    else:
+        try:
+            # The flow itself rejects a missing body or one that is not an object
+            payload, status = await flows.run_async(route(data))
+        except Exception as e:
+            logger.error("Error in async endpoint: %s", e)
+            payload, status = {'error': 'Internal server error'}, 500
+
+    # Same body as jsonify() and the same CORS header as CORS(app)
+    content = api.app.json.response(payload).get_data()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(content)).encode('latin-1')),
+            (b'access-control-allow-origin', b'*'),
+            (b'x-request-id', request_id.encode('latin-1')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': content})
+
+
+def _environ(scope, body: bytes):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'content-length':
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _start_wsgi(environ):
+    """Call the Flask app and produce the first chunk (runs on the pool)"""
+    started = {}
+    written = []
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = status
+        started['headers'] = headers
+        return written.append
+
+    iterable = api.app(environ, start_response)
+    iterator = iter(iterable)
+    first = next(iterator, None)
+    return started, iterable, iterator, b''.join(written) + (first or b'')
+
+
+async def _run_wsgi(scope, body: bytes, receive, send):
+    loop = asyncio.get_running_loop()
+    started, iterable, iterator, chunk = await loop.run_in_executor(_pool, _start_wsgi, _environ(scope, body))
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': int(started['status'].split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in started['headers']],
+        })
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if disconnected.done():
+                break
+            chunk = await loop.run_in_executor(_pool, next, iterator, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(_pool, iterable.close)
@@ -0,0 +1,198 @@
+"""
+Load test: sync Flask serving against the ASGI mode (asgi.py) for /api/chat.
+
+Gemini is replaced by a stand-in that waits --latency seconds (time.sleep in
+generate_content, asyncio.sleep in generate_content_async), so the test
+measures how many slow upstream calls one process can hold in flight, not
+model speed. Both servers run in this process on the in-memory database:
+
+- sync:  Flask on a pool of --sync-threads threads, like one gunicorn gthread
+         worker (--sync-threads 0 spawns a thread per request, like app.run)
+- async: uvicorn serving asgi:app
+
+A raw asyncio HTTP client keeps --concurrency requests open at once. Each
+request is a first chat turn in a fresh session, with the semantic answer
+cache disabled, so every request reaches the model. The in-memory database
+scans whole collections, so most of the remaining CPU per request is the
+history query; against Firestore that time is network wait as well.
+
+Usage: python benchmarks/bench_async_serving.py [--latency 0.5] [--concurrency 50,200,500]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('CHAT_CACHE_ENABLED', '0')
+os.environ.setdefault('CHAT_WAL_PATH', os.path.join(tempfile.mkdtemp(), 'chat_wal.jsonl'))
+
+with contextlib.redirect_stdout(open(os.devnull, 'w')):
+    import api  # noqa: E402
+    import asgi  # noqa: E402
+
+import uvicorn  # noqa: E402
+from werkzeug.serving import BaseWSGIServer  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Gemini stand-in with a fixed response latency"""
+    latency = 0.5
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, generation_config=None):
+        time.sleep(self.latency)
+        return FakeResponse('ठीक है, यह एक परीक्षण उत्तर है।')
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(self.latency)
+        return FakeResponse('ठीक है, यह एक परीक्षण उत्तर है।')
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server handing each connection to a fixed thread pool"""
+    request_queue_size = 1024
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads) if threads else None
+
+    def process_request(self, request, client_address):
+        if self.pool is None:
+            threading.Thread(target=self._handle, args=(request, client_address), daemon=True).start()
+        else:
+            self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_sync(port, threads):
+    server = PooledWSGIServer('127.0.0.1', port, api.app, threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def start_async(port):
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host='127.0.0.1', port=port, log_level='error',
+                                           backlog=2048, lifespan='off'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+async def post(port, path, payload):
+    body = json.dumps(payload).encode('utf-8')
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return int(data.split(b' ', 2)[1])
+
+
+async def load(port, concurrency, total):
+    latencies, errors = [], 0
+    peak_threads = threading.active_count()
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def client():
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            payload = {'message': f'गेहूं में खाद कब डालें? ({i})', 'user_id': 'bench', 'session_id': f'bench-{port}-{i}'}
+            started = time.perf_counter()
+            try:
+                status = await post(port, '/api/chat', payload)
+            except OSError:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            errors += status != 200
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while True:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.ensure_future(sample_threads())
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+        'errors': errors,
+        'threads': peak_threads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.5, help='simulated Gemini latency in seconds')
+    parser.add_argument('--concurrency', default='50,200,500', help='comma-separated concurrent clients')
+    parser.add_argument('--requests-per-client', type=int, default=1)
+    parser.add_argument('--sync-threads', type=int, default=8, help='0 = one thread per request')
+    parser.add_argument('--modes', default='sync,async')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    FakeModel.latency = args.latency
+    api.genai.GenerativeModel = FakeModel
+    api.GEMINI_API_KEY = 'benchmark'
+
+    sync_label = f"sync ({args.sync_threads} threads)" if args.sync_threads else "sync (thread per request)"
+    print(f"simulated Gemini latency: {args.latency * 1000:.0f} ms")
+    print(f"{'mode':28} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} {'threads':>7}")
+    for mode in args.modes.split(','):
+        port = free_port()
+        stop = start_sync(port, args.sync_threads) if mode == 'sync' else start_async(port)
+        label = sync_label if mode == 'sync' else 'async (uvicorn asgi:app)'
+        try:
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                    result = asyncio.run(load(port, concurrency, concurrency * args.requests_per_client))
+                print(f"{label:28} {concurrency:7d} {result['rps']:8.1f} {result['p50'] * 1000:8.0f} "
+                      f"{result['p99'] * 1000:8.0f} {result['errors']:6d} {result['threads']:7d}")
+        finally:
+            stop()
+
+
+if __name__ == '__main__':
+    main()
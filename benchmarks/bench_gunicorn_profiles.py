@@ -0,0 +1,252 @@
+"""
+Load test: the development server against the gunicorn profiles in gunicorn.conf.py.
+
+Each profile is started as its own server process on the in-memory database:
+
+- dev:     what `python api.py` runs, Flask's server with debug=True (without
+           the reloader, which only adds a file watcher)
+- gthread: gunicorn -c gunicorn.conf.py
+- gevent:  GUNICORN_PROFILE=gevent (skipped unless gevent is installed)
+- async:   GUNICORN_PROFILE=async, uvicorn workers serving asgi:app
+
+Gemini is replaced in every worker by a stand-in that waits --latency
+seconds, installed after the profile's own post_fork hook, so /api/chat
+measures how many model calls a server keeps in flight. The
+semantic answer cache is off and every chat request opens a new session.
+/api/market_prices is the read path with no model call.
+
+The worker count follows the profile's CPU-based default; pass --workers to
+pin it. With the in-memory database every worker has its own data, so each
+worker ingests today's market prices once before the run.
+
+Usage: python benchmarks/bench_gunicorn_profiles.py [--latency 0.5] [--concurrency 20,100]
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import socket
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROFILES = ['dev', 'gthread', 'gevent', 'async']
+
+ENDPOINTS = {
+    'chat': 'POST /api/chat',
+    'market_prices': 'GET /api/market_prices?crop_type=Wheat',
+}
+
+# Wraps the production config: same settings and hooks, plus the Gemini stand-in
+CONFIG = """
+import sys
+sys.path.insert(0, {here!r})
+exec(compile(open({config!r}).read(), {config!r}, 'exec'))
+
+_post_fork = post_fork
+
+
+def post_fork(server, worker):
+    _post_fork(server, worker)
+    import api
+    import bench_gunicorn_profiles
+    bench_gunicorn_profiles.prepare_worker(api)
+"""
+
+# Development server, as started by `python api.py`
+DEV_SERVER = """
+import os, sys
+sys.path.insert(0, {here!r})
+import api
+import bench_gunicorn_profiles
+bench_gunicorn_profiles.prepare_worker(api)
+api.app.run(host='127.0.0.1', port=int(os.environ['API_PORT']), debug=True, use_reloader=False)
+"""
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Gemini stand-in with a fixed response latency"""
+
+    def __init__(self, *args, **kwargs):
+        self.latency = float(os.environ.get('BENCH_GEMINI_LATENCY', '0.5'))
+
+    def generate_content(self, prompt, generation_config=None):
+        time.sleep(self.latency)
+        return FakeResponse('ठीक है, यह एक परीक्षण उत्तर है।')
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(self.latency)
+        return FakeResponse('ठीक है, यह एक परीक्षण उत्तर है।')
+
+
+def prepare_worker(api):
+    """Install the Gemini stand-in and seed this worker's market prices"""
+    api.genai.GenerativeModel = FakeModel
+    api.GEMINI_API_KEY = 'benchmark'
+    api.market_refresher.refresher.refresh()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def available(profile):
+    if profile == 'gevent':
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def start_server(profile, port, latency, workers, workdir):
+    env = dict(os.environ,
+               API_PORT=str(port),
+               BENCH_GEMINI_LATENCY=str(latency),
+               CHAT_CACHE_ENABLED='0',
+               CHAT_WAL_PATH=os.path.join(workdir, f'chat_wal_{profile}.jsonl'),
+               MARKET_REFRESH_ENABLED='0')
+    if profile == 'dev':
+        command = [sys.executable, '-c', DEV_SERVER.format(here=HERE)]
+    else:
+        config = os.path.join(workdir, f'gunicorn_{profile}.conf.py')
+        with open(config, 'w') as f:
+            f.write(CONFIG.format(here=HERE, config=os.path.join(ROOT, 'gunicorn.conf.py')))
+        env['GUNICORN_PROFILE'] = profile
+        if workers:
+            env['WEB_CONCURRENCY'] = str(workers)
+        command = [sys.executable, '-m', 'gunicorn', '-c', config, '--bind', f'127.0.0.1:{port}']
+    log = open(os.path.join(workdir, f'{profile}.log'), 'w')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+
+    deadline = time.time() + 90
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{profile} server exited, see {log.name}")
+        try:
+            if asyncio.run(request(port, 'GET', '/api/market_prices?crop_type=Wheat')) == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"{profile} server did not start, see {log.name}")
+
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def rss_mb(pid):
+    """Resident memory of a process and its descendants"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration):
+            continue
+    return total / 1024
+
+
+async def request(port, method, path, payload=None):
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return int(data.split(b' ', 2)[1])
+
+
+async def load(port, endpoint, concurrency, total):
+    method, path = ENDPOINTS[endpoint].split(' ', 1)
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def client():
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            payload = None
+            if endpoint == 'chat':
+                payload = {'message': f'गेहूं में खाद कब डालें? ({i})', 'user_id': 'bench',
+                           'session_id': f'bench-{port}-{concurrency}-{i}'}
+            started = time.perf_counter()
+            try:
+                status = await request(port, method, path, payload)
+            except OSError:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            errors += status != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.5, help='simulated Gemini latency in seconds')
+    parser.add_argument('--concurrency', default='20,100', help='comma-separated concurrent clients')
+    parser.add_argument('--requests-per-client', type=int, default=3)
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--workers', type=int, default=0, help='gunicorn workers (0 = profile default)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_gunicorn_')
+    print(f"simulated Gemini latency: {args.latency * 1000:.0f} ms, {os.cpu_count()} CPUs, logs in {workdir}")
+    print(f"{'profile':8} {'endpoint':14} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'RSS MB':>7}")
+    for profile in args.profiles.split(','):
+        if not available(profile):
+            print(f"{profile:8} skipped (not installed)")
+            continue
+        port = free_port()
+        process = start_server(profile, port, args.latency, args.workers, workdir)
+        try:
+            for endpoint in args.endpoints.split(','):
+                for concurrency in (int(c) for c in args.concurrency.split(',')):
+                    result = asyncio.run(load(port, endpoint, concurrency, concurrency * args.requests_per_client))
+                    print(f"{profile:8} {endpoint:14} {concurrency:7d} {result['rps']:8.1f} "
+                          f"{result['p50'] * 1000:8.0f} {result['p99'] * 1000:8.0f} {result['errors']:6d} "
+                          f"{rss_mb(process.pid):7.0f}")
+        finally:
+            stop_server(process)
+
+
+if __name__ == '__main__':
+    main()
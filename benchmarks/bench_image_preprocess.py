@@ -0,0 +1,67 @@
+"""
+Benchmark disease-image preprocessing on real uploads.
+
+Runs image_preprocess.preprocess_image over every image in a directory
+(uploads/ by default) and reports bytes saved and preprocessing latency per
+image and in total. Upload time to Gemini is estimated for a given uplink
+speed so the preprocessing cost can be weighed against the transfer saved.
+
+Usage: python benchmarks/bench_image_preprocess.py [--dir uploads] [--max-edge 1024]
+       [--format JPEG|WEBP] [--uplink-mbps 10]
+"""
+import os
+import sys
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_preprocess  # noqa: E402
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', default=os.path.join(root, 'uploads'))
+    parser.add_argument('--max-edge', type=int, default=image_preprocess.MAX_EDGE)
+    parser.add_argument('--format', default=image_preprocess.OUTPUT_FORMAT)
+    parser.add_argument('--uplink-mbps', type=float, default=10.0)
+    args = parser.parse_args()
+
+    results = []
+    for name in sorted(os.listdir(args.dir)):
+        path = os.path.join(args.dir, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            prepared = image_preprocess.preprocess_image(path, args.max_edge, args.format)
+        except ValueError as e:
+            print(f"skip {name}: {e}")
+            continue
+        stats = prepared['stats']
+        results.append(stats)
+        print(f"{name[:36]:36s} {stats['original_bytes'] / 1024:8.0f} KB -> {stats['processed_bytes'] / 1024:6.0f} KB "
+              f"({stats['saved_pct']:5.1f}%) {prepared['width']}x{prepared['height']} "
+              f"{stats['preprocess_ms']:6.1f} ms")
+
+    if not results:
+        print("No images found")
+        return
+
+    bytes_per_ms = args.uplink_mbps * 1e6 / 8 / 1000
+    original = sum(r['original_bytes'] for r in results)
+    processed = sum(r['processed_bytes'] for r in results)
+    preprocess_ms = [r['preprocess_ms'] for r in results]
+    upload_saved_ms = [r['bytes_saved'] / bytes_per_ms for r in results]
+
+    print()
+    print(f"images:                   {len(results)}")
+    print(f"total bytes:              {original / 1e6:.2f} MB -> {processed / 1e6:.2f} MB "
+          f"({100.0 * (original - processed) / original:.1f}% saved)")
+    print(f"preprocess latency:       mean {statistics.mean(preprocess_ms):.1f} ms, max {max(preprocess_ms):.1f} ms")
+    print(f"upload time saved @ {args.uplink_mbps:g} Mbps: mean {statistics.mean(upload_saved_ms):.1f} ms per image")
+    print(f"net latency change:       {statistics.mean(preprocess_ms) - statistics.mean(upload_saved_ms):+.1f} ms per image")
+
+
+if __name__ == '__main__':
+    main()
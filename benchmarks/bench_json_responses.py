@@ -0,0 +1,129 @@
+"""
+Benchmark JSON response serialization on real API payloads.
+
+The payloads are what the API returns on the in-memory database:
+/api/guidance/quick for several crops (the rule-based response with its
+multi-KB detailed_article) and /api/chat_history for a Hindi conversation of
+growing length. Each is serialized into a response by:
+
+- flask:     Flask's default provider (stdlib, sorted keys, ASCII escapes)
+- stdlib:    FastJSONProvider with JSON_BACKEND=stdlib
+- orjson:    FastJSONProvider with orjson (skipped unless installed)
+- preserial: a Preserialized body, as kept by http_cache for cached payloads
+
+and the response time and body size are reported. The last table times the
+whole request through the Flask test client with each provider.
+
+Usage: python benchmarks/bench_json_responses.py [--iterations 2000] [--messages 50,200]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the benchmark's chat log and background threads out of the way
+os.environ.setdefault('CHAT_WAL_PATH', os.path.join(tempfile.mkdtemp(prefix='bench_json_'), 'chat_wal.jsonl'))
+os.environ.setdefault('START_BACKGROUND_WORKERS', '0')
+os.environ.pop('GEMINI_API_KEY', None)
+
+import api  # noqa: E402
+import json_provider  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from firebase_models import ChatHistory  # noqa: E402
+
+CROPS = [('Wheat', 'Loamy'), ('Rice', 'Clay'), ('Sugarcane', 'Black'), ('Mustard', 'Sandy')]
+
+QUESTION = 'गेहूं की फसल में पीली पत्तियां दिख रही हैं, कौन सा खाद डालें?'
+ANSWER = ('पत्तियों का पीलापन नाइट्रोजन की कमी से हो सकता है। प्रति एकड़ 40 किलो यूरिया दो बार में डालें '
+          'और हल्की सिंचाई करें। अगर धब्बे भी दिखें तो यह रतुआ रोग हो सकता है। ') * 3
+
+
+def seed_history(user_id, messages):
+    for i in range(messages):
+        ChatHistory.create({
+            'user_id': user_id,
+            'session_id': f'{user_id}-session',
+            'message': QUESTION if i % 2 == 0 else ANSWER,
+            'sender': 'user' if i % 2 == 0 else 'assistant',
+            'timestamp': f'2024-11-10T08:{i // 60:02d}:{i % 60:02d}',
+            'context_data': {'intents': ['fertilizer', 'disease']} if i % 2 == 0 else {},
+        })
+
+
+def endpoints(message_counts):
+    """(label, method, path, json body) for each benchmarked request"""
+    requests = [(f'guidance {crop}', 'POST', '/api/guidance/quick', {'crop_type': crop, 'soil_type': soil})
+                for crop, soil in CROPS]
+    for messages in message_counts:
+        user_id = f'bench-{messages}'
+        seed_history(user_id, messages)
+        requests.append((f'history {messages}', 'GET',
+                         f'/api/chat_history?user_id={user_id}&limit={messages}', None))
+    return requests
+
+
+def providers():
+    """(name, backend, provider) for every provider available here"""
+    available = [('flask', None, DefaultJSONProvider(api.app)),
+                 ('stdlib', 'stdlib', json_provider.FastJSONProvider(api.app))]
+    if json_provider.ORJSON_AVAILABLE:
+        available.append(('orjson', 'orjson', json_provider.FastJSONProvider(api.app)))
+    return available
+
+
+def use(provider, backend):
+    api.app.json = provider
+    if backend:
+        json_provider.BACKEND = backend
+
+
+def timed(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) * 1e6 / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--messages', default='50,200', help='comma-separated chat history lengths')
+    args = parser.parse_args()
+
+    client = api.app.test_client()
+    requests = endpoints(int(m) for m in args.messages.split(','))
+    payloads = [(label, client.open(path, method=method, json=body).get_json())
+                for label, method, path, body in requests]
+    available = providers()
+    names = [name for name, _, _ in available] + ['preserial']
+
+    print(f"JSON backend default: {json_provider.BACKEND}")
+    print("\nresponse serialization (us per response / body KB)")
+    print(f"{'payload':18}" + ''.join(f" {name:>16}" for name in names))
+    with api.app.app_context():
+        for label, payload in payloads:
+            row = []
+            for name, backend, provider in available:
+                use(provider, backend)
+                size = len(provider.response(payload).get_data())
+                row.append((timed(lambda: provider.response(payload), args.iterations), size))
+            body = json_provider.preserialize(payload)
+            row.append((timed(lambda: api.app.json.response(body), args.iterations), len(body)))
+            print(f"{label:18}" + ''.join(f" {us:8.1f} {size / 1024:6.1f}K" for us, size in row))
+
+    print("\nfull request through the test client (us per request)")
+    print(f"{'endpoint':18}" + ''.join(f" {name:>9}" for name, _, _ in available))
+    requests_per_run = max(args.iterations // 10, 1)
+    for label, method, path, body in requests:
+        row = []
+        for name, backend, provider in available:
+            use(provider, backend)
+            row.append(timed(lambda: client.open(path, method=method, json=body), requests_per_run))
+        print(f"{label:18}" + ''.join(f" {us:9.0f}" for us in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark the local first-pass disease classifier on real uploads.
+
+Measures feature extraction latency on every image in a directory (uploads/
+by default), k-NN query latency at growing index sizes, and how stable the
+features are: each upload is indexed as its own class and queried again
+after rotation, re-cropping and JPEG recompression, reporting top-1
+retrieval accuracy. The uploads are not labelled, so this checks the
+descriptor rather than diagnostic accuracy; pass --labels with a
+<crop>/<disease>/*.jpg tree to get leave-one-out accuracy and the share of
+images that would be answered locally.
+
+Usage: python benchmarks/bench_local_classifier.py [--dir uploads] [--labels DIR]
+       [--index-sizes 100,1000,10000] [--gemini-ms 3000]
+"""
+import io
+import os
+import sys
+import time
+import hashlib
+import argparse
+import statistics
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_classifier  # noqa: E402
+
+
+def augmentations(image):
+    """Variants of the same photo a farmer might upload again"""
+    width, height = image.size
+    yield 'rotate 10', image.rotate(10, resample=Image.BILINEAR, expand=False)
+    yield 'crop 85%', image.crop((int(width * 0.075), int(height * 0.075),
+                                  int(width * 0.925), int(height * 0.925)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=40)
+    yield 'jpeg q40', Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+    yield 'half size', image.resize((max(1, width // 2), max(1, height // 2)), Image.BILINEAR)
+
+
+def features_of(image):
+    image = image.copy()
+    image.thumbnail((local_classifier.FEATURE_EDGE, local_classifier.FEATURE_EDGE), Image.BILINEAR)
+    return local_classifier.extract_features(np.asarray(image, dtype=np.float32) / 255.0)
+
+
+def bench_uploads(directory):
+    index = local_classifier.KNNIndex()
+    images, extract_ms, seen = [], [], set()
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest in seen:
+            # Byte-identical re-uploads would count as their own neighbours
+            continue
+        seen.add(digest)
+        try:
+            started = time.perf_counter()
+            rgb = local_classifier.load_rgb(path)
+            features = local_classifier.extract_features(rgb)
+            extract_ms.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            print(f"skip {name}: {e}")
+            continue
+        index.add('uploads', name, features)
+        images.append((name, Image.fromarray((rgb * 255).astype(np.uint8))))
+
+    if not images:
+        print("No images found")
+        return None
+
+    print(f"distinct images:        {len(images)}")
+    print(f"load + extract latency: mean {statistics.mean(extract_ms):.1f} ms, "
+          f"max {max(extract_ms):.1f} ms ({local_classifier.FEATURE_DIM} features)")
+
+    correct, total, by_variant = 0, 0, {}
+    for name, image in images:
+        for variant, augmented in augmentations(image):
+            best = index.query('uploads', features_of(augmented), k=1)[0][0]
+            hit = best == name
+            correct += hit
+            total += 1
+            hits, count = by_variant.get(variant, (0, 0))
+            by_variant[variant] = (hits + hit, count + 1)
+    print(f"augmented top-1 recall: {100.0 * correct / total:.1f}% ({correct}/{total})")
+    for variant, (hits, count) in by_variant.items():
+        print(f"  {variant:10s} {100.0 * hits / count:5.1f}%")
+    return statistics.mean(extract_ms)
+
+
+def bench_query(sizes):
+    rng = np.random.default_rng(0)
+    vector = rng.random(local_classifier.FEATURE_DIM).astype(np.float32)
+    for size in sizes:
+        index = local_classifier.KNNIndex()
+        index._vectors['bench'] = rng.random((size, local_classifier.FEATURE_DIM)).astype(np.float32)
+        index._labels['bench'] = [str(i % 8) for i in range(size)]
+        runs = 200
+        started = time.perf_counter()
+        for _ in range(runs):
+            index.query('bench', vector)
+        print(f"k-NN query @ {size:>7,} examples: {(time.perf_counter() - started) * 1000 / runs:.3f} ms")
+
+
+def bench_labels(root, gemini_ms):
+    """Leave-one-out accuracy over a labelled <crop>/<disease>/ tree"""
+    samples = []
+    for crop in sorted(os.listdir(root)):
+        crop_dir = os.path.join(root, crop)
+        if not os.path.isdir(crop_dir):
+            continue
+        for disease in sorted(os.listdir(crop_dir)):
+            disease_dir = os.path.join(crop_dir, disease)
+            if not os.path.isdir(disease_dir):
+                continue
+            for filename in sorted(os.listdir(disease_dir)):
+                try:
+                    rgb = local_classifier.load_rgb(os.path.join(disease_dir, filename))
+                except Exception:
+                    continue
+                samples.append((crop, disease, local_classifier.extract_features(rgb)))
+    if not samples:
+        print("No labelled images found")
+        return
+
+    correct, local, local_correct = 0, 0, 0
+    for held_out in range(len(samples)):
+        index = local_classifier.KNNIndex()
+        for i, (crop, disease, features) in enumerate(samples):
+            if i != held_out:
+                index.add(crop, disease, features)
+        crop, disease, features = samples[held_out]
+        neighbours = index.query(crop, features)
+        if not neighbours:
+            continue
+        votes = {}
+        for label, similarity in neighbours:
+            votes[label] = votes.get(label, 0.0) + max(similarity, 0.0)
+        label, weight = max(votes.items(), key=lambda item: item[1])
+        agreement = weight / (sum(votes.values()) or 1.0)
+        correct += label == disease
+        if agreement >= local_classifier.MIN_AGREEMENT and neighbours[0][1] >= local_classifier.MIN_SIMILARITY:
+            local += 1
+            local_correct += label == disease
+
+    print()
+    print(f"labelled images:        {len(samples)}")
+    print(f"leave-one-out top-1:    {100.0 * correct / len(samples):.1f}%")
+    print(f"answered locally:       {100.0 * local / len(samples):.1f}% "
+          f"(accuracy {100.0 * local_correct / local if local else 0:.1f}%)")
+    print(f"Gemini calls avoided:   ~{local * gemini_ms / 1000:.1f} s of model latency")
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', default=os.path.join(root, 'uploads'))
+    parser.add_argument('--labels', help='labelled <crop>/<disease>/*.jpg tree')
+    parser.add_argument('--index-sizes', default='100,1000,10000')
+    parser.add_argument('--gemini-ms', type=float, default=3000.0,
+                        help='typical Gemini vision round trip, for comparison')
+    args = parser.parse_args()
+
+    extract_ms = bench_uploads(args.dir)
+    print()
+    bench_query([int(size) for size in args.index_sizes.split(',')])
+    if extract_ms is not None:
+        print()
+        print(f"local answer vs Gemini: ~{extract_ms:.0f} ms vs ~{args.gemini_ms:.0f} ms per image")
+    if args.labels:
+        bench_labels(args.labels, args.gemini_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark the price-alert index against a naive scan.
+
+Builds an index of synthetic MarketFavorite documents (1M by default) and
+measures per-price evaluation latency, comparing it with scanning every
+favorite. No Firebase access is needed.
+
+Usage: python benchmarks/bench_price_alerts.py [--favorites 1000000] [--prices 2000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_alerts import PriceAlertIndex  # noqa: E402
+
+CROPS = {
+    'Rice': 2200, 'Wheat': 2000, 'Cotton': 6000, 'Sugarcane': 300, 'Maize': 1800,
+    'Soybean': 4000, 'Potato': 1500, 'Tomato': 2000, 'Chickpea': 5000, 'Mustard': 5500,
+    'Groundnut': 5800, 'Chilli': 8000, 'Onion': 1200, 'Turmeric': 7500, 'Ginger': 6500,
+    'Millet': 2800, 'Barley': 2200, 'Jute': 4500, 'Sunflower': 5600,
+}
+MARKETS = ['Delhi', 'Mumbai', 'Kolkata', 'Chennai', 'Lucknow', 'Bangalore', 'Hyderabad', '']
+
+
+def make_favorites(n, rng):
+    crops = list(CROPS)
+    favorites = []
+    for i in range(n):
+        crop = rng.choice(crops)
+        base = CROPS[crop]
+        favorite = {'id': f'fav{i}', 'user_id': f'user{i % 50000}', 'crop_type': crop,
+                    'market_name': rng.choice(MARKETS)}
+        if rng.random() < 0.8:
+            favorite['price_alert_min'] = round(base * rng.uniform(0.7, 1.0))
+        if rng.random() < 0.8:
+            favorite['price_alert_max'] = round(base * rng.uniform(1.0, 1.3))
+        favorites.append(favorite)
+    return favorites
+
+
+def make_prices(n, rng):
+    crops = list(CROPS)
+    prices = []
+    for _ in range(n):
+        crop = rng.choice(crops)
+        prices.append((crop, rng.choice(MARKETS[:-1]), CROPS[crop] * (1 + rng.uniform(-0.15, 0.15))))
+    return prices
+
+
+def naive_match(favorites, crop, market, price):
+    matches = []
+    for favorite in favorites:
+        if favorite['crop_type'] != crop or favorite['market_name'] not in (market, ''):
+            continue
+        if favorite.get('price_alert_min') is not None and price <= favorite['price_alert_min']:
+            matches.append(favorite['id'])
+        if favorite.get('price_alert_max') is not None and price >= favorite['price_alert_max']:
+            matches.append(favorite['id'])
+    return matches
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--favorites', type=int, default=1_000_000)
+    parser.add_argument('--prices', type=int, default=2000)
+    parser.add_argument('--naive-samples', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    favorites = make_favorites(args.favorites, rng)
+    prices = make_prices(args.prices, rng)
+
+    index = PriceAlertIndex()
+    start = time.perf_counter()
+    index.bulk_load(favorites)
+    build_s = time.perf_counter() - start
+
+    latencies, triggered = [], []
+    for crop, market, price in prices:
+        start = time.perf_counter()
+        matches = index.match(crop, market, price)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        triggered.append(len(matches))
+
+    naive_ms = []
+    for crop, market, price in prices[:args.naive_samples]:
+        start = time.perf_counter()
+        expected = naive_match(favorites, crop, market, price)
+        naive_ms.append((time.perf_counter() - start) * 1e3)
+        assert sorted(expected) == sorted(fid for fid, _ in index.match(crop, market, price))
+
+    start = time.perf_counter()
+    index.add({'id': 'new', 'crop_type': 'Rice', 'market_name': 'Delhi', 'price_alert_min': 2100})
+    insert_us = (time.perf_counter() - start) * 1e6
+
+    print(f"favorites generated:      {len(favorites):,}")
+    print(f"favorites with alerts:    {len(index):,}")
+    print(f"bulk load:                {build_s:.2f} s")
+    print(f"single insert:            {insert_us:.1f} us")
+    print(f"prices evaluated:         {len(prices):,}")
+    print(f"triggered per price:      mean {statistics.mean(triggered):.0f}, max {max(triggered)}")
+    print(f"index match latency:      mean {statistics.mean(latencies):.1f} us, "
+          f"p50 {percentile(latencies, 50):.1f} us, p99 {percentile(latencies, 99):.1f} us")
+    print(f"naive scan latency:       mean {statistics.mean(naive_ms):.1f} ms "
+          f"({args.naive_samples} samples, results verified equal)")
+
+
+if __name__ == '__main__':
+    main()
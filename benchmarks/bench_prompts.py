@@ -0,0 +1,112 @@
+"""
+Benchmark prompt rendering and chat history budgeting.
+
+Compares the precompiled templates against the inline f-strings api.py used
+to build (reproduced here with their source indentation, which was sent to
+Gemini verbatim), and packs synthetic chat sessions of growing length into
+the history budget to show the prompt size staying flat.
+
+Usage: python benchmarks/bench_prompts.py [--renders 20000] [--turns 5,20,80]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prompts  # noqa: E402
+
+VALUES = {
+    'crop_type': 'Wheat', 'soil_type': 'Loamy', 'growth_stage': 'tillering', 'field_size': 2.5,
+    'planting_line': 'Planting Date: 2024-11-10', 'location_line': 'Location: Karnal, Haryana',
+    'nitrogen_level': 'low', 'phosphorus_level': 'medium', 'potassium_level': 'medium',
+    'ph_level': 7.4, 'organic_matter': 'low',
+    'previous_applications': "[{'type': 'DAP', 'amount': 50, 'date': '2024-11-10'}]",
+}
+
+QUESTIONS = ['गेहूं में कौन सा खाद डालें', 'मेरे टमाटर में कीट लग गए हैं क्या करूं',
+             'aaj mausam kaisa rahega', 'How much urea per acre for wheat at tillering stage?']
+ANSWER = 'गेहूं में कल्ले निकलते समय प्रति एकड़ 40 किलो यूरिया डालें और हल्की सिंचाई करें। ' * 6
+
+
+def legacy_fertilizer_prompt(v):
+    """The indented f-string the advanced fertilizer endpoint used to send"""
+    return f"""
+                As an agricultural expert, provide detailed fertilizer recommendations for:
+
+                Crop: {v['crop_type']}
+                Soil Type: {v['soil_type']}
+                Growth Stage: {v['growth_stage']}
+                Field Size: {v['field_size']} hectares
+                {v['planting_line']}
+                {v['location_line']}
+
+                Soil Test Results:
+                - Nitrogen Level: {v['nitrogen_level']}
+                - Phosphorus Level: {v['phosphorus_level']}
+                - Potassium Level: {v['potassium_level']}
+                - pH Level: {v['ph_level']}
+                - Organic Matter: {v['organic_matter']}
+
+                Previous Fertilizer Applications:
+                {v['previous_applications']}
+                """ + prompts.FERTILIZER_PLAN.text.split('Previous Fertilizer Applications:', 1)[1].split('\n', 2)[2]
+
+
+def legacy_history(entries):
+    """The unbounded history loop chat() used to run"""
+    text = "Previous conversation:\n"
+    for entry in entries:
+        role = "किसान" if entry.get('sender') == "user" else "AI किसान"
+        text += f"{role}: {entry.get('message', '')}\n"
+    return text
+
+
+def make_session(turns, rng):
+    entries = []
+    for _ in range(turns):
+        entries.append({'sender': 'user', 'message': rng.choice(QUESTIONS)})
+        entries.append({'sender': 'assistant', 'message': ANSWER})
+    return entries
+
+
+def timed(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) * 1e6 / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--renders', type=int, default=20000)
+    parser.add_argument('--turns', default='5,20,80', help='comma-separated session lengths')
+    args = parser.parse_args()
+
+    legacy = legacy_fertilizer_prompt(VALUES)
+    rendered = prompts.FERTILIZER_PLAN.render(**VALUES)
+    legacy_us = timed(lambda: legacy_fertilizer_prompt(VALUES), args.renders)
+    render_us = timed(lambda: prompts.FERTILIZER_PLAN.render(**VALUES), args.renders)
+    estimate_us = timed(lambda: prompts.estimate_tokens(rendered), args.renders)
+
+    print(f"fertilizer prompt:   {len(legacy)} -> {len(rendered)} chars, "
+          f"~{prompts.estimate_tokens(legacy)} -> ~{prompts.estimate_tokens(rendered)} tokens")
+    print(f"render:              f-string {legacy_us:.1f} us, template {render_us:.1f} us")
+    print(f"estimate_tokens:     {estimate_us:.2f} us")
+
+    rng = random.Random(42)
+    print(f"history budget:      {prompts.CHAT_HISTORY_BUDGET} tokens")
+    for turns in (int(t) for t in args.turns.split(',')):
+        entries = make_session(turns, rng)
+        old_tokens = prompts.estimate_tokens(legacy_history(entries))
+        started = time.perf_counter()
+        history = prompts.build_history(entries)
+        build_us = (time.perf_counter() - started) * 1e6
+        print(f"  {turns:4d} turns:       ~{old_tokens} -> ~{history['tokens']} tokens, "
+              f"{history['turns_used']} messages kept, {history['turns_dropped']} summarized, {build_us:.0f} us")
+
+
+if __name__ == '__main__':
+    main()
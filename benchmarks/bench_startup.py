@@ -0,0 +1,129 @@
+"""
+Startup time of the API process, with an -X importtime breakdown.
+
+Each sample is a fresh interpreter, as in a cold container start, measuring:
+
+- import:        `import api` wall time
+- first request: import plus one GET /api/market_prices through the Flask
+                 test client (the request initializes Firebase on first use)
+
+Both include the background warm-up competing for the interpreter, as in
+a real start. Then one `python -X importtime -c "import api"` run, with the
+warm-up disabled, is summarised as the modules with the largest import time,
+directly under api and overall, along with which heavy SDKs the import
+itself loaded.
+
+--baseline REV runs the same measurements on a git revision (exported with
+git archive into a temporary directory), for a before/after comparison.
+GEMINI_API_KEY is removed from the environment. With a key set, the old
+import also waited on a list_models round trip, which this benchmark does not
+count.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--baseline HEAD~1] [--top 15]
+"""
+import os
+import sys
+import time
+import shutil
+import tarfile
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT = "import api"
+FIRST_REQUEST = "import api; api.app.test_client().get('/api/market_prices?crop_type=Wheat')"
+SDKS_LOADED = ("import sys, api; print(*(m for m in ('google.generativeai', 'firebase_admin', 'grpc') "
+               "if m in sys.modules))")
+
+
+def environment(workdir):
+    env = dict(os.environ, CHAT_WAL_PATH=os.path.join(workdir, 'chat_wal.jsonl'))
+    env.pop('GEMINI_API_KEY', None)
+    return env
+
+
+def quiet(env):
+    """Without the background warm-up, whose imports would be counted as the import's own"""
+    return dict(env, START_BACKGROUND_WORKERS='0')
+
+
+def timed(tree, code, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=tree, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def importtime(tree, env):
+    """(self_us, cumulative_us, depth, module) rows of one -X importtime run"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT], cwd=tree, env=quiet(env),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def measure(label, tree, runs, top, workdir):
+    env = environment(workdir)
+    # Compile bytecode once so every sample starts from the same state
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', tree], stdout=subprocess.DEVNULL)
+
+    timed(tree, IMPORT, env)
+    imports = [timed(tree, IMPORT, env) for _ in range(runs)]
+    requests = [timed(tree, FIRST_REQUEST, env) for _ in range(runs)]
+    print(f"\n== {label}")
+    print(f"{'':16} {'median ms':>10} {'min ms':>8}")
+    print(f"{'import':16} {statistics.median(imports) * 1000:10.0f} {min(imports) * 1000:8.0f}")
+    print(f"{'first request':16} {statistics.median(requests) * 1000:10.0f} {min(requests) * 1000:8.0f}")
+
+    rows = importtime(tree, env)
+    api_depth = next((depth for _, _, depth, name in rows if name == 'api'), 0)
+    direct = sorted((row for row in rows if row[2] == api_depth + 1), key=lambda row: -row[1])
+    print("\nslowest imports directly under api (-X importtime, cumulative ms):")
+    for _, cumulative_us, _, name in direct[:top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+    print("slowest modules overall (self ms):")
+    for self_us, _, _, name in sorted(rows, key=lambda row: -row[0])[:top]:
+        print(f"  {self_us / 1000:8.1f}  {name}")
+    output = subprocess.run([sys.executable, '-c', SDKS_LOADED], cwd=tree, env=quiet(env), text=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    loaded = output.splitlines()[-1].split() if output.strip() else []
+    print(f"heavy SDKs imported: {', '.join(loaded) or 'none'}")
+
+
+def export(rev, workdir):
+    """Check out a revision into workdir with git archive"""
+    tree = os.path.join(workdir, 'baseline')
+    archive = os.path.join(workdir, 'baseline.tar')
+    subprocess.run(['git', 'archive', '--format=tar', '-o', archive, rev], cwd=ROOT, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(tree)
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12)
+    parser.add_argument('--baseline', help='git revision to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        if args.baseline:
+            measure(f"baseline ({args.baseline})", export(args.baseline, workdir), args.runs, args.top, workdir)
+        measure("working tree", ROOT, args.runs, args.top, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
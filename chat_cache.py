@@ -0,0 +1,330 @@
+"""
+Semantic answer cache for /api/chat.
+
+Many first questions are paraphrases of each other ("गेहूं में कौन सा खाद
+डालें", "wheat fertilizer kya dale") and each one used to cost a full Gemini
+generation. Questions are embedded and compared against recently answered
+ones with a brute-force cosine search over a NumPy matrix; when the best
+match clears the threshold for the question's intent, the stored answer is
+reused.
+
+Embeddings come from the Gemini embedding model (multilingual, so Hindi and
+English paraphrases land close together) or, without an API key or when the
+call fails, from a hashed character n-gram embedding computed on the CPU.
+Each embedder keeps its own index because their vector spaces differ. The
+Gemini call is injected by api.py (cache.embed_content), so it goes through
+the same lazily loaded, key-configured SDK as every other Gemini call.
+
+Safety rails:
+
+- only context-free first turns are cached; follow-ups and answers that
+  used the farmer's field data are never looked up or stored
+- thresholds and lifetimes are per intent (see detect_chat_intent);
+  weather and market answers go stale quickly and are never cached
+- a cached answer is only reused for the same set of intents and the same
+  crops mentioned, so "wheat fertilizer" never gets the rice answer
+"""
+import os
+import logging
+import re
+import time
+import zlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Tuple, FrozenSet
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('CHAT_CACHE_ENABLED', '1') != '0'
+MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '5000'))
+
+EMBEDDING_MODEL = os.environ.get('CHAT_CACHE_EMBEDDING_MODEL', 'models/gemini-embedding-001')
+LOCAL_EMBEDDING_DIM = 1024
+
+# (cosine similarity threshold, TTL in seconds) per intent; None = never cache.
+# A question with several intents uses the strictest threshold and shortest TTL.
+INTENT_POLICIES: Dict[str, Optional[Tuple[float, int]]] = {
+    'greeting': (0.88, 30 * 24 * 3600),
+    'help': (0.90, 30 * 24 * 3600),
+    'crop_info': (0.93, 7 * 24 * 3600),
+    'farming_tech': (0.93, 7 * 24 * 3600),
+    'fertilizer': (0.94, 7 * 24 * 3600),
+    'irrigation': (0.94, 3 * 24 * 3600),
+    'disease': (0.95, 3 * 24 * 3600),
+    'general_query': (0.95, 24 * 3600),
+    'weather': None,
+    'market': None,
+}
+
+# Crop mentions (English, Hindi and common romanisations) that must agree
+# between the question and a cached one
+CROP_TERMS = {
+    'wheat': ['wheat', 'gehu', 'gehun', 'gehoon', 'गेहूं', 'गेहूँ', 'गेहू'],
+    'rice': ['rice', 'paddy', 'dhan', 'chawal', 'धान', 'चावल'],
+    'cotton': ['cotton', 'kapas', 'कपास'],
+    'tomato': ['tomato', 'tamatar', 'टमाटर'],
+    'potato': ['potato', 'aloo', 'alu', 'आलू'],
+    'maize': ['maize', 'corn', 'makka', 'makki', 'मक्का'],
+    'sugarcane': ['sugarcane', 'ganna', 'गन्ना'],
+    'mustard': ['mustard', 'sarso', 'sarson', 'सरसों'],
+    'soybean': ['soybean', 'soyabean', 'सोयाबीन'],
+    'onion': ['onion', 'pyaz', 'pyaaz', 'प्याज'],
+    'chickpea': ['chickpea', 'chana', 'gram', 'चना'],
+}
+_CROP_LOOKUP = {term: crop for crop, terms in CROP_TERMS.items() for term in terms}
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form used for exact matches and embeddings"""
+    text = unicodedata.normalize('NFC', text or '').lower()
+    # Keep letters, digits and Indic combining marks; drop punctuation
+    text = ''.join(ch if ch.isalnum() or unicodedata.category(ch).startswith('M') else ' ' for ch in text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def mentioned_crops(normalized: str) -> FrozenSet[str]:
+    return frozenset(_CROP_LOOKUP[word] for word in normalized.split(' ') if word in _CROP_LOOKUP)
+
+
+def policy_for(intents: List[str]) -> Optional[Tuple[float, int]]:
+    """Combined (threshold, ttl) for a question's intents, or None if uncacheable"""
+    policies = [INTENT_POLICIES.get(intent, INTENT_POLICIES['general_query']) for intent in intents or ['general_query']]
+    if any(policy is None for policy in policies):
+        return None
+    return max(threshold for threshold, _ in policies), min(ttl for _, ttl in policies)
+
+
+class HashingEmbedder:
+    """CPU embedding from hashed word and character n-grams (no model needed)"""
+    name = 'local'
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, normalized: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in normalized.split(' '):
+            if not word:
+                continue
+            vector[zlib.crc32(f'w:{word}'.encode()) % self.dim] += 2.0
+            padded = f' {word} '
+            for n in (2, 3):
+                for i in range(len(padded) - n + 1):
+                    vector[zlib.crc32(f'{n}:{padded[i:i + n]}'.encode()) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class GeminiEmbedder:
+    """Gemini text embeddings for semantic similarity"""
+    name = 'gemini'
+
+    def __init__(self, embed_content: Callable[..., Dict[str, Any]], model: str = EMBEDDING_MODEL):
+        self.embed_content = embed_content
+        self.model = model
+
+    def embed(self, normalized: str) -> np.ndarray:
+        result = self.embed_content(model=self.model, content=normalized, task_type='SEMANTIC_SIMILARITY')
+        vector = np.asarray(result['embedding'], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class _VectorIndex:
+    """Unit vectors in a growable matrix, searched by brute-force dot product"""
+
+    def __init__(self):
+        self.vectors: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def add(self, entry_id: str, vector: np.ndarray):
+        if self.vectors is None:
+            self.vectors = np.zeros((64, vector.size), dtype=np.float32)
+        elif len(self.ids) == self.vectors.shape[0]:
+            self.vectors = np.vstack([self.vectors, np.zeros_like(self.vectors)])
+        self._rows[entry_id] = len(self.ids)
+        self.vectors[len(self.ids)] = vector
+        self.ids.append(entry_id)
+
+    def remove(self, entry_id: str):
+        row = self._rows.pop(entry_id, None)
+        if row is None:
+            return
+        # Move the last row into the hole so the matrix stays dense
+        last = len(self.ids) - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = self.ids[last]
+            self._rows[self.ids[row]] = row
+        self.ids.pop()
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        if not self.ids:
+            return []
+        similarities = self.vectors[:len(self.ids)] @ vector
+        k = min(k, len(self.ids))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(self.ids[i], float(similarities[i])) for i in top]
+
+
+class SemanticChatCache:
+    """Reuse answers to paraphrased first questions"""
+
+    # Candidates checked against the intent/crop guards per lookup
+    CANDIDATES = 8
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, embedders: List[Any] = None):
+        self.max_entries = max_entries
+        self.embedders = embedders
+        # genai.embed_content of a configured SDK; without it only the local embedder is used
+        self.embed_content: Optional[Callable[..., Dict[str, Any]]] = None
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._exact: Dict[Tuple[str, FrozenSet[str]], str] = {}
+        self._indexes: Dict[str, _VectorIndex] = {}
+        # Embeddings computed during lookup, reused by the store that follows a miss
+        self._recent_embeddings: 'OrderedDict[Tuple[str, str], np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _embedders(self) -> List[Any]:
+        if self.embedders is not None:
+            return self.embedders
+        if self.embed_content is not None:
+            return [GeminiEmbedder(self.embed_content), HashingEmbedder()]
+        return [HashingEmbedder()]
+
+    def _embed(self, normalized: str) -> Optional[Tuple[str, np.ndarray]]:
+        """(embedder name, vector) from the first embedder that works"""
+        for embedder in self._embedders():
+            key = (embedder.name, normalized)
+            with self._lock:
+                vector = self._recent_embeddings.get(key)
+            if vector is not None:
+                return embedder.name, vector
+            try:
+                vector = embedder.embed(normalized)
+            except Exception as e:
+                logger.error("Chat cache embedding with %s failed: %s", embedder.name, e)
+                continue
+            with self._lock:
+                self._recent_embeddings[key] = vector
+                while len(self._recent_embeddings) > 256:
+                    self._recent_embeddings.popitem(last=False)
+            return embedder.name, vector
+        return None
+
+    def _evict(self, entry_id: str):
+        # Caller holds the lock
+        entry = self._entries.pop(entry_id, None)
+        if not entry:
+            return
+        if self._exact.get(entry['exact_key']) == entry_id:
+            del self._exact[entry['exact_key']]
+        index = self._indexes.get(entry['embedder'])
+        if index:
+            index.remove(entry_id)
+
+    def lookup(self, question: str, intents: List[str]) -> Optional[Dict[str, Any]]:
+        """Cached answer for a paraphrase of `question`, or None"""
+        if not ENABLED:
+            return None
+        policy = policy_for(intents)
+        if policy is None:
+            metrics.increment('chat_cache.lookup', outcome='uncacheable')
+            return None
+        threshold, _ = policy
+        normalized = normalize_question(question)
+        intent_set = frozenset(intents)
+        crops = mentioned_crops(normalized)
+        now = time.time()
+
+        with self._lock:
+            entry_id = self._exact.get((normalized, intent_set))
+            entry = self._entries.get(entry_id) if entry_id else None
+            if entry and entry['expires_at'] > now:
+                entry['hits'] += 1
+                self._entries.move_to_end(entry_id)
+                metrics.increment('chat_cache.lookup', outcome='exact')
+                return {'answer': entry['answer'], 'similarity': 1.0, 'match': 'exact'}
+
+        embedded = self._embed(normalized)
+        if embedded is None:
+            metrics.increment('chat_cache.lookup', outcome='miss')
+            return None
+        embedder, vector = embedded
+
+        with self._lock:
+            index = self._indexes.get(embedder)
+            for candidate_id, similarity in (index.search(vector, self.CANDIDATES) if index else []):
+                if similarity < threshold:
+                    break
+                entry = self._entries[candidate_id]
+                if entry['expires_at'] <= now:
+                    self._evict(candidate_id)
+                    continue
+                if entry['intents'] != intent_set or entry['crops'] != crops:
+                    continue
+                entry['hits'] += 1
+                self._entries.move_to_end(candidate_id)
+                metrics.increment('chat_cache.lookup', outcome='semantic')
+                return {'answer': entry['answer'], 'similarity': round(similarity, 4), 'match': 'semantic'}
+
+        metrics.increment('chat_cache.lookup', outcome='miss')
+        return None
+
+    def store(self, question: str, intents: List[str], answer: str):
+        """Remember the answer to a context-free first question"""
+        policy = policy_for(intents)
+        if not ENABLED or policy is None or not answer:
+            return
+        _, ttl = policy
+        normalized = normalize_question(question)
+        embedded = self._embed(normalized)
+        if embedded is None:
+            return
+        embedder, vector = embedded
+        intent_set = frozenset(intents)
+
+        with self._lock:
+            self._next_id += 1
+            entry_id = str(self._next_id)
+            exact_key = (normalized, intent_set)
+            if exact_key in self._exact:
+                self._evict(self._exact[exact_key])
+            self._entries[entry_id] = {
+                'question': normalized,
+                'answer': answer,
+                'intents': intent_set,
+                'crops': mentioned_crops(normalized),
+                'embedder': embedder,
+                'exact_key': exact_key,
+                'expires_at': time.time() + ttl,
+                'hits': 0,
+            }
+            self._exact[exact_key] = entry_id
+            self._indexes.setdefault(embedder, _VectorIndex()).add(entry_id, vector)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'indexes': {name: len(index.ids) for name, index in self._indexes.items()},
+            }
+
+
+def is_context_free(conversation_context: str, field_context: Optional[str]) -> bool:
+    """Only first turns without per-user field data may share answers"""
+    return not conversation_context and not field_context
+
+
+# Shared cache used by the API process
+cache = SemanticChatCache()
@@ -0,0 +1,184 @@
+"""
+Rolling summaries of long chat sessions.
+
+chat() used to send every previous message it was given, so the prompt, and
+with it latency and cost, grew with the length of the conversation. Now
+each session keeps a running summary in the chat_summaries collection,
+together with the timestamp of the last message folded into it. A prompt
+is the summary plus the messages after that point (see
+prompts.build_history), which stays roughly constant in size however long
+the session runs.
+
+Summaries are refreshed incrementally in the background. Once
+CHAT_SUMMARY_EVERY messages have piled up beyond the CHAT_SUMMARY_KEEP most
+recent ones, a worker asks Gemini to merge them into the existing summary.
+The chat request never waits for it. Until a refresh lands, the extra
+messages still reach the prompt through build_history's extractive
+fallback.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from queue import Queue, Full
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import metrics
+import prompts
+import chat_writes
+from firebase_models import ChatHistory, ChatSummary
+
+logger = logging.getLogger(__name__)
+
+# Most recent messages that are never folded into the summary
+KEEP_MESSAGES = int(os.environ.get('CHAT_SUMMARY_KEEP', '4'))
+# Refresh once this many older messages are waiting to be folded in
+REFRESH_EVERY = int(os.environ.get('CHAT_SUMMARY_EVERY', '8'))
+MAX_QUEUE = int(os.environ.get('CHAT_SUMMARY_MAX_QUEUE', '100'))
+# Summaries of this many sessions are kept in process
+CACHE_SIZE = int(os.environ.get('CHAT_SUMMARY_CACHE_SIZE', '1000'))
+
+# Target length, chosen to leave part of the history preface for the
+# questions asked since the last refresh
+SUMMARY_MAX_WORDS = 120
+
+
+class ConversationSummarizer:
+    """Per-session running summaries refreshed by a background worker"""
+
+    def __init__(self, keep: int = KEEP_MESSAGES, every: int = REFRESH_EVERY, max_queue: int = MAX_QUEUE):
+        self.keep = keep
+        self.every = every
+        self.generate: Optional[Callable[[str], Optional[str]]] = None
+        self._queue: 'Queue[Tuple[str, str]]' = Queue(maxsize=max_queue)
+        self._pending = set()
+        self._summaries: 'OrderedDict[str, Optional[Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, generate: Callable[[str], Optional[str]]):
+        """
+        Register the model call and start the worker (idempotent).
+
+        generate receives the rendered chat_summary prompt and returns the
+        new summary text, or None if no model is available.
+        """
+        self.generate = generate
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._work, name='chat-summary-worker', daemon=True)
+        self._thread.start()
+
+    def _get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if doc_id in self._summaries:
+                self._summaries.move_to_end(doc_id)
+                return self._summaries[doc_id]
+        summary = ChatSummary.get(doc_id)
+        self._remember(doc_id, summary)
+        return summary
+
+    def _remember(self, doc_id: str, summary: Optional[Dict[str, Any]]):
+        with self._lock:
+            self._summaries[doc_id] = summary
+            self._summaries.move_to_end(doc_id)
+            while len(self._summaries) > CACHE_SIZE:
+                self._summaries.popitem(last=False)
+
+    def context(self, user_id: str, session_id: str, previous: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Summary and not-yet-summarized messages for the next prompt.
+
+        previous is the session's earlier messages, oldest first. Schedules
+        a refresh when enough messages are waiting. Returns {'summary':
+        text or None, 'messages': [...]}.
+        """
+        try:
+            summary = self._get(ChatSummary.summary_id(user_id, session_id))
+        except Exception as e:
+            logger.error("Error loading chat summary: %s", e)
+            summary = None
+
+        through = (summary or {}).get('summarized_through') or ''
+        messages = [entry for entry in previous if (entry.get('timestamp') or '') > through]
+        if len(messages) - self.keep >= self.every:
+            self.schedule(user_id, session_id)
+        return {'summary': (summary or {}).get('summary'), 'messages': messages}
+
+    def schedule(self, user_id: str, session_id: str) -> bool:
+        """Queue a refresh unless one is already pending for the session"""
+        key = (user_id, session_id)
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait(key)
+            except Full:
+                metrics.increment('chat_summary.dropped')
+                return False
+            self._pending.add(key)
+        metrics.increment('chat_summary.scheduled')
+        return True
+
+    def _work(self):
+        while True:
+            key = self._queue.get()
+            try:
+                self.refresh(*key)
+            except Exception as e:
+                metrics.increment('chat_summary.refreshed', outcome='error')
+                logger.error("Error refreshing chat summary for session %s: %s", key[1], e)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def refresh(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """Fold every message but the most recent keep into the session summary"""
+        if not self.generate:
+            return None
+        doc_id = ChatSummary.summary_id(user_id, session_id)
+        # Read through to Firestore: another process may have refreshed already
+        current = ChatSummary.get(doc_id) or {}
+        through = current.get('summarized_through') or ''
+
+        history = chat_writes.writer.merge(ChatHistory.get_by_user_and_session(user_id, session_id),
+                                           user_id, session_id)
+        history.sort(key=lambda entry: entry.get('timestamp', ''))
+        pending = [entry for entry in history if (entry.get('timestamp') or '') > through]
+        fold = pending[:-self.keep] if self.keep else pending
+        if not fold:
+            return current or None
+
+        lines = []
+        for entry in fold:
+            role = prompts.USER_ROLE if entry.get('sender') == 'user' else prompts.ASSISTANT_ROLE
+            lines.append(f"{role}: {prompts.clip_to_tokens(entry.get('message', ''), prompts.CHAT_MESSAGE_MAX_TOKENS)}")
+        prompt = prompts.CHAT_SUMMARY.render(
+            max_words=SUMMARY_MAX_WORDS,
+            summary=current.get('summary') or '-',
+            messages="\n".join(lines)
+        )
+
+        text = self.generate(prompt)
+        if not text or not text.strip():
+            metrics.increment('chat_summary.refreshed', outcome='empty')
+            return current or None
+
+        summary = {
+            'id': doc_id,
+            'user_id': user_id,
+            'session_id': session_id,
+            'summary': prompts.clip_to_tokens(text.strip(), prompts.HISTORY_SUMMARY_BUDGET),
+            'summarized_through': fold[-1].get('timestamp'),
+            'summarized_messages': current.get('summarized_messages', 0) + len(fold),
+        }
+        if current.get('created_at'):
+            summary['created_at'] = current['created_at']
+        ChatSummary.create(summary)
+        self._remember(doc_id, summary)
+        metrics.increment('chat_summary.refreshed', outcome='ok')
+        return summary
+
+
+# Shared summarizer used by the API process
+summarizer = ConversationSummarizer()
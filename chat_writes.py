@@ -0,0 +1,257 @@
+"""
+Write-behind persistence for chat messages.
+
+chat() used to wait on a Firestore write for the farmer's message before
+calling Gemini, and on another for the reply before responding. Now
+messages are appended to a local log (CHAT_WAL_PATH, fsynced by default)
+and handed to a single flusher thread. The flusher writes them to the
+chat_history collection in batched commits every CHAT_FLUSH_INTERVAL
+seconds, or sooner once CHAT_FLUSH_BATCH messages are waiting.
+
+- Ordering: one flusher writes in append order, and timestamps are made
+  strictly increasing per session, so history sorts the way it was written.
+- Read-your-writes: readers merge the still-buffered messages of a session
+  into what Firestore returned (merge()), so the next turn's context fetch
+  sees the previous turn even before it is flushed. The session list does
+  the same (merge_sessions()), so a new conversation shows up at once.
+- Crash guard: on startup, messages still in the log are replayed. Document
+  IDs are assigned at append time, so a replay overwrites rather than
+  duplicates anything that was already written.
+
+updated_at is stamped at flush time, not append time, so sync clients
+polling changed_since() never miss a message that landed late.
+
+Read-your-writes holds within one process. Other workers see a message once
+it is flushed, normally well before the farmer sends the next one. Each
+gunicorn worker logs to its own file (worker_wal_path), keyed by a slot that
+a replacement worker inherits, so a crashed worker's log is replayed by the
+one that takes its place. Set CHAT_WRITE_BEHIND=0 to write synchronously.
+"""
+import os
+import logging
+import json
+import time
+import atexit
+import datetime
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+from firebase_models import ChatHistory, generate_id
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('CHAT_WRITE_BEHIND', '1') == '1'
+WAL_PATH = os.environ.get('CHAT_WAL_PATH', os.path.join('data', 'chat_wal.jsonl'))
+WAL_FSYNC = os.environ.get('CHAT_WAL_FSYNC', '1') == '1'
+FLUSH_INTERVAL = float(os.environ.get('CHAT_FLUSH_INTERVAL', '0.2'))
+FLUSH_BATCH = int(os.environ.get('CHAT_FLUSH_BATCH', '100'))
+
+# Failed flushes are retried with exponential backoff up to this delay
+MAX_RETRY_DELAY = 30.0
+
+
+def _session_key(message: Dict[str, Any]) -> Tuple[str, str]:
+    return message.get('user_id'), message.get('session_id')
+
+
+def _next_timestamp(timestamp: str, last: Optional[str]) -> str:
+    """timestamp, pushed past last by a microsecond if it would not sort after it"""
+    if not last or timestamp > last:
+        return timestamp
+    try:
+        bumped = datetime.datetime.fromisoformat(last) + datetime.timedelta(microseconds=1)
+    except ValueError:
+        return timestamp
+    return bumped.isoformat(timespec='microseconds')
+
+
+def worker_wal_path(slot: int, path: str = WAL_PATH) -> str:
+    """Log of one server worker; slot 0 keeps the single-process path"""
+    if not slot:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{slot}{ext}"
+
+
+class ChatWriteBehind:
+    """Buffered, logged, batched chat_history writes"""
+
+    def __init__(self, wal_path: str = WAL_PATH, flush_interval: float = FLUSH_INTERVAL,
+                 batch_size: int = FLUSH_BATCH, enabled: bool = ENABLED):
+        self.wal_path = wal_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enabled = enabled
+        self._pending: List[Dict[str, Any]] = []
+        # Buffered messages per (user_id, session_id), for read-your-writes
+        self._sessions: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._last_timestamp: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._wal = None
+        self._thread = None
+
+    def start(self):
+        """Replay the log from a previous run and start the flusher (idempotent)"""
+        if not self.enabled or self._thread:
+            return
+        self._replay()
+        self._thread = threading.Thread(target=self._work, name='chat-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _replay(self):
+        if not os.path.exists(self.wal_path):
+            return
+        messages = []
+        with open(self.wal_path, encoding='utf-8') as wal:
+            for line in wal:
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-append
+                    continue
+        with self._lock:
+            for message in messages:
+                self._buffer_locked(message)
+        if messages:
+            logger.info("Replaying %s buffered chat messages from %s", len(messages), self.wal_path)
+            self._wake.set()
+
+    def _open_wal(self):
+        if self._wal is None:
+            os.makedirs(os.path.dirname(self.wal_path) or '.', exist_ok=True)
+            self._wal = open(self.wal_path, 'a', encoding='utf-8')
+        return self._wal
+
+    def _buffer_locked(self, message: Dict[str, Any]):
+        self._pending.append(message)
+        key = _session_key(message)
+        self._sessions.setdefault(key, []).append(message)
+        self._last_timestamp[key] = max(self._last_timestamp.get(key, ''), message.get('timestamp') or '')
+
+    def append(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Accept a chat message for persistence; returns it with its final id and timestamp"""
+        now = datetime.datetime.utcnow().isoformat()
+        message.setdefault('id', generate_id())
+        message.setdefault('created_at', now)
+        message.setdefault('timestamp', now)
+
+        if not self.enabled:
+            return ChatHistory.create(message)
+
+        with self._lock:
+            key = _session_key(message)
+            message['timestamp'] = _next_timestamp(message['timestamp'], self._last_timestamp.get(key))
+            wal = self._open_wal()
+            wal.write(json.dumps(message, ensure_ascii=False, default=str) + '\n')
+            wal.flush()
+            if WAL_FSYNC:
+                os.fsync(wal.fileno())
+            self._buffer_locked(message)
+            full = len(self._pending) >= self.batch_size
+        metrics.increment('chat_writes.buffered')
+        if full:
+            self._wake.set()
+        return message
+
+    def pending(self, user_id: str, session_id: str = None) -> List[Dict[str, Any]]:
+        """Buffered messages of a session (or of all the user's sessions)"""
+        with self._lock:
+            if session_id is not None:
+                return list(self._sessions.get((user_id, session_id), []))
+            return [message for (owner, _), messages in self._sessions.items() if owner == user_id
+                    for message in messages]
+
+    def merge(self, stored: List[Dict[str, Any]], user_id: str, session_id: str = None) -> List[Dict[str, Any]]:
+        """Add buffered messages missing from a datastore read, sorted by timestamp"""
+        buffered = self.pending(user_id, session_id)
+        if not buffered:
+            return stored
+        seen = {message.get('id') for message in stored}
+        merged = stored + [dict(message) for message in buffered if message['id'] not in seen]
+        merged.sort(key=lambda message: message.get('timestamp', ''))
+        return merged
+
+    def merge_sessions(self, stored: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+        """Update a ChatHistory.get_sessions() result with the user's buffered messages"""
+        buffered = self.pending(user_id)
+        if not buffered:
+            return stored
+        sessions = {session['session_id']: dict(session) for session in stored}
+        for message in buffered:
+            session_id = message.get('session_id')
+            session = sessions.get(session_id)
+            if session is None or message.get('timestamp', '') > (session.get('timestamp') or ''):
+                sessions[session_id] = {
+                    'session_id': session_id,
+                    'timestamp': message.get('timestamp', ''),
+                    'last_message': message.get('message', ''),
+                }
+        return sorted(sessions.values(), key=lambda session: session['timestamp'] or '', reverse=True)
+
+    def _work(self):
+        delay = self.flush_interval
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self.flush() < 0:
+                delay = min(max(delay, self.flush_interval) * 2, MAX_RETRY_DELAY)
+            else:
+                delay = self.flush_interval
+
+    def flush(self) -> int:
+        """Write every buffered message; returns how many, or -1 if the write failed"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+
+            now = datetime.datetime.utcnow().isoformat()
+            documents = [dict(message, updated_at=now) for message in batch]
+            started = time.perf_counter()
+            try:
+                ChatHistory.create_many(documents)
+            except Exception as e:
+                metrics.increment('chat_writes.flush', outcome='error')
+                logger.error("Error flushing %s chat messages: %s", len(batch), e)
+                return -1
+            metrics.increment('chat_writes.flush', outcome='ok')
+            metrics.increment('chat_writes.flushed', len(batch))
+            metrics.increment('chat_writes.flush_ms', int((time.perf_counter() - started) * 1000))
+
+            with self._lock:
+                flushed = {id(message) for message in batch}
+                self._pending = [message for message in self._pending if id(message) not in flushed]
+                for key in {_session_key(message) for message in batch}:
+                    remaining = [message for message in self._sessions.get(key, []) if id(message) not in flushed]
+                    if remaining:
+                        self._sessions[key] = remaining
+                    else:
+                        self._sessions.pop(key, None)
+                        self._last_timestamp.pop(key, None)
+                self._rewrite_wal_locked()
+            return len(batch)
+
+    def _rewrite_wal_locked(self):
+        """Shrink the log to the messages still buffered"""
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        if not self._pending:
+            open(self.wal_path, 'w').close()
+            return
+        tmp_path = self.wal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as tmp:
+            for message in self._pending:
+                tmp.write(json.dumps(message, ensure_ascii=False, default=str) + '\n')
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self.wal_path)
+
+
+# Shared writer used by the API process
+writer = ChatWriteBehind()
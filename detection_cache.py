@@ -0,0 +1,179 @@
+"""
+Result cache for Gemini disease detection.
+
+Farmers often re-upload the same photo (and the Node proxy forwards every
+retry), so parsed detection results are cached by a SHA-256 of the
+preprocessed image bytes plus the crop type. Exact repeats are answered from
+an in-process LRU, falling back to the shared detection_cache collection so
+every worker benefits.
+
+Optionally, near-duplicates (the same leaf re-photographed, re-compressed or
+slightly re-cropped) are matched by the 64-bit dHash of the image: an entry
+for the same crop within DISEASE_CACHE_NEAR_DUPLICATE_DISTANCE bits is
+reused. The distance defaults to 0, which disables near-duplicate matching.
+"""
+import os
+import logging
+import time
+import hashlib
+import threading
+import datetime
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from firebase_models import DetectionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt or parsing changes so old results are not reused
+CACHE_VERSION = '2'
+
+# Fields of a parsed detection that are cached
+RESULT_FIELDS = ('disease_name', 'disease_code', 'confidence', 'symptoms', 'treatment')
+
+MAX_ENTRIES = int(os.environ.get('DISEASE_CACHE_MAX_ENTRIES', '5000'))
+TTL_SECONDS = int(os.environ.get('DISEASE_CACHE_TTL', str(30 * 24 * 3600)))
+
+# Max Hamming distance between dHashes for a near-duplicate hit (0 = off);
+# 4-6 catches recompressed and resized copies of the same photo
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get('DISEASE_CACHE_NEAR_DUPLICATE_DISTANCE', '0'))
+
+EXACT = 'exact'
+NEAR_DUPLICATE = 'near_duplicate'
+
+
+def content_key(image_bytes: bytes, crop_type: str) -> str:
+    """Cache key for preprocessed image bytes and crop type"""
+    digest = hashlib.sha256()
+    digest.update(CACHE_VERSION.encode())
+    digest.update(b'\x00')
+    digest.update((crop_type or 'unknown').strip().lower().encode())
+    digest.update(b'\x00')
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class DetectionCache:
+    """Two-level (process LRU + Firestore) cache of parsed detection results"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: int = TTL_SECONDS,
+                 near_duplicate_distance: int = NEAR_DUPLICATE_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicate_distance = near_duplicate_distance
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = {EXACT: 0, NEAR_DUPLICATE: 0}
+        self.misses = 0
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get('cached_at', 0) > self.ttl
+
+    def _remember(self, entry: Dict[str, Any]):
+        # Caller holds the lock
+        self._entries[entry['id']] = entry
+        self._entries.move_to_end(entry['id'])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _ensure_loaded(self):
+        """Seed the near-duplicate index with the most recent shared entries"""
+        if self._loaded or not self.near_duplicate_distance:
+            return
+        self._loaded = True
+        try:
+            recent = DetectionCacheEntry.get_recent(self.max_entries)
+        except Exception as e:
+            logger.error("Error loading detection cache: %s", e)
+            return
+        with self._lock:
+            for entry in reversed(recent):
+                if entry.get('version') == CACHE_VERSION and not self._expired(entry):
+                    self._remember(entry)
+
+    def lookup(self, image_bytes: bytes, crop_type: str,
+               image_dhash: Optional[int] = None) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Return (cached result, 'exact' | 'near_duplicate') or None"""
+        key = content_key(image_bytes, crop_type)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.hits[EXACT] += 1
+                return self._result(entry), EXACT
+
+        try:
+            entry = DetectionCacheEntry.get(key)
+        except Exception as e:
+            logger.error("Error reading detection cache: %s", e)
+            entry = None
+        if entry and entry.get('version') == CACHE_VERSION and not self._expired(entry):
+            with self._lock:
+                self._remember(entry)
+                self.hits[EXACT] += 1
+            return self._result(entry), EXACT
+
+        if self.near_duplicate_distance and image_dhash is not None:
+            self._ensure_loaded()
+            match = self._nearest(crop_type, image_dhash)
+            if match:
+                with self._lock:
+                    self.hits[NEAR_DUPLICATE] += 1
+                return self._result(match), NEAR_DUPLICATE
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _nearest(self, crop_type: str, image_dhash: int) -> Optional[Dict[str, Any]]:
+        """Closest same-crop entry within the Hamming threshold"""
+        crop = (crop_type or 'unknown').strip().lower()
+        best, best_distance = None, self.near_duplicate_distance + 1
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.get('crop_type') != crop or not entry.get('dhash') or self._expired(entry):
+                    continue
+                distance = hamming_distance(image_dhash, int(entry['dhash'], 16))
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+                    if distance == 0:
+                        break
+        return best
+
+    def store(self, image_bytes: bytes, crop_type: str, result: Dict[str, Any],
+              image_dhash: Optional[int] = None):
+        """Cache a parsed detection result"""
+        entry = {field: result.get(field) for field in RESULT_FIELDS}
+        entry.update({
+            'id': content_key(image_bytes, crop_type),
+            'crop_type': (crop_type or 'unknown').strip().lower(),
+            # Firestore integers are signed 64-bit, so keep the hash as hex
+            'dhash': format(image_dhash, '016x') if image_dhash is not None else None,
+            'version': CACHE_VERSION,
+            'cached_at': time.time(),
+            'created_at': datetime.datetime.utcnow().isoformat(),
+        })
+        with self._lock:
+            self._remember(entry)
+        try:
+            DetectionCacheEntry.create(dict(entry))
+        except Exception as e:
+            logger.error("Error writing detection cache: %s", e)
+
+    @staticmethod
+    def _result(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {field: entry.get(field) for field in RESULT_FIELDS}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': dict(self.hits), 'misses': self.misses}
+
+
+# Shared cache used by the API process
+cache = DetectionCache()
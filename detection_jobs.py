@@ -0,0 +1,387 @@
+"""
+Asynchronous disease detection jobs.
+
+In job mode /api/disease_detect only saves the upload and enqueues a job, so
+the HTTP worker is released before the Gemini call. A bounded pool of worker
+threads runs detection; clients follow progress through the status endpoint,
+a Server-Sent Events stream, or an optional webhook called on completion.
+
+Backpressure: when DISEASE_JOB_MAX_QUEUE jobs are already waiting the submit
+is rejected with 503 (Retry-After), and a single user may have at most
+DISEASE_JOB_MAX_PER_USER unfinished jobs (429). Failed attempts caused by
+transient errors (exceptions or 5xx results) are retried with exponential
+backoff up to DISEASE_JOB_MAX_ATTEMPTS times.
+
+Job state is kept in process and written through to the detection_jobs
+collection, so a status request served by another worker process still sees it.
+
+Every unfinished job holds a lease (DISEASE_JOB_LEASE seconds) that its
+process renews while it works on it. A deploy, worker recycle or crash stops
+the renewals. Any process's queue then claims the job once the lease runs
+out, at start() and periodically after that. The claim is transactional, so
+only one process takes the job. The job is queued again, or failed if its
+last attempt was the one interrupted.
+
+Webhooks are delivered by their own small thread pool, so a slow or dead
+callback never holds a detection worker. Callback URLs must resolve to
+public addresses only: private, loopback, link-local and other non-global
+ranges are rejected when the job is submitted and again before every
+delivery, and redirects are not followed. DISEASE_JOB_WEBHOOK_HOSTS is an
+optional comma-separated allowlist. When it is set, only those hosts (and
+their subdomains) are accepted, and they skip the address check.
+"""
+import os
+import socket
+import logging
+import ipaddress
+import threading
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full
+from typing import Callable, Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from firebase_models import DetectionJob, generate_id
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('DISEASE_JOB_WORKERS', '2'))
+MAX_QUEUE = int(os.environ.get('DISEASE_JOB_MAX_QUEUE', '50'))
+MAX_PER_USER = int(os.environ.get('DISEASE_JOB_MAX_PER_USER', '5'))
+MAX_ATTEMPTS = int(os.environ.get('DISEASE_JOB_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.environ.get('DISEASE_JOB_RETRY_DELAY', '2'))
+
+# Lease on an unfinished job; renewed every third of it by its process
+LEASE_SECONDS = int(os.environ.get('DISEASE_JOB_LEASE', '120'))
+
+# Finished jobs stay in memory this long for status and SSE requests
+RESULT_TTL = int(os.environ.get('DISEASE_JOB_RESULT_TTL', '3600'))
+
+WEBHOOK_TIMEOUT = 10
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_WORKERS = int(os.environ.get('DISEASE_JOB_WEBHOOK_WORKERS', '2'))
+WEBHOOK_ALLOWED_HOSTS = [host.strip().lower() for host in
+                         os.environ.get('DISEASE_JOB_WEBHOOK_HOSTS', '').split(',') if host.strip()]
+
+QUEUED = 'queued'
+RUNNING = 'running'
+RETRYING = 'retrying'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TERMINAL_STATES = (SUCCEEDED, FAILED)
+
+# Fields returned to clients (payload and callback URL stay server-side)
+PUBLIC_FIELDS = ('id', 'status', 'attempts', 'max_attempts', 'result', 'error',
+                 'created_at', 'started_at', 'finished_at', 'updated_at')
+
+
+class QueueFull(Exception):
+    """Raised when a job cannot be accepted right now"""
+    status = 503
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TooManyJobs(QueueFull):
+    """Raised when a user already has the maximum number of unfinished jobs"""
+    status = 429
+
+
+class _RetryableError(Exception):
+    pass
+
+
+def check_callback_url(url: str):
+    """Raise ValueError unless the URL is http(s) and may be called from this server"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('callback_url must be an http(s) URL')
+    host = parsed.hostname.lower()
+    if WEBHOOK_ALLOWED_HOSTS:
+        if not any(host == allowed or host.endswith('.' + allowed) for allowed in WEBHOOK_ALLOWED_HOSTS):
+            raise ValueError('callback_url host is not allowed')
+        return
+
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, ValueError):
+        raise ValueError('callback_url host cannot be resolved')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError('callback_url must point to a public address')
+
+
+def _lease_expiry() -> str:
+    return (datetime.datetime.utcnow() + datetime.timedelta(seconds=LEASE_SECONDS)).isoformat()
+
+
+def public_view(job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if job is None:
+        return None
+    return {field: job.get(field) for field in PUBLIC_FIELDS}
+
+
+class DetectionJobQueue:
+    """Bounded job queue with a fixed pool of worker threads, recovering jobs of stopped processes"""
+
+    def __init__(self, workers: int = WORKERS, max_queue: int = MAX_QUEUE,
+                 max_per_user: int = MAX_PER_USER, max_attempts: int = MAX_ATTEMPTS):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.max_attempts = max_attempts
+        self.handler: Optional[Callable[..., Tuple[Dict[str, Any], int]]] = None
+        self._queue: 'Queue[str]' = Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+        # Identifies this process's claims on jobs
+        self.owner = generate_id()
+        self._webhooks = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix='disease-job-webhook')
+
+    def start(self, handler: Callable[..., Tuple[Dict[str, Any], int]]):
+        """
+        Register the detection handler and start the workers (idempotent).
+
+        The handler is called with the job payload as keyword arguments and
+        returns (result, status_code).
+        """
+        self.handler = handler
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'disease-job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain_leases, name='disease-job-leases', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, payload: Dict[str, Any], user_id: str = None, callback_url: str = None) -> Dict[str, Any]:
+        """Accept a job or raise QueueFull / TooManyJobs / ValueError"""
+        if callback_url:
+            check_callback_url(callback_url)
+
+        now = datetime.datetime.utcnow().isoformat()
+        job = {
+            'id': generate_id(),
+            'user_id': user_id,
+            'status': QUEUED,
+            'payload': payload,
+            'callback_url': callback_url,
+            'attempts': 0,
+            'max_attempts': self.max_attempts,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'owner': self.owner,
+            'lease_expires_at': _lease_expiry(),
+        }
+
+        with self._lock:
+            self._prune_locked()
+            owner = user_id or ''
+            if user_id and self._in_flight.get(owner, 0) >= self.max_per_user:
+                raise TooManyJobs(f'Too many detection jobs in progress (max {self.max_per_user})', retry_after=10)
+            try:
+                self._queue.put_nowait(job['id'])
+            except Full:
+                raise QueueFull('Disease detection queue is full, please retry shortly')
+            self._jobs[job['id']] = job
+            self._in_flight[owner] = self._in_flight.get(owner, 0) + 1
+
+        self._persist(job, create=True)
+        return public_view(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Public view of a job, from memory or the shared collection"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return public_view(job)
+        try:
+            return public_view(DetectionJob.get(job_id))
+        except Exception as e:
+            logger.error("Error reading detection job %s: %s", job_id, e)
+            return None
+
+    def wait_for_change(self, job_id: str, updated_at: Optional[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Block until a job's updated_at moves past the one the caller has seen,
+        or the timeout expires, and return its public view.
+
+        Local jobs wake on the condition variable; jobs owned by another
+        process are re-read from the shared collection after a short sleep.
+        """
+        with self._changed:
+            if job_id in self._jobs:
+                self._changed.wait_for(
+                    lambda: job_id not in self._jobs or self._jobs[job_id]['updated_at'] != updated_at, timeout)
+                job = self._jobs.get(job_id)
+                if job:
+                    return public_view(job)
+        time.sleep(min(timeout, 2.0))
+        return self.get(job_id)
+
+    def _update(self, job: Dict[str, Any], **changes):
+        with self._changed:
+            was_finished = job['status'] in TERMINAL_STATES
+            job.update(changes)
+            job['updated_at'] = datetime.datetime.utcnow().isoformat()
+            job['lease_expires_at'] = None if job['status'] in TERMINAL_STATES else _lease_expiry()
+            if job['status'] in TERMINAL_STATES and not was_finished:
+                owner = job['user_id'] or ''
+                self._in_flight[owner] = max(0, self._in_flight.get(owner, 0) - 1)
+            self._changed.notify_all()
+        self._persist(job)
+
+    def _persist(self, job: Dict[str, Any], create: bool = False):
+        try:
+            if create:
+                DetectionJob.create(dict(job))
+            else:
+                DetectionJob.update(job['id'], dict(job))
+        except Exception as e:
+            logger.error("Error saving detection job %s: %s", job['id'], e)
+
+    def _maintain_leases(self):
+        while True:
+            try:
+                self._renew_leases()
+                self._recover_expired()
+            except Exception as e:
+                logger.error("Error maintaining disease job leases: %s", e)
+            time.sleep(LEASE_SECONDS / 3)
+
+    def _renew_leases(self):
+        expiry = _lease_expiry()
+        with self._lock:
+            job_ids = [job_id for job_id, job in self._jobs.items() if job['status'] not in TERMINAL_STATES]
+            for job_id in job_ids:
+                self._jobs[job_id]['lease_expires_at'] = expiry
+        if job_ids:
+            DetectionJob.renew_leases(job_ids, expiry)
+
+    def _recover_expired(self):
+        """Claim unfinished jobs whose process stopped renewing their lease"""
+        now = datetime.datetime.utcnow().isoformat()
+        for stored in DetectionJob.expired(now, limit=self._queue.maxsize or None):
+            if self._queue.full():
+                break
+            with self._lock:
+                if stored['id'] in self._jobs:
+                    continue
+            job = DetectionJob.claim(stored['id'], self.owner, _lease_expiry(), now)
+            if not job:
+                continue
+            logger.warning("Recovering disease job %s left %s by a stopped worker", job['id'], job['status'])
+            with self._lock:
+                self._jobs[job['id']] = job
+                owner = job.get('user_id') or ''
+                self._in_flight[owner] = self._in_flight.get(owner, 0) + 1
+            if job.get('attempts', 0) >= self.max_attempts:
+                self._finish(job, FAILED, error='Detection worker stopped before the job finished')
+            else:
+                self._update(job, status=QUEUED)
+                self._enqueue(job)
+
+    def _enqueue(self, job: Dict[str, Any]):
+        """Queue a retried or recovered job, failing it if the queue has no room"""
+        try:
+            self._queue.put_nowait(job['id'])
+        except Full:
+            logger.warning("Disease job %s dropped: queue is full", job['id'])
+            self._finish(job, FAILED, error='Disease detection queue is full, please resubmit')
+
+    def _prune_locked(self):
+        cutoff = (datetime.datetime.utcnow() - datetime.timedelta(seconds=RESULT_TTL)).isoformat()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in TERMINAL_STATES and job['finished_at'] < cutoff]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                if job:
+                    self._run(job)
+            except Exception as e:
+                logger.error("Error in disease job worker: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Dict[str, Any]):
+        attempt = job['attempts'] + 1
+        self._update(job, status=RUNNING, attempts=attempt,
+                     started_at=job['started_at'] or datetime.datetime.utcnow().isoformat())
+        try:
+            result, status = self.handler(**job['payload'])
+            if status >= 500:
+                raise _RetryableError(result.get('error', f'Detection failed with status {status}'))
+        except Exception as e:
+            if attempt < self.max_attempts:
+                delay = RETRY_BASE_DELAY * (2 ** (attempt - 1))
+                logger.warning("Disease job %s attempt %s failed (%s), retrying in %.0fs",
+                               job['id'], attempt, e, delay)
+                self._update(job, status=RETRYING, error=str(e))
+                timer = threading.Timer(delay, self._enqueue, args=(job,))
+                timer.daemon = True
+                timer.start()
+                return
+            self._finish(job, FAILED, error=str(e))
+            return
+
+        if status >= 400:
+            # Client errors (e.g. an unreadable image) will not succeed on retry
+            self._finish(job, FAILED, error=result.get('error'))
+        else:
+            self._finish(job, SUCCEEDED, result=result, error=None)
+
+    def _finish(self, job: Dict[str, Any], status: str, **changes):
+        self._update(job, status=status, finished_at=datetime.datetime.utcnow().isoformat(), **changes)
+        if job.get('callback_url'):
+            self._webhooks.submit(self._call_webhook, job)
+
+    def _call_webhook(self, job: Dict[str, Any], attempt: int = 0):
+        """POST the finished job to its callback URL; transient failures are retried on a timer"""
+        try:
+            # Checked again at delivery: the host may resolve differently by now
+            check_callback_url(job['callback_url'])
+        except ValueError as e:
+            logger.warning("Webhook for disease job %s rejected: %s", job['id'], e)
+            self._update(job, webhook_status='rejected')
+            return
+        try:
+            response = requests.post(job['callback_url'], json=public_view(job), timeout=WEBHOOK_TIMEOUT,
+                                     allow_redirects=False)
+            if response.status_code < 500:
+                self._update(job, webhook_status=response.status_code)
+                return
+        except requests.RequestException as e:
+            logger.error("Webhook for disease job %s failed: %s", job['id'], e)
+        if attempt + 1 < WEBHOOK_ATTEMPTS:
+            timer = threading.Timer(RETRY_BASE_DELAY * (2 ** attempt), self._webhooks.submit,
+                                    args=(self._call_webhook, job, attempt + 1))
+            timer.daemon = True
+            timer.start()
+            return
+        self._update(job, webhook_status='failed')
+
+
+# Shared queue used by the API process
+queue = DetectionJobQueue()
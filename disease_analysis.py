@@ -0,0 +1,212 @@
+"""
+Structured Gemini output for disease detection.
+
+The vision model is asked (prompts.DISEASE_ANALYSIS) for JSON constrained
+by RESPONSE_SCHEMA (response_mime_type=application/json), and the answer
+is parsed and validated in one pass. Disease names are mapped onto a canonical vocabulary
+so "early blight (Alternaria solani)", "Alternaria leaf spot" and
+"EARLY BLIGHT" are all reported as "Early Blight".
+
+Every parse is counted in metrics under 'disease_analysis.parse' with an
+outcome label (ok, invalid_json, invalid_schema), so format drift shows up
+as a failure rate instead of silently degraded results.
+"""
+import logging
+import re
+import json
+import difflib
+import unicodedata
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'disease_name': {'type': 'string'},
+        'pathogen': {'type': 'string'},
+        'confidence': {'type': 'number'},
+        'symptoms': {'type': 'array', 'items': {'type': 'string'}},
+        'treatments': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['disease_name', 'confidence', 'symptoms', 'treatments'],
+}
+
+GENERATION_CONFIG = {
+    'temperature': 0.2,
+    'response_mime_type': 'application/json',
+    'response_schema': RESPONSE_SCHEMA,
+}
+
+# Canonical disease names and the aliases/pathogens models commonly use for them
+DISEASE_VOCABULARY = {
+    'Healthy': ['no disease', 'healthy plant', 'none', 'no disease detected'],
+    'Rice Blast': ['blast', 'leaf blast', 'neck blast', 'magnaporthe oryzae', 'pyricularia oryzae'],
+    'Brown Spot': ['rice brown spot', 'bipolaris oryzae', 'helminthosporium oryzae', 'cochliobolus miyabeanus'],
+    'Bacterial Leaf Blight': ['bacterial blight', 'blb', 'xanthomonas oryzae', 'rice bacterial blight'],
+    'Sheath Blight': ['rhizoctonia solani', 'rice sheath blight'],
+    'Wheat Rust': ['rust'],
+    'Leaf Rust': ['brown rust', 'puccinia triticina', 'wheat leaf rust'],
+    'Stripe Rust': ['yellow rust', 'puccinia striiformis', 'wheat stripe rust'],
+    'Stem Rust': ['black rust', 'puccinia graminis', 'wheat stem rust'],
+    'Powdery Mildew': ['blumeria graminis', 'erysiphe', 'oidium'],
+    'Downy Mildew': ['peronospora', 'plasmopara', 'sclerospora'],
+    'Septoria Leaf Spot': ['septoria', 'septoria tritici blotch', 'septoria lycopersici'],
+    'Cotton Boll Rot': ['boll rot'],
+    'Verticillium Wilt': ['verticillium dahliae', 'verticillium'],
+    'Fusarium Wilt': ['fusarium oxysporum', 'fusarium', 'panama disease'],
+    'Target Spot': ['corynespora cassiicola'],
+    'Early Blight': ['alternaria solani', 'alternaria leaf spot', 'alternaria blight', 'alternaria'],
+    'Late Blight': ['phytophthora infestans', 'phytophthora blight'],
+    'Leaf Mold': ['leaf mould', 'passalora fulva', 'fulvia fulva', 'cladosporium fulvum'],
+    'Black Scurf': ['rhizoctonia canker'],
+    'Bacterial Spot': ['xanthomonas', 'bacterial leaf spot'],
+    'Tomato Yellow Leaf Curl Virus': ['tylcv', 'yellow leaf curl', 'leaf curl virus', 'leaf curl'],
+    'Mosaic Virus': ['mosaic', 'tobacco mosaic virus', 'tmv', 'cucumber mosaic virus'],
+    'Anthracnose': ['colletotrichum'],
+    'Cercospora Leaf Spot': ['cercospora', 'frogeye leaf spot', 'tikka disease'],
+    'Red Rot': ['colletotrichum falcatum', 'sugarcane red rot'],
+    'Northern Leaf Blight': ['turcicum leaf blight', 'exserohilum turcicum', 'northern corn leaf blight'],
+    'Common Rust': ['puccinia sorghi', 'maize rust', 'corn rust'],
+    'Gray Leaf Spot': ['grey leaf spot', 'cercospora zeae-maydis'],
+    'Damping Off': ['pythium', 'seedling blight'],
+    'Root Rot': ['root rot disease'],
+    'Nutrient Deficiency': ['nitrogen deficiency', 'chlorosis', 'potassium deficiency', 'iron deficiency'],
+}
+
+# Crop words models prefix to disease names ("Tomato Late Blight")
+CROP_WORDS = {'rice', 'paddy', 'wheat', 'cotton', 'tomato', 'potato', 'maize', 'corn', 'sugarcane',
+              'soybean', 'chilli', 'pepper', 'onion', 'groundnut', 'peanut', 'mustard', 'chickpea'}
+
+# Fuzzy matches below this similarity keep the model's own wording
+FUZZY_CUTOFF = 0.88
+
+
+def _normalize_text(value: str) -> str:
+    value = unicodedata.normalize('NFKC', value).lower()
+    value = re.sub(r'\([^)]*\)', ' ', value)          # drop "(Alternaria solani)"
+    value = re.sub(r'\b(disease|infection)\b', ' ', value)
+    value = re.sub(r'[^a-z0-9\- ]+', ' ', value)
+    return re.sub(r'\s+', ' ', value).strip()
+
+
+def _build_alias_index() -> Dict[str, str]:
+    index = {}
+    for canonical, aliases in DISEASE_VOCABULARY.items():
+        for alias in [canonical] + aliases:
+            index[_normalize_text(alias)] = canonical
+    return index
+
+
+_ALIASES = _build_alias_index()
+
+
+def disease_code(name: str) -> str:
+    """Stable identifier for a disease name, e.g. 'early_blight'"""
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def normalize_disease_name(name: str, pathogen: str = None) -> Tuple[str, bool]:
+    """
+    Map a model-supplied disease name onto the canonical vocabulary.
+
+    Returns (name, matched). Unmatched names are title-cased and returned as-is.
+    """
+    candidates = [name]
+    # "Early blight (Alternaria solani)" also tells us the pathogen
+    candidates += re.findall(r'\(([^)]*)\)', name)
+    if pathogen:
+        candidates.append(pathogen)
+
+    for candidate in candidates:
+        key = _normalize_text(candidate)
+        if key in _ALIASES:
+            return _ALIASES[key], True
+        words = key.split(' ')
+        if len(words) > 1 and words[0] in CROP_WORDS and ' '.join(words[1:]) in _ALIASES:
+            return _ALIASES[' '.join(words[1:])], True
+
+    key = _normalize_text(name)
+    close = difflib.get_close_matches(key, list(_ALIASES), n=1, cutoff=FUZZY_CUTOFF)
+    if close:
+        return _ALIASES[close[0]], True
+
+    cleaned = re.sub(r'\s+', ' ', re.sub(r'\([^)]*\)', ' ', name)).strip()
+    return (cleaned.title() if cleaned else name.strip()), False
+
+
+def _string_list(value: Any, field: str) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f'{field} must be a list of strings')
+    return [item.strip() for item in value if item.strip()]
+
+
+def _as_bullets(items: List[str]) -> str:
+    return "\n".join(f"- {item}" for item in items)
+
+
+def parse_analysis(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse and validate a JSON analysis in one pass.
+
+    Returns a detection dict (disease_name, confidence, symptoms, treatment,
+    disease_code, name_normalized) or None if the response does not match
+    the schema; failures are counted in metrics.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        metrics.increment('disease_analysis.parse', outcome='invalid_json')
+        logger.warning("Disease analysis was not valid JSON: %r", str(text)[:200])
+        return None
+
+    try:
+        if not isinstance(data, dict):
+            raise ValueError('response must be a JSON object')
+
+        raw_name = data.get('disease_name')
+        if not isinstance(raw_name, str) or not raw_name.strip():
+            raise ValueError('disease_name must be a non-empty string')
+
+        confidence = data.get('confidence')
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+            raise ValueError('confidence must be a number')
+        if 1 < confidence <= 100:
+            # Percentages slip through despite the prompt
+            confidence = confidence / 100
+        if not 0 <= confidence <= 1:
+            raise ValueError('confidence must be between 0 and 1')
+
+        symptoms = _string_list(data.get('symptoms', []), 'symptoms')
+        treatments = _string_list(data.get('treatments', []), 'treatments')
+        pathogen = data.get('pathogen') if isinstance(data.get('pathogen'), str) else None
+    except ValueError as e:
+        metrics.increment('disease_analysis.parse', outcome='invalid_schema')
+        logger.warning("Disease analysis failed validation: %s", e)
+        return None
+
+    disease_name, matched = normalize_disease_name(raw_name, pathogen)
+    metrics.increment('disease_analysis.parse', outcome='ok')
+    if not matched:
+        metrics.increment('disease_analysis.unmatched_disease_name')
+
+    return {
+        'disease_name': disease_name,
+        'confidence': round(float(confidence), 3),
+        'symptoms': _as_bullets(symptoms),
+        'treatment': _as_bullets(treatments),
+        'disease_code': disease_code(disease_name),
+        'name_normalized': matched,
+    }
+
+
+def parse_failure_rate() -> Optional[float]:
+    """Share of analyses in this process that failed to parse"""
+    total = metrics.total('disease_analysis.parse')
+    if not total:
+        return None
+    return round(1 - metrics.value('disease_analysis.parse', outcome='ok') / total, 4)
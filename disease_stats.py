@@ -0,0 +1,267 @@
+"""
+Incremental disease report analytics for outbreak heatmaps and trend lines.
+
+Every new DiseaseReport bumps running counters in the disease_stats
+collection, one document per (ISO week, crop, region, disease) and one per
+(ISO week, crop, field, disease). The heatmap and trend endpoints then read
+only the buckets in the requested window, so their cost grows with the
+number of buckets rather than with the number of reports ever filed.
+
+Regions come from the field's location ("Village, District, State" is
+bucketed by its last part, the state). Reports filed before the counters
+existed can be folded in once with
+
+    python disease_stats.py rebuild
+
+The rebuild deletes every bucket and then recounts, so stop the API while
+it runs; a report filed in between would be counted twice or not at all.
+"""
+import logging
+import re
+import sys
+import time
+import threading
+import datetime
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+
+from firebase_models import DiseaseReport, DiseaseStatBucket, Field
+
+logger = logging.getLogger(__name__)
+
+REGION = 'region'
+FIELD = 'field'
+SCOPES = (REGION, FIELD)
+
+UNKNOWN_REGION = 'Unknown'
+
+DEFAULT_WEEKS = 12
+MAX_WEEKS = 104
+
+# Query results are cached briefly; local writes invalidate them immediately
+CACHE_TTL_SECONDS = 60
+
+_cache: Dict[Tuple, Tuple[float, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def week_start(value: str) -> Optional[str]:
+    """Monday of the ISO week containing an ISO date/datetime string"""
+    try:
+        day = datetime.date.fromisoformat((value or '')[:10])
+    except ValueError:
+        return None
+    return (day - datetime.timedelta(days=day.weekday())).isoformat()
+
+
+def normalize_region(location: Optional[str]) -> str:
+    """Region label for a free-text field location"""
+    parts = [part.strip() for part in (location or '').split(',') if part.strip()]
+    if not parts:
+        return UNKNOWN_REGION
+    return re.sub(r'\s+', ' ', parts[-1]).title()
+
+
+def field_region(field: Optional[Dict[str, Any]]) -> str:
+    """Region of a field document (explicit region, else its location)"""
+    if not field:
+        return UNKNOWN_REGION
+    return normalize_region(field.get('region') or field.get('location'))
+
+
+def bucket_id(scope: str, week: str, crop_type: str, scope_key: str, disease_code: str) -> str:
+    """Deterministic document ID so every increment lands on the same counter"""
+    key = '|'.join([scope, week, crop_type, scope_key, disease_code]).lower()
+    return re.sub(r'[^a-z0-9|_\-]+', '_', key)
+
+
+def _bucket_updates(reports: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Collapse reports into one pending increment per bucket"""
+    updates: Dict[str, Dict[str, Any]] = {}
+    for report in reports:
+        week = week_start(report.get('detection_date') or report.get('created_at'))
+        disease_code = report.get('disease_code')
+        if not week or not disease_code:
+            continue
+        crop_type = (report.get('crop_type') or 'unknown').strip().lower()
+        region = report.get('region') or UNKNOWN_REGION
+        for scope, scope_key in ((REGION, region), (FIELD, report.get('field_id'))):
+            if not scope_key:
+                continue
+            doc_id = bucket_id(scope, week, crop_type, scope_key, disease_code)
+            update = updates.setdefault(doc_id, {
+                'fields': {
+                    'scope': scope,
+                    'scope_key': scope_key,
+                    'week': week,
+                    'crop_type': crop_type,
+                    'disease_code': disease_code,
+                    'disease_name': report.get('disease_name'),
+                },
+                'amounts': {'count': 0, 'confidence_sum': 0.0},
+            })
+            update['amounts']['count'] += 1
+            update['amounts']['confidence_sum'] += float(report.get('confidence_score') or 0)
+    return updates
+
+
+def record_reports(reports: List[Dict[str, Any]]):
+    """
+    Fold newly created reports into the counters.
+
+    Reports should carry crop_type and region (see annotate_report); each
+    touched bucket is incremented once, however many reports it gets.
+    """
+    updates = _bucket_updates(reports)
+    for doc_id, update in updates.items():
+        try:
+            DiseaseStatBucket.increment(doc_id, update['fields'], update['amounts'])
+        except Exception as e:
+            logger.error("Error updating disease stats bucket %s: %s", doc_id, e)
+    if updates:
+        invalidate()
+
+
+def annotate_report(report: Dict[str, Any], crop_type: str, field: Optional[Dict[str, Any]]):
+    """Add the dimensions the counters are keyed on to a report before it is saved"""
+    report['crop_type'] = (crop_type or 'unknown').strip().lower()
+    report['region'] = field_region(field)
+    return report
+
+
+def _window_weeks(weeks: int, today: datetime.date = None) -> List[str]:
+    today = today or datetime.datetime.utcnow().date()
+    monday = today - datetime.timedelta(days=today.weekday())
+    return [(monday - datetime.timedelta(weeks=n)).isoformat() for n in range(weeks - 1, -1, -1)]
+
+
+def _cached(key: Tuple, build):
+    now = time.time()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and now - cached[0] < CACHE_TTL_SECONDS:
+            return cached[1]
+    value = build()
+    with _cache_lock:
+        _cache[key] = (now, value)
+    return value
+
+
+def heatmap(weeks: int = DEFAULT_WEEKS, crop_type: str = None, disease_code: str = None) -> Dict[str, Any]:
+    """Report counts per region over the trailing weeks, busiest region first"""
+    def build():
+        window = _window_weeks(weeks)
+        buckets = DiseaseStatBucket.get_range(REGION, window[0], crop_type=crop_type,
+                                              disease_code=disease_code)
+        regions: Dict[str, Dict[str, Any]] = {}
+        for bucket in buckets:
+            region = regions.setdefault(bucket['scope_key'], {
+                'region': bucket['scope_key'], 'count': 0, 'confidence_sum': 0.0, 'diseases': defaultdict(int),
+            })
+            region['count'] += bucket.get('count', 0)
+            region['confidence_sum'] += bucket.get('confidence_sum', 0.0)
+            region['diseases'][bucket['disease_code']] += bucket.get('count', 0)
+
+        cells = []
+        for region in sorted(regions.values(), key=lambda r: (-r['count'], r['region'])):
+            diseases = sorted(region['diseases'].items(), key=lambda item: (-item[1], item[0]))
+            cells.append({
+                'region': region['region'],
+                'count': region['count'],
+                'mean_confidence': round(region['confidence_sum'] / region['count'], 3) if region['count'] else None,
+                'top_disease': diseases[0][0] if diseases else None,
+                'diseases': dict(diseases),
+            })
+        return {
+            'weeks': weeks,
+            'since': window[0],
+            'crop_type': crop_type,
+            'disease_code': disease_code,
+            'buckets': len(buckets),
+            'regions': cells,
+        }
+
+    return _cached(('heatmap', weeks, crop_type or '', disease_code or ''), build)
+
+
+def trends(weeks: int = DEFAULT_WEEKS, scope: str = REGION, scope_key: str = None,
+           crop_type: str = None, disease_code: str = None) -> Dict[str, Any]:
+    """Weekly report counts per disease, zero-filled across the window"""
+    def build():
+        window = _window_weeks(weeks)
+        position = {week: i for i, week in enumerate(window)}
+        buckets = DiseaseStatBucket.get_range(scope, window[0], crop_type=crop_type,
+                                              scope_key=scope_key, disease_code=disease_code)
+        series: Dict[str, Dict[str, Any]] = {}
+        for bucket in buckets:
+            i = position.get(bucket['week'])
+            if i is None:
+                continue
+            line = series.setdefault(bucket['disease_code'], {
+                'disease_code': bucket['disease_code'],
+                'disease_name': bucket.get('disease_name'),
+                'counts': [0] * len(window),
+            })
+            line['counts'][i] += bucket.get('count', 0)
+
+        lines = []
+        for line in series.values():
+            counts = line.pop('counts')
+            # Last fortnight against the one before, as a simple outbreak signal
+            recent, previous = sum(counts[-2:]), sum(counts[-4:-2])
+            line.update({
+                'total': sum(counts),
+                'change_pct': round((recent - previous) / previous * 100, 1) if previous else None,
+                'series': [{'week': week, 'count': count} for week, count in zip(window, counts)],
+            })
+            lines.append(line)
+        lines.sort(key=lambda line: (-line['total'], line['disease_code']))
+        return {
+            'weeks': weeks,
+            'since': window[0],
+            'scope': scope,
+            'scope_key': scope_key,
+            'crop_type': crop_type,
+            'disease_code': disease_code,
+            'buckets': len(buckets),
+            'trends': lines,
+        }
+
+    return _cached(('trends', weeks, scope, scope_key or '', crop_type or '', disease_code or ''), build)
+
+
+def invalidate():
+    """Drop cached query results, e.g. after new reports were counted"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def rebuild():
+    """Recount every existing report (run once, with the API stopped, when introducing the counters)"""
+    import disease_analysis
+
+    for bucket in DiseaseStatBucket.list():
+        DiseaseStatBucket.delete(bucket['id'])
+
+    fields: Dict[str, Optional[Dict[str, Any]]] = {}
+    reports = DiseaseReport.list()
+    for report in reports:
+        field_id = report.get('field_id')
+        if field_id and field_id not in fields:
+            fields[field_id] = Field.get(field_id)
+        field = fields.get(field_id)
+        if not report.get('disease_code') and report.get('disease_name'):
+            report['disease_code'] = disease_analysis.disease_code(report['disease_name'])
+        if not report.get('crop_type'):
+            report['crop_type'] = (field or {}).get('crop_type')
+        if not report.get('region'):
+            report['region'] = field_region(field)
+    record_reports(reports)
+    print(f"Recounted {len(reports)} disease reports")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'rebuild':
+        rebuild()
+    else:
+        print(__doc__)
@@ -0,0 +1,122 @@
+"""
+Per-user field profiles for personalising chat answers.
+
+When a chat message mentions a field or crop, chat() adds a short summary
+of the farmer's fields to the prompt. The summary is rendered once per user
+from Field.get_by_user_id and cached, so a personalised turn costs one dict
+lookup instead of a Firestore query and string building.
+
+Entries are invalidated when a field is created or updated through the
+API. A TTL (FIELD_CONTEXT_TTL) bounds staleness from writes made by other
+processes. Users without fields are cached too, as an empty fragment.
+"""
+import os
+import logging
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+from firebase_models import Field
+
+logger = logging.getLogger(__name__)
+
+TTL_SECONDS = float(os.environ.get('FIELD_CONTEXT_TTL', '600'))
+MAX_USERS = int(os.environ.get('FIELD_CONTEXT_MAX_USERS', '5000'))
+
+# Fields listed in one fragment; farmers with more get the most recently updated
+MAX_FIELDS = 10
+
+UNKNOWN = 'अज्ञात'
+
+
+def render_fragment(fields: List[Dict[str, Any]]) -> str:
+    """Compact Hindi description of a user's fields for the chat prompt"""
+    if not fields:
+        return ''
+    fields = sorted(fields, key=lambda f: f.get('updated_at') or f.get('created_at') or '', reverse=True)
+    lines = ["उपयोगकर्ता के खेत की जानकारी:"]
+    for field in fields[:MAX_FIELDS]:
+        parts = [
+            f"नाम: {field.get('name') or UNKNOWN}",
+            f"स्थान: {field.get('location') or UNKNOWN}",
+            f"फसल: {field.get('crop_type') or UNKNOWN}",
+            f"मिट्टी: {field.get('soil_type') or UNKNOWN}",
+        ]
+        if field.get('area'):
+            parts.append(f"क्षेत्रफल: {field['area']} हेक्टेयर")
+        if field.get('planting_date'):
+            parts.append(f"बुवाई: {str(field['planting_date'])[:10]}")
+        lines.append("- " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+class FieldContextCache:
+    """LRU of rendered field fragments keyed by user_id"""
+
+    def __init__(self, ttl: float = TTL_SECONDS, max_users: int = MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        # Per user with loads in flight: [loads, generation]. The generation is bumped
+        # by invalidate(), so a load that raced with a write is not cached. Entries
+        # go away with the last load, so this stays as small as the loads in flight.
+        self._loading: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[str]:
+        """The user's field fragment, or None if they have no fields"""
+        if not user_id or user_id == 'anonymous':
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                metrics.increment('field_context.lookup', outcome='hit')
+                return entry[1] or None
+            loading = self._loading.setdefault(user_id, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+
+        metrics.increment('field_context.lookup', outcome='miss')
+        fragment = None
+        try:
+            fragment = render_fragment(Field.get_by_user_id(user_id) or [])
+        except Exception as e:
+            logger.error("Error loading fields for chat context: %s", e)
+        finally:
+            with self._lock:
+                loading = self._loading[user_id]
+                if fragment is not None and loading[1] == generation:
+                    self._entries[user_id] = (now, fragment)
+                    self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.max_users:
+                        self._entries.popitem(last=False)
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[user_id]
+        return fragment or None
+
+    def invalidate(self, user_id: str):
+        """Drop a user's fragment after one of their fields changed"""
+        if not user_id:
+            return
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if user_id in self._loading:
+                self._loading[user_id][1] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            users = len(self._entries)
+        return {
+            'users': users,
+            'hits': metrics.value('field_context.lookup', outcome='hit'),
+            'misses': metrics.value('field_context.lookup', outcome='miss'),
+        }
+
+
+# Shared cache used by the API process
+cache = FieldContextCache()
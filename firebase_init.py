@@ -1,10 +1,39 @@
 import os
+import logging
 import json
 import datetime
 import subprocess
 import sys
+import threading
+import importlib.util
 from pathlib import Path
 from collections import defaultdict
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+# Comparison operators understood by the in-memory query implementation
+QUERY_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+def _matches(doc, field, op, value):
+    """Evaluate a single where() clause against a document like Firestore does"""
+    if op != '==' and field not in doc:
+        # Firestore never matches documents that are missing the field
+        return False
+    try:
+        return QUERY_OPERATORS[op](doc.get(field), value)
+    except TypeError:
+        # Mismatched types (e.g. None < str) never match
+        return False
 
 # Create a simple in-memory implementation for development/testing
 class InMemoryFirebaseCollection:
@@ -18,7 +47,7 @@ class InMemoryFirebaseCollection:
         self.doc_id_counter += 1
         data['id'] = doc_id
         self.documents.append(data)
-        print(f"Added document to {self.name} collection with ID: {doc_id}")
+        logger.debug("Added document to %s collection with ID: %s", self.name, doc_id)
         return {'id': doc_id}
     
     def document(self, doc_id=None):
@@ -31,38 +60,70 @@ class InMemoryFirebaseCollection:
         return InMemoryDocumentReference(self, doc_id)
     
     def where(self, field, op, value):
-        # Simple filtering implementation
-        if op == '==':
-            matching_docs = [doc for doc in self.documents if doc.get(field) == value]
+        # Filter with the same comparison semantics as Firestore
+        if op in QUERY_OPERATORS:
+            matching_docs = [doc for doc in self.documents if _matches(doc, field, op, value)]
         else:
             # For other operators, return all documents (simplified)
-            matching_docs = self.documents
+            matching_docs = list(self.documents)
         
         # Return a query-like object that supports chaining
         return InMemoryFirebaseQuery(matching_docs)
     
+    def order_by(self, field, direction='asc'):
+        # Start a query over the whole collection
+        return InMemoryFirebaseQuery(list(self.documents)).order_by(field, direction)
+    
+    def limit(self, count):
+        return InMemoryFirebaseQuery(list(self.documents)).limit(count)
+    
     def get(self):
         # Return all documents in this collection
         return [InMemoryDocumentSnapshot(doc) for doc in self.documents]
 
+def _order_value(doc, field):
+    # '__name__' is Firestore's name for the document ID
+    return doc.get('id', '') if field == '__name__' else doc.get(field, '')
+
 class InMemoryFirebaseQuery:
     def __init__(self, documents):
         self.documents = documents
+        self.orders = []
     
     def where(self, field, op, value):
         # Apply additional filtering
-        if op == '==':
-            self.documents = [doc for doc in self.documents if doc.get(field) == value]
+        if op in QUERY_OPERATORS:
+            self.documents = [doc for doc in self.documents if _matches(doc, field, op, value)]
         return self
     
     def order_by(self, field, direction='asc'):
-        # Sort documents by the specified field
-        reverse = direction == 'desc'
-        self.documents = sorted(
-            self.documents, 
-            key=lambda doc: doc.get(field, ''), 
-            reverse=reverse
-        )
+        # Like Firestore, ordering on a field leaves out documents without it
+        if field != '__name__':
+            self.documents = [doc for doc in self.documents if field in doc]
+        # Each order_by() breaks ties of the previous ones; remaining ties are
+        # broken by document ID, as Firestore does
+        self.orders.append((field, direction.lower().startswith('desc')))
+        documents = sorted(self.documents, key=lambda doc: doc.get('id', ''), reverse=self.orders[-1][1])
+        for name, reverse in reversed(self.orders):
+            documents = sorted(documents, key=lambda doc: _order_value(doc, name), reverse=reverse)
+        self.documents = documents
+        return self
+    
+    def start_after(self, values):
+        # Keep documents that sort strictly after the cursor in the order_by() order
+        cursor = [values[name] for name, _ in self.orders]
+        
+        def after(doc):
+            for (name, reverse), bound in zip(self.orders, cursor):
+                value = _order_value(doc, name)
+                if value != bound:
+                    try:
+                        return value < bound if reverse else value > bound
+                    except TypeError:
+                        return False
+            return False
+        
+        self.documents = [doc for doc in self.documents if after(doc)]
         return self
     
     def limit(self, count):
@@ -109,6 +170,15 @@ class InMemoryDocumentReference:
         empty_snapshot.reference = self
         return empty_snapshot
     
+    def update(self, data):
+        # Merge fields into an existing document
+        for doc in self.collection.documents:
+            if doc.get('id') == self.id:
+                doc.update(data)
+                self.data = doc
+                return self
+        raise KeyError(f"No document to update: {self.collection.name}/{self.id}")
+    
     def delete(self):
         # Remove document by ID
         self.collection.documents = [
@@ -129,6 +199,29 @@ class InMemoryDocumentSnapshot:
     def exists(self):
         return self.data is not None
 
+class InMemoryWriteBatch:
+    def __init__(self):
+        self.operations = []
+    
+    def set(self, doc_ref, data):
+        self.operations.append(lambda: doc_ref.set(data))
+        return self
+    
+    def update(self, doc_ref, data):
+        self.operations.append(lambda: doc_ref.update(data))
+        return self
+    
+    def delete(self, doc_ref):
+        self.operations.append(doc_ref.delete)
+        return self
+    
+    def commit(self):
+        # Apply all queued writes in order
+        for operation in self.operations:
+            operation()
+        self.operations = []
+        return True
+
 class InMemoryFirebaseDB:
     def __init__(self):
         self.collections = defaultdict(lambda: InMemoryFirebaseCollection(name='unknown'))
@@ -137,28 +230,35 @@ class InMemoryFirebaseDB:
         if name not in self.collections:
             self.collections[name] = InMemoryFirebaseCollection(name)
         return self.collections[name]
+    
+    def batch(self):
+        return InMemoryWriteBatch()
+
+# Production never falls back to the in-memory database
+IS_PRODUCTION = os.environ.get('FLASK_ENV') == 'production' or os.environ.get('NODE_ENV') == 'production'
+
+class FirebaseInitError(RuntimeError):
+    """Raised when Firebase cannot be initialized in production mode"""
 
-# Try to import Firebase Admin SDK, but fall back to in-memory implementation if unavailable
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore, storage, auth
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    print("Firebase Admin SDK not available, using in-memory implementation")
-    FIREBASE_AVAILABLE = False
+# Firebase Admin SDK availability, checked without importing it (see initialize_firebase)
+FIREBASE_AVAILABLE = importlib.util.find_spec('firebase_admin') is not None
+if not FIREBASE_AVAILABLE:
+    logger.warning("Firebase Admin SDK not available, using in-memory implementation")
 
 def initialize_firebase():
     """Initialize Firebase Admin SDK for server-side operations or use in-memory implementation"""
-    # Check if we're in production mode 
-    is_production = os.environ.get('FLASK_ENV') == 'production' or os.environ.get('NODE_ENV') == 'production'
-    
+    if FIREBASE_AVAILABLE:
+        # Imported here: the SDK is slow to import and only needed once
+        import firebase_admin
+        from firebase_admin import credentials, firestore, storage, auth
+
     if not FIREBASE_AVAILABLE:
-        if is_production:
-            print("ERROR: Firebase Admin SDK not available in production mode!")
-            print("Please install firebase-admin package with: pip install firebase-admin")
-            sys.exit(1)
+        if IS_PRODUCTION:
+            logger.error("Firebase Admin SDK not available in production mode!")
+            logger.error("Please install firebase-admin package with: pip install firebase-admin")
+            raise FirebaseInitError("firebase-admin is not installed")
         else:
-            print("Using in-memory Firebase implementation (DEVELOPMENT MODE ONLY)")
+            logger.warning("Using in-memory Firebase implementation (DEVELOPMENT MODE ONLY)")
             return {
                 'app': None,
                 'db': InMemoryFirebaseDB(),
@@ -199,11 +299,12 @@ def initialize_firebase():
                         wrapped_base64 = '\n'.join([base64_part[i:i+64] for i in range(0, len(base64_part), 64)])
                         private_key = "-----" + parts[1] + "-----\n" + wrapped_base64 + "\n-----" + parts[3] + "-----"
             except Exception as e:
-                print(f"Error processing private key: {e}")
+                logger.error("Error processing private key: %s", e)
                 # If we can't process the key, provide a clearer error
-                print("Private key format may be incorrect. Please check your FIREBASE_PRIVATE_KEY environment variable.")
+                logger.warning("Private key format may be incorrect. "
+                               "Please check your FIREBASE_PRIVATE_KEY environment variable.")
         
-        print(f"Setting up Firebase with project ID: {project_id}")
+        logger.info("Setting up Firebase with project ID: %s", project_id)
         
         cred_config = {
             "type": "service_account",
@@ -219,7 +320,7 @@ def initialize_firebase():
         
         # Check if credentials are valid
         if not cred_config["private_key"] or not cred_config["client_email"]:
-            print("Warning: Missing critical Firebase credentials. Using in-memory implementation.")
+            logger.warning("Missing critical Firebase credentials. Using in-memory implementation.")
             return {
                 'app': None,
                 'db': InMemoryFirebaseDB(),
@@ -236,7 +337,7 @@ def initialize_firebase():
                 'databaseURL': os.environ.get('FIREBASE_DATABASE_URL')
             })
             
-            print("Firebase Admin SDK initialized successfully")
+            logger.info("Firebase Admin SDK initialized successfully")
             
             # Initialize services
             db = firestore.client()
@@ -250,11 +351,11 @@ def initialize_firebase():
                 'is_memory_implementation': False
             }
         except Exception as cred_error:
-            print(f"Error initializing Firebase with credentials: {cred_error}")
+            logger.error("Error initializing Firebase with credentials: %s", cred_error)
             
             # Try file-based approach by creating a service account file
             try:
-                print("Attempting to create and use a service account file...")
+                logger.info("Attempting to create and use a service account file...")
                 
                 # Create temp directory if needed
                 tmp_dir = Path('tmp')
@@ -271,7 +372,7 @@ def initialize_firebase():
                     result = subprocess.run([sys.executable, str(helper_script)], 
                                           capture_output=True, text=True)
                     if result.returncode != 0:
-                        print(f"Error running credential helper: {result.stderr}")
+                        logger.error("Error running credential helper: %s", result.stderr)
                         raise Exception("Failed to create service account file")
                 else:
                     # Manually create the file
@@ -280,11 +381,11 @@ def initialize_firebase():
                 
                 # Set environment variable for the file path
                 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = str(credential_path.absolute())
-                print(f"Set GOOGLE_APPLICATION_CREDENTIALS to {credential_path.absolute()}")
+                logger.info("Set GOOGLE_APPLICATION_CREDENTIALS to %s", credential_path.absolute())
                 
                 # Try initializing with the file
                 firebase_app = firebase_admin.initialize_app()
-                print("Firebase Admin SDK initialized with service account file")
+                logger.info("Firebase Admin SDK initialized with service account file")
                 
                 # Initialize services
                 db = firestore.client()
@@ -298,11 +399,11 @@ def initialize_firebase():
                     'is_memory_implementation': False
                 }
             except Exception as file_error:
-                print(f"Service account file approach failed: {file_error}")
+                logger.error("Service account file approach failed: %s", file_error)
                 
                 # Final attempt with application default credentials
                 try:
-                    print("Attempting to use application default credentials...")
+                    logger.info("Attempting to use application default credentials...")
                     # Use a unique name to avoid conflicts with multiple initializations
                     firebase_app = firebase_admin.initialize_app(
                         None,  # Use application default credentials 
@@ -318,7 +419,7 @@ def initialize_firebase():
                     db = firestore.client()
                     bucket = storage.bucket()
                     
-                    print("Firebase Admin SDK initialized with application default credentials")
+                    logger.info("Firebase Admin SDK initialized with application default credentials")
                     return {
                         'app': firebase_app,
                         'db': db,
@@ -327,18 +428,17 @@ def initialize_firebase():
                         'is_memory_implementation': False
                     }
                 except Exception as adc_error:
-                    print(f"Application default credentials failed: {adc_error}")
+                    logger.error("Application default credentials failed: %s", adc_error)
                     
                     # Fall back to in-memory implementation
                     # In production, we don't want to fall back to in-memory
-                    is_production = os.environ.get('FLASK_ENV') == 'production' or os.environ.get('NODE_ENV') == 'production'
-                    if is_production:
-                        print("ERROR: Failed to initialize Firebase in PRODUCTION mode!")
-                        print("Please verify your Firebase credentials and environment variables")
-                        print("See PRODUCTION.md for Firebase setup instructions")
-                        sys.exit(1)
+                    if IS_PRODUCTION:
+                        logger.error("Failed to initialize Firebase in PRODUCTION mode!")
+                        logger.error("Please verify your Firebase credentials and environment variables")
+                        logger.error("See PRODUCTION.md for Firebase setup instructions")
+                        raise FirebaseInitError(f"No usable Firebase credentials: {adc_error}")
                     else:
-                        print("Falling back to in-memory Firebase implementation (DEVELOPMENT MODE ONLY)")
+                        logger.warning("Falling back to in-memory Firebase implementation (DEVELOPMENT MODE ONLY)")
                         return {
                             'app': None,
                             'db': InMemoryFirebaseDB(),
@@ -347,11 +447,13 @@ def initialize_firebase():
                             'is_memory_implementation': True
                         }
     
+    except FirebaseInitError:
+        raise
     except Exception as e:
-        print(f"Error initializing Firebase: {e}")
+        logger.error("Error initializing Firebase: %s", e)
         
         # Use in-memory implementation
-        print("Using in-memory Firebase implementation")
+        logger.warning("Using in-memory Firebase implementation")
         return {
             'app': None,
             'db': InMemoryFirebaseDB(),
@@ -360,5 +462,47 @@ def initialize_firebase():
             'is_memory_implementation': True
         }
 
-# Initialize Firebase 
-firebase = initialize_firebase()
\ No newline at end of file
+class LazyFirebase(Mapping):
+    """
+    The services returned by initialize_firebase(), created on first access.
+
+    Importing this module no longer touches the network or spawns the
+    credential helper; the first read of firebase['db'] (or the API's
+    background warm-up) does. A production initialization failure is kept
+    and raised again on every access, without retrying the credential helper.
+    """
+
+    def __init__(self):
+        self._services = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._services is not None
+
+    def load(self):
+        if self._services is None:
+            with self._lock:
+                if self._error is not None:
+                    raise self._error
+                if self._services is None:
+                    try:
+                        self._services = initialize_firebase()
+                    except FirebaseInitError as e:
+                        self._error = e
+                        raise
+        return self._services
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+# Firebase services, initialized on first use
+firebase = LazyFirebase()
@@ -7,7 +7,8 @@ import time
 import datetime
 import hashlib
 import uuid
-from typing import List, Dict, Any, Optional, Union
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Union
 from firebase_init import firebase
 
 # Constants
@@ -20,6 +21,16 @@ WEATHER_FORECASTS_COLLECTION = 'weather_forecasts'
 CHAT_HISTORY_COLLECTION = 'chat_history'
 IRRIGATION_RECORDS_COLLECTION = 'irrigation_records'
 FERTILIZER_RECORDS_COLLECTION = 'fertilizer_records'
+NOTIFICATION_OUTBOX_COLLECTION = 'notification_outbox'
+MARKET_PRICE_SNAPSHOTS_COLLECTION = 'market_price_snapshots'
+TOMBSTONES_COLLECTION = 'tombstones'
+DETECTION_CACHE_COLLECTION = 'detection_cache'
+DETECTION_JOBS_COLLECTION = 'detection_jobs'
+DISEASE_STATS_COLLECTION = 'disease_stats'
+CHAT_SUMMARIES_COLLECTION = 'chat_summaries'
+
+# Firestore rejects write batches with more than 500 operations
+MAX_BATCH_WRITES = 500
 
 def generate_id() -> str:
     """Generate a unique ID for Firebase documents"""
@@ -29,11 +40,20 @@ class FirebaseModel:
     """Base class for Firebase models"""
     collection_name = None
     
+    # Field holding the owning user's ID for collections served by the sync API;
+    # deletes from these collections leave a tombstone behind
+    sync_owner_field = None
+    
     @classmethod
     def create(cls, data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new document in the collection"""
+        now = datetime.datetime.utcnow().isoformat()
         if 'created_at' not in data:
-            data['created_at'] = datetime.datetime.utcnow().isoformat()
+            data['created_at'] = now
+        
+        # updated_at drives change feeds, so every document carries one
+        if 'updated_at' not in data:
+            data['updated_at'] = now
         
         if 'id' not in data:
             data['id'] = generate_id()
@@ -42,6 +62,26 @@ class FirebaseModel:
         doc_ref.set(data)
         return data
     
+    @classmethod
+    def create_many(cls, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Create several documents using batched writes"""
+        db = firebase['db']
+        collection = db.collection(cls.collection_name)
+        now = datetime.datetime.utcnow().isoformat()
+        
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for data in items[start:start + MAX_BATCH_WRITES]:
+                if 'created_at' not in data:
+                    data['created_at'] = now
+                if 'updated_at' not in data:
+                    data['updated_at'] = now
+                if 'id' not in data:
+                    data['id'] = generate_id()
+                batch.set(collection.document(data['id']), data)
+            batch.commit()
+        return items
+    
     @classmethod
     def get(cls, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a document by ID"""
@@ -59,11 +99,65 @@ class FirebaseModel:
     
     @classmethod
     def delete(cls, doc_id: str) -> bool:
-        """Delete a document by ID"""
+        """Delete a document by ID, recording a tombstone for synced collections"""
         doc_ref = firebase['db'].collection(cls.collection_name).document(doc_id)
+        
+        if cls.sync_owner_field:
+            existing = cls.get(doc_id)
+            if existing:
+                Tombstone.record(cls.collection_name, doc_id, existing.get(cls.sync_owner_field))
+        
         doc_ref.delete()
         return True
     
+    @classmethod
+    def changed_since(cls, owner_id: str, after: Tuple[str, str] = None,
+                      limit: int = None) -> List[Dict[str, Any]]:
+        """Documents owned by a user changed after an (updated_at, id) cursor, oldest change first"""
+        return cls.changes([{'field': cls.sync_owner_field, 'value': owner_id}], after, limit)
+    
+    @classmethod
+    def changes(cls, filters: List[Dict[str, Any]] = None, after: Tuple[str, str] = None,
+                limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Page through documents in (updated_at, document ID) order.
+        
+        Ordering on the ID as well lets a page end inside a group of documents
+        sharing one updated_at (a batched write) and the next page start right
+        after the last document delivered.
+        """
+        query = firebase['db'].collection(cls.collection_name)
+        for filter_dict in filters or []:
+            query = query.where(filter_dict['field'], filter_dict.get('op', '=='), filter_dict['value'])
+        query = query.order_by('updated_at').order_by('__name__')
+        if after:
+            query = query.start_after({'updated_at': after[0], '__name__': after[1]})
+        if limit:
+            query = query.limit(limit)
+        return [doc.to_dict() for doc in query.get()]
+    
+    @classmethod
+    def backfill_updated_at(cls) -> int:
+        """
+        Stamp updated_at on documents written before create() set it.
+        
+        Queries ordered by updated_at (changes()) never return a document
+        without the field. Returns how many documents were updated.
+        """
+        db = firebase['db']
+        collection = db.collection(cls.collection_name)
+        now = datetime.datetime.utcnow().isoformat()
+        missing = [doc for doc in collection.get() if not (doc.to_dict() or {}).get('updated_at')]
+        
+        for start in range(0, len(missing), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for doc in missing[start:start + MAX_BATCH_WRITES]:
+                data = doc.to_dict()
+                batch.update(collection.document(doc.id),
+                             {'updated_at': data.get('created_at') or data.get('timestamp') or now})
+            batch.commit()
+        return len(missing)
+    
     @classmethod
     def list(cls, filters: List[Dict[str, Any]] = None, order_by: str = None, 
              limit: int = None, direction: str = 'asc') -> List[Dict[str, Any]]:
@@ -79,8 +173,9 @@ class FirebaseModel:
                 if field and value is not None:
                     query = query.where(field, op, value)
         
-        # Apply ordering if provided
+        # Apply ordering if provided (Firestore expects ASCENDING/DESCENDING)
         if order_by:
+            direction = 'DESCENDING' if direction.lower().startswith('desc') else 'ASCENDING'
             query = query.order_by(order_by, direction=direction)
         
         # Apply limit if provided
@@ -91,6 +186,29 @@ class FirebaseModel:
         docs = query.get()
         return [doc.to_dict() for doc in docs]
 
+class Tombstone(FirebaseModel):
+    """Marker left behind when a synced document is deleted"""
+    collection_name = TOMBSTONES_COLLECTION
+    
+    @classmethod
+    def record(cls, collection: str, doc_id: str, user_id: str) -> Dict[str, Any]:
+        """Record the deletion of a document (one tombstone per document)"""
+        now = datetime.datetime.utcnow().isoformat()
+        return cls.create({
+            'id': f"{collection}_{doc_id}",
+            'collection': collection,
+            'doc_id': doc_id,
+            'user_id': user_id,
+            'deleted_at': now,
+            'updated_at': now
+        })
+    
+    @classmethod
+    def changed_since(cls, owner_id: str, after: Tuple[str, str] = None,
+                      limit: int = None) -> List[Dict[str, Any]]:
+        """Tombstones for a user's documents deleted after an (updated_at, id) cursor"""
+        return cls.changes([{'field': 'user_id', 'value': owner_id}], after, limit)
+
 class User(FirebaseModel):
     """User model for Firebase"""
     collection_name = USERS_COLLECTION
@@ -112,6 +230,7 @@ class User(FirebaseModel):
 class Field(FirebaseModel):
     """Field model for Firebase"""
     collection_name = FIELDS_COLLECTION
+    sync_owner_field = 'user_id'
     
     @classmethod
     def get_by_user_id(cls, user_id: str) -> List[Dict[str, Any]]:
@@ -121,6 +240,7 @@ class Field(FirebaseModel):
 class DiseaseReport(FirebaseModel):
     """Disease report model for Firebase"""
     collection_name = DISEASE_REPORTS_COLLECTION
+    sync_owner_field = 'user_id'
     
     @classmethod
     def get_by_user_id(cls, user_id: str) -> List[Dict[str, Any]]:
@@ -132,6 +252,117 @@ class DiseaseReport(FirebaseModel):
         """Get all disease reports for a field"""
         return cls.list([{'field': 'field_id', 'value': field_id}])
 
+class DiseaseStatBucket(FirebaseModel):
+    """Running report count for one (week, crop, region or field, disease) bucket"""
+    collection_name = DISEASE_STATS_COLLECTION
+    
+    # Serialises read-modify-write increments on the in-memory database
+    _memory_lock = threading.Lock()
+    
+    @classmethod
+    def increment(cls, doc_id: str, fields: Dict[str, Any], amounts: Dict[str, float]):
+        """Add to numeric counters, creating the bucket on first use"""
+        now = datetime.datetime.utcnow().isoformat()
+        doc_ref = firebase['db'].collection(cls.collection_name).document(doc_id)
+        
+        if firebase.get('is_memory_implementation', True):
+            with cls._memory_lock:
+                existing = cls.get(doc_id) or {'created_at': now}
+                data = dict(existing, **fields, id=doc_id, updated_at=now)
+                for name, amount in amounts.items():
+                    data[name] = existing.get(name, 0) + amount
+                doc_ref.set(data)
+            return
+        
+        # Server-side increments stay correct with many API workers
+        from firebase_admin import firestore
+        data = dict(fields, id=doc_id, updated_at=now)
+        data.update({name: firestore.Increment(amount) for name, amount in amounts.items()})
+        doc_ref.set(data, merge=True)
+    
+    @classmethod
+    def get_range(cls, scope: str, since_week: str, crop_type: str = None,
+                  scope_key: str = None, disease_code: str = None) -> List[Dict[str, Any]]:
+        """
+        Buckets of one scope ('region' or 'field') from since_week onwards.
+        
+        Only scope and week are queried, so a single composite index (scope,
+        week) serves every combination of the optional filters, which are
+        applied here.
+        """
+        buckets = cls.list(filters=[{'field': 'scope', 'value': scope},
+                                    {'field': 'week', 'op': '>=', 'value': since_week}])
+        wanted = {'crop_type': crop_type, 'scope_key': scope_key, 'disease_code': disease_code}
+        return [bucket for bucket in buckets
+                if all(bucket.get(name) == value for name, value in wanted.items() if value)]
+
+class DetectionCacheEntry(FirebaseModel):
+    """Parsed disease detection result keyed by image content hash"""
+    collection_name = DETECTION_CACHE_COLLECTION
+    
+    @classmethod
+    def get_recent(cls, limit: int) -> List[Dict[str, Any]]:
+        """Most recently cached results, newest first"""
+        return cls.list(order_by='created_at', direction='desc', limit=limit)
+
+class DetectionJob(FirebaseModel):
+    """Asynchronous disease detection job and its result"""
+    collection_name = DETECTION_JOBS_COLLECTION
+    
+    # Serialises claims on the in-memory database
+    _memory_lock = threading.Lock()
+    
+    @classmethod
+    def expired(cls, now: str, limit: int = None) -> List[Dict[str, Any]]:
+        """Unfinished jobs whose lease ran out (finished jobs hold no lease)"""
+        return cls.list([{'field': 'lease_expires_at', 'op': '<', 'value': now}], limit=limit)
+    
+    @classmethod
+    def claim(cls, job_id: str, owner: str, lease_expires_at: str, now: str) -> Optional[Dict[str, Any]]:
+        """
+        Take over a job whose lease expired before now.
+        
+        Returns the job, or None if it finished or another process claimed it
+        first. On Firestore the check and the write run in one transaction.
+        """
+        doc_ref = firebase['db'].collection(cls.collection_name).document(job_id)
+        changes = {'owner': owner, 'lease_expires_at': lease_expires_at}
+        
+        def claimable(job):
+            return bool(job) and bool(job.get('lease_expires_at')) and job['lease_expires_at'] < now
+        
+        if firebase.get('is_memory_implementation', True):
+            with cls._memory_lock:
+                job = cls.get(job_id)
+                if not claimable(job):
+                    return None
+                doc_ref.update(changes)
+                return dict(job, **changes)
+        
+        from firebase_admin import firestore
+        
+        @firestore.transactional
+        def claim_in(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            job = snapshot.to_dict() if snapshot.exists else None
+            if not claimable(job):
+                return None
+            transaction.update(doc_ref, changes)
+            return dict(job, **changes)
+        
+        return claim_in(firebase['db'].transaction())
+    
+    @classmethod
+    def renew_leases(cls, job_ids: List[str], lease_expires_at: str):
+        """Extend the leases of jobs still in progress; updated_at is left alone"""
+        db = firebase['db']
+        collection = db.collection(cls.collection_name)
+        for start in range(0, len(job_ids), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for job_id in job_ids[start:start + MAX_BATCH_WRITES]:
+                batch.update(collection.document(job_id), {'lease_expires_at': lease_expires_at})
+            batch.commit()
+
 class MarketPrice(FirebaseModel):
     """Market price model for Firebase"""
     collection_name = MARKET_PRICES_COLLECTION
@@ -154,15 +385,46 @@ class MarketPrice(FirebaseModel):
         
         return cls.list(filters=filters, order_by='date', direction='desc')
 
+class MarketPriceSnapshot(FirebaseModel):
+    """Daily snapshot of all market prices for one crop"""
+    collection_name = MARKET_PRICE_SNAPSHOTS_COLLECTION
+    
+    @staticmethod
+    def snapshot_id(crop_type: str, date: str) -> str:
+        """Deterministic document ID so refreshes for the same day overwrite"""
+        return f"{crop_type.strip().lower().replace(' ', '_')}_{date}"
+    
+    @classmethod
+    def get_by_date(cls, date: str) -> List[Dict[str, Any]]:
+        """Get every crop's snapshot for a date (YYYY-MM-DD)"""
+        return cls.list([{'field': 'date', 'value': date}])
+    
+    @classmethod
+    def get_latest_for_crop(cls, crop_type: str) -> Optional[Dict[str, Any]]:
+        """Get the most recent snapshot for a crop"""
+        snapshots = cls.list([{'field': 'crop_type', 'value': crop_type}],
+                             order_by='date', direction='desc', limit=1)
+        return snapshots[0] if snapshots else None
+
 class MarketFavorite(FirebaseModel):
     """Market favorite model for Firebase"""
     collection_name = MARKET_FAVORITES_COLLECTION
+    sync_owner_field = 'user_id'
     
     @classmethod
     def get_by_user_id(cls, user_id: str) -> List[Dict[str, Any]]:
         """Get all market favorites for a user"""
         return cls.list([{'field': 'user_id', 'value': user_id}])
 
+class NotificationOutbox(FirebaseModel):
+    """Pending user notifications (e.g. triggered price alerts) for delivery"""
+    collection_name = NOTIFICATION_OUTBOX_COLLECTION
+    
+    @classmethod
+    def get_pending(cls, limit: int = None) -> List[Dict[str, Any]]:
+        """Get notifications that have not been delivered yet"""
+        return cls.list([{'field': 'status', 'value': 'pending'}], limit=limit)
+
 class WeatherForecast(FirebaseModel):
     """Weather forecast model for Firebase"""
     collection_name = WEATHER_FORECASTS_COLLECTION
@@ -188,6 +450,7 @@ class WeatherForecast(FirebaseModel):
 class ChatHistory(FirebaseModel):
     """Chat history model for Firebase"""
     collection_name = CHAT_HISTORY_COLLECTION
+    sync_owner_field = 'user_id'
     
     @classmethod
     def get_by_user_id(cls, user_id: str) -> List[Dict[str, Any]]:
@@ -230,6 +493,15 @@ class ChatHistory(FirebaseModel):
         # Convert to list and sort by timestamp (descending)
         return sorted(list(sessions.values()), key=lambda x: x['timestamp'], reverse=True)
 
+class ChatSummary(FirebaseModel):
+    """Running summary of the older turns of one chat session"""
+    collection_name = CHAT_SUMMARIES_COLLECTION
+    
+    @staticmethod
+    def summary_id(user_id: str, session_id: str) -> str:
+        """Deterministic document ID so each refresh overwrites the session's summary"""
+        return f"{user_id}_{session_id}"
+
 class IrrigationRecord(FirebaseModel):
     """Irrigation record model for Firebase"""
     collection_name = IRRIGATION_RECORDS_COLLECTION
@@ -0,0 +1,123 @@
+"""
+I/O-agnostic request flows for the WSGI and ASGI servers.
+
+The chat and guidance endpoints spend almost all of their time waiting on
+Gemini and Firestore. Their logic is written once, as a generator that
+yields each I/O operation and receives the result back (or has the
+operation's exception raised at the yield):
+
+    response = yield flows.Generate(model, prompt)
+
+A driver executes the operations:
+
+- run_sync, used by the Flask views, blocks the worker thread on each
+  operation, exactly as the endpoints did before.
+- run_async, used by asgi.py, awaits them. Gemini calls go through the async
+  client (generate_content_async) and chat history reads through the
+  Firestore AsyncClient. One event loop can then hold hundreds of in-flight
+  requests instead of one thread each. Remaining blocking calls (Blocking)
+  run on the default thread pool, but only for the length of the call.
+
+A flow returns (payload, status_code).
+"""
+from typing import Any, Callable, Generator, Tuple
+
+from firebase_init import firebase
+from firebase_models import ChatHistory, CHAT_HISTORY_COLLECTION
+
+Flow = Generator[Any, Any, Tuple[Any, int]]
+
+
+class Generate:
+    """generate_content on an already constructed Gemini model"""
+
+    def __init__(self, model, prompt, generation_config=None):
+        self.model = model
+        self.prompt = prompt
+        self.generation_config = generation_config
+
+    def run(self):
+        return self.model.generate_content(self.prompt, generation_config=self.generation_config)
+
+    async def arun(self):
+        return await self.model.generate_content_async(self.prompt, generation_config=self.generation_config)
+
+
+class ChatHistoryQuery:
+    """Stored messages of one chat session, oldest first"""
+
+    def __init__(self, user_id: str, session_id: str):
+        self.user_id = user_id
+        self.session_id = session_id
+
+    def run(self):
+        return ChatHistory.get_by_user_and_session(self.user_id, self.session_id)
+
+    async def arun(self):
+        db = _async_db()
+        if db is None:
+            # The in-memory database never blocks
+            return self.run()
+        query = (db.collection(CHAT_HISTORY_COLLECTION)
+                 .where('user_id', '==', self.user_id)
+                 .where('session_id', '==', self.session_id)
+                 .order_by('timestamp'))
+        return [doc.to_dict() for doc in await query.get()]
+
+
+class Blocking:
+    """Any other blocking call; off the event loop in async mode"""
+
+    def __init__(self, fn: Callable, *args):
+        self.fn = fn
+        self.args = args
+
+    def run(self):
+        return self.fn(*self.args)
+
+    async def arun(self):
+        # Imported here: only the ASGI server needs it
+        import asyncio
+        return await asyncio.to_thread(self.fn, *self.args)
+
+
+_async_client = None
+
+
+def _async_db():
+    """Firestore AsyncClient for the running event loop, or None for the in-memory database"""
+    global _async_client
+    if firebase.get('is_memory_implementation'):
+        return None
+    if _async_client is None:
+        from firebase_admin import firestore_async
+        _async_client = firestore_async.client(firebase['app'])
+    return _async_client
+
+
+def run_sync(flow: Flow) -> Tuple[Any, int]:
+    """Drive a flow on the calling thread"""
+    result, error = None, None
+    while True:
+        try:
+            operation = flow.throw(error) if error is not None else flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = operation.run(), None
+        except Exception as e:
+            result, error = None, e
+
+
+async def run_async(flow: Flow) -> Tuple[Any, int]:
+    """Drive a flow on the event loop"""
+    result, error = None, None
+    while True:
+        try:
+            operation = flow.throw(error) if error is not None else flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = await operation.arun(), None
+        except Exception as e:
+            result, error = None, e
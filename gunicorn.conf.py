@@ -0,0 +1,115 @@
+"""
+Production gunicorn profile for the Python API.
+
+    gunicorn -c gunicorn.conf.py
+
+python api.py runs Flask's development server: one process, debug mode and
+the reloader. Here the app is preloaded once in the master and forked into
+workers. The worker class comes from GUNICORN_PROFILE:
+
+- gthread (default): WEB_CONCURRENCY processes (2 x CPUs + 1) of
+  GUNICORN_THREADS threads each. A request waiting on Gemini holds a thread,
+  so the thread count, not the CPU count, bounds chat concurrency.
+- gevent: one process per CPU, GUNICORN_WORKER_CONNECTIONS greenlets each.
+  Needs the gevent package; the standard library is patched before the app
+  is imported.
+- async: uvicorn workers serving asgi:app, one per CPU (see asgi.py). Chat
+  and quick guidance wait on Gemini without holding a thread.
+
+Timeouts are sized for Gemini rather than for typical web requests. A chat
+turn can make two model calls, each of which can take tens of seconds. A
+worker is only killed after GUNICORN_TIMEOUT seconds without a heartbeat,
+and on reload or shutdown it gets GUNICORN_GRACEFUL_TIMEOUT seconds to
+finish the requests it is serving. Idle keep-alive connections are held
+longer than the usual 60 s load balancer idle timeout, so the balancer, not
+gunicorn, closes them and never reuses a socket as it is being closed.
+
+The master imports the app and the Gemini SDK but opens no connections:
+Firebase and Gemini clients are created in the workers (see startup.py).
+Background threads (chat persistence, summaries, detection jobs, market
+price ingestion, warm-up) would die in the fork, so the master does not
+start them.
+post_fork starts them in every worker, apart from the market price
+scheduler, which runs in worker slot 0 only. The other workers ingest a crop
+only when asked for one that has no snapshot yet, and price alerts read
+favorites from the datastore (see market_refresher.py and price_alerts.py). Slots are small integers reused by
+replacement workers, so a worker's chat log (chat_writes.worker_wal_path)
+is replayed by whichever worker takes its place.
+"""
+import os
+import multiprocessing
+
+PROFILE = os.environ.get('GUNICORN_PROFILE', 'gthread')
+CPUS = multiprocessing.cpu_count()
+
+if PROFILE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+# Workers start the background threads themselves (see post_fork)
+os.environ['START_BACKGROUND_WORKERS'] = '0'
+
+bind = f"0.0.0.0:{os.environ.get('API_PORT', '5004')}"
+preload_app = True
+
+if PROFILE == 'gthread':
+    wsgi_app = 'api:app'
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPUS * 2 + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', '32'))
+elif PROFILE == 'gevent':
+    wsgi_app = 'api:app'
+    worker_class = 'gevent'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPUS))
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+elif PROFILE == 'async':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPUS))
+else:
+    raise ValueError(f"Unknown GUNICORN_PROFILE: {PROFILE} (expected gthread, gevent or async)")
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '75'))
+backlog = 2048
+
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    # Import the Gemini SDK once for all workers; importing opens no connections
+    import api
+    api.genai.load()
+
+
+def pre_fork(server, worker):
+    """Give the new worker the lowest slot no live worker holds"""
+    taken = {getattr(other, 'slot', None) for other in server.WORKERS.values()}
+    worker.slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    import api
+    import chat_writes
+    import market_refresher
+    from firebase_init import firebase
+
+    # Fail the boot, rather than every request, when production Firebase is misconfigured
+    firebase.load()
+
+    chat_writes.writer.wal_path = chat_writes.worker_wal_path(worker.slot)
+    api.start_background_workers(
+        refresh_market_prices=market_refresher.REFRESH_ENABLED and worker.slot == 0
+    )
+    server.log.info("Worker %s started in slot %d", worker.pid, worker.slot)
+
+    if worker.slot == 0 and server.num_workers > 1 and firebase.get('is_memory_implementation'):
+        server.log.warning("In-memory database with %d workers: every worker has its own data",
+                           server.num_workers)
+
+
+def worker_exit(server, worker):
+    import chat_writes
+    chat_writes.writer.flush()
@@ -0,0 +1,154 @@
+"""
+Conditional GET support (ETag / If-None-Match, Last-Modified / If-Modified-Since)
+for read-mostly API endpoints.
+
+ETags are derived from document versions (updated_at timestamps or snapshot
+versions) rather than from the response body, so an unchanged resource is
+answered with 304 Not Modified before the JSON payload is built or serialized.
+
+Endpoints whose payload depends on nothing but its version parts can also
+keep the serialized body, keyed by ETag, so a client without a cached copy
+is answered without building or serializing it again (cache_body=True).
+"""
+import os
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from flask import request, jsonify, make_response
+
+import metrics
+import json_provider
+
+# Bump when the shape of a cached response changes so old ETags stop matching
+RESPONSE_FORMAT_VERSION = '1'
+
+BODY_CACHE_MAX_ENTRIES = int(os.environ.get('HTTP_BODY_CACHE_MAX_ENTRIES', '1000'))
+
+
+def document_version(doc: Dict[str, Any]) -> str:
+    """Best available version marker for a Firebase document"""
+    return str(doc.get('updated_at') or doc.get('last_updated') or doc.get('created_at') or '')
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a short, stable ETag value from version parts"""
+    digest = hashlib.sha1(RESPONSE_FORMAT_VERSION.encode())
+    for part in parts:
+        digest.update(b'\x1f')
+        digest.update(repr(part).encode())
+    return digest.hexdigest()[:20]
+
+
+def _to_http_datetime(value: Union[str, datetime.datetime, None]) -> Optional[datetime.datetime]:
+    """Normalise an ISO string or naive UTC datetime to an aware, whole-second UTC datetime"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+
+def latest_timestamp(values: Iterable[Any]) -> Optional[str]:
+    """Most recent non-empty ISO timestamp from an iterable"""
+    values = [value for value in values if value]
+    return max(values) if values else None
+
+
+def _not_modified(etag: str, last_modified: Optional[datetime.datetime]) -> bool:
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+class BodyCache:
+    """LRU of serialized JSON bodies keyed by ETag"""
+
+    def __init__(self, max_entries: int = BODY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, json_provider.Preserialized]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[json_provider.Preserialized]:
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+        metrics.increment('http_cache.body_lookup', outcome='hit' if body is not None else 'miss')
+        return body
+
+    def store(self, etag: str, body: json_provider.Preserialized):
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+            size = sum(len(body) for body in self._entries.values())
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': metrics.value('http_cache.body_lookup', outcome='hit'),
+            'misses': metrics.value('http_cache.body_lookup', outcome='miss'),
+        }
+
+
+# Shared body cache used by the API process
+body_cache = BodyCache()
+
+
+def conditional_json(version_parts: Iterable[Any], build: Callable[[], Any],
+                     last_modified: Union[str, datetime.datetime, None] = None,
+                     status: int = 200, cache_body: bool = False):
+    """
+    Return 304 if the client's cached copy is current, otherwise build the body.
+
+    Args:
+        version_parts: values that change whenever the response would change
+        build: callable returning a JSON-serializable payload (only called on a miss)
+        last_modified: ISO string or datetime of the newest underlying document
+        status: status code for a full response
+        cache_body: keep the serialized body for the next full response with
+            the same ETag; only for payloads that version_parts fully determine
+    """
+    etag = make_etag(*version_parts)
+    modified = _to_http_datetime(last_modified)
+
+    if _not_modified(etag, modified):
+        response = make_response('', 304)
+    else:
+        payload = body_cache.get(etag) if cache_body else None
+        if payload is None:
+            payload = build()
+            if cache_body:
+                payload = json_provider.preserialize(payload)
+                body_cache.store(etag, payload)
+        response = make_response(jsonify(payload), status)
+
+    response.set_etag(etag, weak=True)
+    if modified:
+        response.last_modified = modified
+    # Clients may cache but must revalidate before every reuse
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def no_store(response):
+    """Strip the validators from a response that must not be cached (e.g. a degraded answer)"""
+    response.headers.pop('ETag', None)
+    response.headers.pop('Last-Modified', None)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,252 @@
+"""
+Image preprocessing for Gemini disease detection.
+
+Phone photos arrive at 4-12 MB with EXIF rotation flags and in whatever
+format the camera produced. Before an image is sent inline to Gemini it is:
+
+1. decoded with Pillow (JPEG uploads use draft mode to decode at reduced size)
+2. rotated upright according to its EXIF orientation tag
+3. downscaled so its longest edge is at most DISEASE_IMAGE_MAX_EDGE, with a
+   Lanczos filter so small lesions and rust pustules keep sharp edges
+4. re-encoded as JPEG (4:4:4 chroma, so colour spots are not smeared) or WebP
+
+If the result is not smaller than an upload that needed no rotation or
+resizing, the original bytes are sent unchanged. The MIME type always comes
+from the decoded content, never from the file name.
+"""
+import io
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Union
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest edge sent to Gemini; larger images are billed and uploaded for no gain
+MAX_EDGE = int(os.environ.get('DISEASE_IMAGE_MAX_EDGE', '1024'))
+
+# Output encoding: 'JPEG' or 'WEBP'
+OUTPUT_FORMAT = os.environ.get('DISEASE_IMAGE_FORMAT', 'JPEG').upper()
+JPEG_QUALITY = int(os.environ.get('DISEASE_IMAGE_JPEG_QUALITY', '85'))
+WEBP_QUALITY = int(os.environ.get('DISEASE_IMAGE_WEBP_QUALITY', '80'))
+
+# Worker processes used to preprocess batches of images in parallel
+POOL_WORKERS = int(os.environ.get('DISEASE_IMAGE_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Formats Gemini accepts inline, keyed by Pillow format name
+GEMINI_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'HEIF': 'image/heif',
+}
+
+# Magic numbers for formats Pillow cannot decode without plugins
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+
+# EXIF tag holding the camera orientation
+_EXIF_ORIENTATION = 0x0112
+
+
+def sniff_mime_type(data: bytes) -> Optional[str]:
+    """Detect an image MIME type from its leading bytes"""
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[4:8] == b'ftyp' and data[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'image/heif'
+    return None
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: 64 bits recording whether each pixel of a 9x8 grayscale
+    thumbnail is brighter than its right-hand neighbour. Recompressed,
+    resized or slightly re-cropped copies of a photo differ in only a few bits.
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()  # one byte per pixel in mode 'L'
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _encode(image: Image.Image, output_format: str) -> bytes:
+    buffer = io.BytesIO()
+    if output_format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        if image.mode != 'RGB':
+            # JPEG has no alpha channel; flatten onto white like a scanned leaf
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, subsampling=0)
+    return buffer.getvalue()
+
+
+def preprocess_image(source: Union[str, bytes], max_edge: int = None,
+                     output_format: str = None) -> Dict[str, Any]:
+    """
+    Prepare an image for inline upload to Gemini.
+
+    Args:
+        source: file path or raw image bytes
+        max_edge: longest edge in pixels (defaults to MAX_EDGE)
+        output_format: 'JPEG' or 'WEBP' (defaults to OUTPUT_FORMAT)
+
+    Returns a dict with the bytes to send ('data'), their 'mime_type', the
+    final 'width'/'height', a perceptual 'dhash' of the upright image and 'stats' (original_bytes, processed_bytes,
+    bytes_saved, saved_pct, preprocess_ms, resized, rotated, reencoded).
+
+    Raises ValueError if the content is not an image Gemini can accept.
+    """
+    started = time.perf_counter()
+    max_edge = max_edge or MAX_EDGE
+    output_format = (output_format or OUTPUT_FORMAT).upper()
+
+    if isinstance(source, (bytes, bytearray)):
+        original = bytes(source)
+    else:
+        with open(source, 'rb') as f:
+            original = f.read()
+
+    try:
+        image = Image.open(io.BytesIO(original))
+        source_format = image.format
+        source_mime = GEMINI_MIME_TYPES.get(source_format) or Image.MIME.get(source_format)
+        orientation = image.getexif().get(_EXIF_ORIENTATION, 1)
+        resized = max(image.size) > max_edge
+        rotated = orientation != 1
+
+        # Let the JPEG decoder skip DCT detail we would throw away anyway
+        if source_format == 'JPEG' and max(image.size) > max_edge * 2:
+            image.draft('RGB', (max_edge * 2, max_edge * 2))
+
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=2.0)
+    except Image.DecompressionBombError as e:
+        # Pixel count beyond Image.MAX_IMAGE_PIXELS; decoding it would exhaust memory
+        raise ValueError(f'Image is too large to process: {str(e)}')
+    except (UnidentifiedImageError, OSError) as e:
+        # Pillow cannot decode it (e.g. HEIC without a plugin); send it as-is if Gemini can
+        mime_type = sniff_mime_type(original)
+        if mime_type not in GEMINI_MIME_TYPES.values():
+            raise ValueError(f'Unsupported or corrupt image: {str(e)}')
+        return {
+            'data': original,
+            'mime_type': mime_type,
+            'width': None,
+            'height': None,
+            'dhash': None,
+            'stats': _stats(original, original, started, resized=False, rotated=False, reencoded=False),
+        }
+
+    data = _encode(image, output_format)
+    mime_type = GEMINI_MIME_TYPES[output_format if output_format == 'WEBP' else 'JPEG']
+    reencoded = True
+
+    # Re-encoding an already small, upright image can make it larger
+    if not resized and not rotated and len(data) >= len(original) and source_mime in GEMINI_MIME_TYPES.values():
+        data, mime_type, reencoded = original, source_mime, False
+
+    return {
+        'data': data,
+        'mime_type': mime_type,
+        'width': image.width,
+        'height': image.height,
+        'dhash': dhash(image),
+        'stats': _stats(original, data, started, resized=resized, rotated=rotated, reencoded=reencoded),
+    }
+
+
+def _stats(original: bytes, processed: bytes, started: float, **flags) -> Dict[str, Any]:
+    saved = len(original) - len(processed)
+    return {
+        'original_bytes': len(original),
+        'processed_bytes': len(processed),
+        'bytes_saved': saved,
+        'saved_pct': round(100.0 * saved / len(original), 1) if original else 0.0,
+        'preprocess_ms': round((time.perf_counter() - started) * 1000, 1),
+        **flags,
+    }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers import only this module, not the API and its threads
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next batch starts fresh worker processes"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _preprocess_or_error(path: str) -> Dict[str, Any]:
+    try:
+        return preprocess_image(path)
+    except (ValueError, OSError) as e:
+        return {'error': str(e)}
+
+
+def preprocess_many(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Preprocess several images in the worker process pool.
+
+    Decoding and resizing are CPU-bound, so a process pool sidesteps the GIL.
+    Results are in input order; an image that cannot be processed yields
+    {'error': message} instead of raising. If a worker dies (killed for
+    memory, or crashed in a decoder), the images still in the pool are
+    reported as failed and the pool is replaced for the next batch.
+    """
+    if len(paths) <= 1 or POOL_WORKERS <= 1:
+        return [_preprocess_or_error(path) for path in paths]
+    pool = _get_pool()
+    try:
+        futures = [pool.submit(_preprocess_or_error, path) for path in paths]
+    except BrokenProcessPool:
+        # Broken by an earlier batch after it finished; retry once on a new pool
+        _discard_pool(pool)
+        pool = _get_pool()
+        futures = [pool.submit(_preprocess_or_error, path) for path in paths]
+    results = []
+    broken = False
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            broken = True
+            results.append({'error': 'Image preprocessing worker crashed'})
+    if broken:
+        _discard_pool(pool)
+    return results
@@ -0,0 +1,226 @@
+"""
+Multi-pattern keyword matching for chat messages.
+
+Every chat keyword (intent keywords, canned-response triggers, field-context
+triggers and question words) is compiled into one Aho-Corasick automaton,
+so a message is classified in a single left-to-right pass regardless of how
+many keywords there are. Keywords cover English, Devanagari Hindi and
+romanized Hindi ("mausam", "khad kya dale").
+
+Text and keywords go through the same normalization: NFC, case folding,
+zero-width joiners removed and chandrabindu folded into anusvara, so
+"गेहूँ" and "गेहूं" match the same keyword.
+
+Latin keywords must start at a word boundary (so "hi" does not fire inside
+"which"); keywords of three letters or fewer must also end at one.
+Devanagari keywords match anywhere, since inflections attach to the stem.
+"""
+import bisect
+import unicodedata
+from typing import Dict, Any, Iterable, List, Tuple
+
+# Intent keywords in priority order; detect_chat_intent reports the first three
+INTENT_KEYWORDS = {
+    'greeting': ['hello', 'hi', 'hey', 'नमस्ते', 'नमस्कार', 'प्रणाम', 'namaste', 'namaskar', 'pranam', 'ram ram'],
+    'weather': ['weather', 'rain', 'temperature', 'forecast', 'climate', 'मौसम', 'बारिश', 'तापमान',
+                'mausam', 'barish', 'baarish', 'tapman', 'baris'],
+    'crop_info': ['crop', 'plant', 'cultivation', 'grow', 'फसल', 'बीज', 'खेती', 'उगाना',
+                  'fasal', 'beej', 'bij', 'kheti', 'ugana', 'ugaye'],
+    'disease': ['disease', 'pest', 'infection', 'रोग', 'कीट', 'संक्रमण', 'बीमारी',
+                'rog', 'keet', 'keeda', 'kida', 'bimari', 'beemari', 'sankraman'],
+    'fertilizer': ['fertilizer', 'manure', 'nutrition', 'उर्वरक', 'खाद', 'urvarak', 'khad', 'khaad', 'urea', 'dap'],
+    'market': ['price', 'market', 'sell', 'buy', 'बाजार', 'मूल्य', 'कीमत', 'बेचना', 'खरीदना',
+               'bazar', 'bazaar', 'mandi', 'bhav', 'bhaav', 'keemat', 'kimat', 'bechna', 'kharidna'],
+    'irrigation': ['water', 'irrigation', 'moisture', 'पानी', 'सिंचाई', 'नमी', 'pani', 'paani', 'sinchai', 'nami'],
+    'farming_tech': ['technology', 'machine', 'equipment', 'तकनीक', 'मशीन', 'उपकरण', 'taknik', 'mashin', 'upkaran'],
+    'help': ['help', 'support', 'मदद', 'सहायता', 'madad', 'sahayata'],
+}
+
+# Words that mean the answer could use the farmer's own field data
+FIELD_CONTEXT_KEYWORDS = ['field', 'crop', 'farm', 'खेत', 'फसल', 'khet', 'fasal']
+
+# Question markers besides '?'
+QUESTION_KEYWORDS = ['?', 'क्या', 'कौन', 'कब', 'कैसे', 'kya', 'kaun', 'kab', 'kaise', 'kyun', 'kitna']
+
+INTENT = 'intent'
+RESPONSE = 'response'
+FIELD_CONTEXT = 'field_context'
+QUESTION = 'question'
+
+_REMOVED = {'\u200c': None, '\u200d': None, '\u200b': None, '\ufeff': None}
+_FOLDED = str.maketrans({**_REMOVED, 'ँ': 'ं'})
+
+
+def normalize(text: str) -> str:
+    """Normalization applied to both messages and keywords"""
+    return unicodedata.normalize('NFC', text or '').casefold().translate(_FOLDED)
+
+
+def _is_latin_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum() if ch else False
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton compiled to a DFA.
+
+    Every state's transition table already includes the failure-link
+    fallbacks, so matching is one dict lookup per input character.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._delta: List[Dict[str, int]] = [{}]
+        # Per state: (pattern, payload) pairs ending here, including via failure links
+        self._outputs: List[List[Tuple[str, Any]]] = [[]]
+
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self._delta[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._delta)
+                    self._delta.append({})
+                    self._outputs.append([])
+                    self._delta[state][ch] = nxt
+                state = nxt
+            self._outputs[state].append((pattern, payload))
+
+        # Breadth-first over the trie edges: resolve failure links, then fold
+        # each state's fallback transitions into its own table
+        fail = [0] * len(self._delta)
+        order = list(self._delta[0].values())
+        for state in order:
+            for ch, nxt in list(self._delta[state].items()):
+                order.append(nxt)
+                f = fail[state]
+                while f and ch not in self._delta[f]:
+                    f = fail[f]
+                fail[nxt] = self._delta[f].get(ch, 0)
+                self._outputs[nxt] = self._outputs[nxt] + self._outputs[fail[nxt]]
+        for state in order:
+            fallback = self._delta[fail[state]]
+            table = self._delta[state]
+            for ch, nxt in fallback.items():
+                table.setdefault(ch, nxt)
+
+    @property
+    def states(self) -> int:
+        return len(self._delta)
+
+    def iter_matches(self, text: str):
+        """Yield (end index, pattern, payload) for every keyword occurrence"""
+        delta, outputs = self._delta, self._outputs
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for pattern, payload in outputs[state]:
+                    yield i, pattern, payload
+
+
+class IntentMatcher:
+    """Intents, canned-response triggers, field-context and question words in one pass"""
+
+    def __init__(self, intent_keywords: Dict[str, List[str]] = None, response_keywords: List[str] = None,
+                 field_context_keywords: List[str] = None, question_keywords: List[str] = None):
+        intent_keywords = intent_keywords or INTENT_KEYWORDS
+        self.intent_order = list(intent_keywords)
+        self.response_order = list(response_keywords or [])
+
+        patterns = []
+        for intent, keywords in intent_keywords.items():
+            patterns += [(keyword, INTENT, intent) for keyword in keywords]
+        patterns += [(keyword, RESPONSE, keyword) for keyword in self.response_order]
+        patterns += [(keyword, FIELD_CONTEXT, True) for keyword in field_context_keywords or FIELD_CONTEXT_KEYWORDS]
+        patterns += [(keyword, QUESTION, True) for keyword in question_keywords or QUESTION_KEYWORDS]
+        self.automaton = AhoCorasick(self._compile(keyword, kind, value) for keyword, kind, value in patterns)
+
+    @staticmethod
+    def _compile(keyword: str, kind: str, value: Any) -> Tuple[str, Tuple]:
+        """(pattern, payload) with the word-boundary rules resolved up front"""
+        pattern = normalize(keyword)
+        latin = _is_latin_word_char(pattern[:1])
+        # payload: kind, value, length, check start boundary, check end boundary
+        return pattern, (kind, value, len(pattern), latin, latin and len(pattern) <= 3)
+
+    def _scan(self, text: str, results: List[Dict[str, Any]], offsets: List[int]):
+        """Record every keyword hit in text; offsets map positions to results"""
+        # Matches arrive in text order, so the owning message only moves forward
+        index, next_offset = 0, offsets[1] if len(offsets) > 1 else len(text) + 1
+        last = len(text) - 1
+        for end, _, (kind, value, length, check_start, check_end) in self.automaton.iter_matches(text):
+            if check_start:
+                start = end - length + 1
+                if start > 0 and _is_latin_word_char(text[start - 1]):
+                    continue
+                if check_end and end < last and _is_latin_word_char(text[end + 1]):
+                    continue
+            if end >= next_offset:
+                index = bisect.bisect_right(offsets, end) - 1
+                next_offset = offsets[index + 1] if index + 1 < len(offsets) else len(text) + 1
+            result = results[index]
+            if kind == INTENT:
+                result['intents'].add(value)
+            elif kind == RESPONSE:
+                result['responses'].add(value)
+            elif kind == FIELD_CONTEXT:
+                result['field_context'] = True
+            else:
+                result['contains_question'] = True
+
+    def _finish(self, hits: Dict[str, Any]) -> Dict[str, Any]:
+        intents = [intent for intent in self.intent_order if intent in hits['intents']]
+        return {
+            'intents': intents or ['general_query'],
+            'response_key': next((key for key in self.response_order if key in hits['responses']), None),
+            'field_context': hits['field_context'],
+            'contains_question': hits['contains_question'],
+        }
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {'intents': set(), 'responses': set(), 'field_context': False, 'contains_question': False}
+
+    def classify(self, message: str) -> Dict[str, Any]:
+        """
+        Classify a message in one pass.
+
+        Returns {'intents': [...] in priority order ('general_query' if none),
+        'response_key': first matching response keyword or None,
+        'field_context': bool, 'contains_question': bool}.
+        """
+        hits = self._empty()
+        self._scan(normalize(message), [hits], [0])
+        return self._finish(hits)
+
+    def classify_many(self, messages: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        Classify a batch of messages, e.g. stored chat history.
+
+        The batch is joined with newlines (no keyword contains one, and a
+        newline is a word boundary) and scanned in a single pass.
+        """
+        texts = [normalize(message).replace('\n', ' ') for message in messages]
+        if not texts:
+            return []
+        offsets, position = [], 0
+        for text in texts:
+            offsets.append(position)
+            position += len(text) + 1
+        hits = [self._empty() for _ in texts]
+        self._scan('\n'.join(texts), hits, offsets)
+        return [self._finish(result) for result in hits]
+
+    def intent_counts(self, messages: Iterable[str]) -> Dict[str, int]:
+        """How many messages carry each intent"""
+        counts = {intent: 0 for intent in self.intent_order + ['general_query']}
+        for result in self.classify_many(messages):
+            for intent in result['intents']:
+                counts[intent] += 1
+        return {intent: count for intent, count in counts.items() if count}
+
+
+# Shared matcher with the default keywords (no canned responses)
+matcher = IntentMatcher()
@@ -0,0 +1,103 @@
+"""
+Fast JSON serialization for API responses.
+
+jsonify() used Flask's default provider: the stdlib encoder with sorted keys
+and ASCII-only output, so every Devanagari character in a chat history or
+guidance article went out as a six-byte \\uXXXX escape. FastJSONProvider
+serializes with orjson when it is installed, and with the stdlib encoder
+otherwise (or with JSON_BACKEND=stdlib). Both produce the same output:
+
+- keys in insertion order, UTF-8, compact separators (indented in debug
+  mode, as Flask does)
+- datetime, date and time as ISO 8601 strings, where Flask wrote HTTP dates
+- UUID and Decimal as strings, numpy scalars and arrays as numbers and lists
+
+orjson does not take non-string dict keys or integers beyond 64 bits; such
+payloads are serialized by the stdlib encoder instead (json.stdlib_fallback
+in /api/metrics).
+
+A payload that is served many times unchanged can be serialized once with
+preserialize(). jsonify() sends the Preserialized bytes as they are (see
+http_cache.conditional_json).
+"""
+import os
+import json
+import uuid
+import decimal
+import datetime
+import dataclasses
+import importlib.util
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+
+ORJSON_AVAILABLE = importlib.util.find_spec('orjson') is not None
+BACKEND = os.environ.get('JSON_BACKEND', 'orjson' if ORJSON_AVAILABLE else 'stdlib')
+
+if BACKEND == 'orjson':
+    import orjson
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+elif BACKEND != 'stdlib':
+    raise ValueError(f"Unknown JSON_BACKEND: {BACKEND} (expected orjson or stdlib)")
+
+
+class Preserialized(bytes):
+    """A JSON document serialized ahead of time; jsonify() sends it unchanged"""
+
+
+def default(o: Any) -> Any:
+    """Convert values neither encoder handles natively"""
+    if isinstance(o, (datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, (uuid.UUID, decimal.Decimal)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, 'tolist'):
+        # numpy scalars and arrays
+        return o.tolist()
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON"""
+    if BACKEND == 'orjson':
+        try:
+            return orjson.dumps(obj, default=default,
+                                option=_ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+        except TypeError:
+            metrics.increment('json.stdlib_fallback')
+    if indent:
+        return json.dumps(obj, default=default, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def preserialize(obj: Any) -> Preserialized:
+    """Serialize a payload once for responses that are sent many times"""
+    return obj if isinstance(obj, Preserialized) else Preserialized(dumps(obj))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider built on dumps(); loads() is Flask's own"""
+
+    # Used by calls with explicit encoder arguments, which go to the stdlib
+    default = staticmethod(default)
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, Preserialized):
+            body = obj
+        else:
+            body = dumps(obj, indent=self.compact is False or (self.compact is None and self._app.debug))
+        return self._app.response_class(body, mimetype=self.mimetype)
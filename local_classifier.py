@@ -0,0 +1,367 @@
+"""
+CPU-only first-pass disease classifier.
+
+A colour/texture feature vector is extracted from each leaf photo with NumPy
+and matched against a k-nearest-neighbour index of labelled examples for the
+same crop. When the neighbours agree strongly the local answer is returned in
+a few milliseconds; ambiguous images are escalated to Gemini.
+
+Features (L2-normalised per block, FEATURE_DIM values in total):
+
+- hue/saturation histogram of leaf pixels (colour of the lesions and tissue)
+- shares of lesion colours among leaf pixels: brown, yellow, white/grey, dark
+- uniform local-binary-pattern histogram (spot and mildew texture)
+- gradient orientation histogram weighted by magnitude (lesion edges)
+- value histogram per hue bin (dark lesions vs. bright tissue of the same hue)
+
+The index learns from Gemini: confident Gemini diagnoses are added as
+examples and persisted to LOCAL_CLASSIFIER_INDEX, so the local stage improves
+as the app is used. Every gunicorn worker learns on its own, so a save takes
+a file lock, merges this process's new examples into the index on disk and
+adopts the result, examples from the other workers included. An index can also be bootstrapped from a directory of
+labelled photos laid out as <root>/<crop>/<disease name>/*.jpg:
+
+    python local_classifier.py build path/to/labelled/photos
+"""
+import io
+import os
+import logging
+import sys
+import json
+import time
+import fcntl
+import threading
+import contextlib
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Crops the local stage covers (the ones the built-in fallback knows about)
+SUPPORTED_CROPS = ('rice', 'wheat', 'cotton', 'tomato', 'potato')
+
+ENABLED = os.environ.get('LOCAL_CLASSIFIER_ENABLED', '1') != '0'
+INDEX_PATH = os.environ.get('LOCAL_CLASSIFIER_INDEX', os.path.join('data', 'disease_knn.npz'))
+
+K = int(os.environ.get('LOCAL_CLASSIFIER_K', '5'))
+# Weighted neighbour vote needed to answer locally instead of asking Gemini
+MIN_AGREEMENT = float(os.environ.get('LOCAL_CLASSIFIER_MIN_AGREEMENT', '0.8'))
+# Cosine similarity the nearest neighbour must reach
+MIN_SIMILARITY = float(os.environ.get('LOCAL_CLASSIFIER_MIN_SIMILARITY', '0.9'))
+# Examples a crop needs before the local stage answers for it
+MIN_EXAMPLES_PER_CROP = int(os.environ.get('LOCAL_CLASSIFIER_MIN_EXAMPLES', '20'))
+# Gemini confidence needed for a diagnosis to become a training example
+LEARN_MIN_CONFIDENCE = 0.75
+
+FEATURE_EDGE = 256
+HUE_BINS, SAT_BINS = 18, 4
+LBP_BINS = 10
+GRADIENT_BINS = 12
+FEATURE_DIM = HUE_BINS * SAT_BINS + 4 + LBP_BINS + GRADIENT_BINS + HUE_BINS * 5
+
+# Persist learned examples after this many additions
+SAVE_EVERY = 20
+
+# Uniform LBP codes (at most two 0/1 transitions) map to their number of set
+# bits; every other code shares the last bin
+_UNIFORM_LBP = np.full(256, LBP_BINS - 1, dtype=np.int64)
+for _code in range(256):
+    _bits = [(_code >> i) & 1 for i in range(8)]
+    if sum(_bits[i] != _bits[(i + 1) % 8] for i in range(8)) <= 2:
+        _UNIFORM_LBP[_code] = sum(_bits)
+
+
+def _l2(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def load_rgb(source: Union[str, bytes], edge: int = FEATURE_EDGE) -> np.ndarray:
+    """Decode an image (path or bytes) to an upright RGB float array at most `edge` px"""
+    image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    image.draft('RGB', (edge * 2, edge * 2))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((edge, edge), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def extract_features(rgb: np.ndarray) -> np.ndarray:
+    """Colour and texture descriptor of a leaf photo (FEATURE_DIM float32 values)"""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=2)
+    minc = rgb.min(axis=2)
+    delta = maxc - minc
+    value = maxc
+    saturation = np.where(maxc > 0, delta / np.maximum(maxc, 1e-6), 0)
+
+    # Hue in [0, 1) computed per dominant channel
+    safe = np.maximum(delta, 1e-6)
+    hue = np.where(maxc == r, ((g - b) / safe) % 6,
+                   np.where(maxc == g, (b - r) / safe + 2, (r - g) / safe + 4)) / 6.0
+    hue = np.where(delta > 0, hue, 0)
+
+    # Leaf pixels: reasonably saturated and not background-dark or blown out
+    leaf = (saturation > 0.15) & (value > 0.12) & (value < 0.98)
+    if leaf.sum() < 0.02 * leaf.size:
+        leaf = np.ones_like(leaf)
+    leaf_count = float(leaf.sum())
+
+    hue_bin = np.minimum((hue * HUE_BINS).astype(np.int64), HUE_BINS - 1)
+    sat_bin = np.minimum((saturation * SAT_BINS).astype(np.int64), SAT_BINS - 1)
+    colour_hist = np.bincount((hue_bin * SAT_BINS + sat_bin)[leaf], minlength=HUE_BINS * SAT_BINS)
+
+    hue_deg = hue * 360
+    brown = leaf & (hue_deg >= 10) & (hue_deg < 45) & (value < 0.65)
+    yellow = leaf & (hue_deg >= 45) & (hue_deg < 70) & (value >= 0.5)
+    pale = (saturation < 0.15) & (value > 0.7)
+    dark = (value < 0.2)
+    lesion_shares = np.array([brown.sum() / leaf_count, yellow.sum() / leaf_count,
+                              pale.mean(), dark.mean()], dtype=np.float32)
+
+    # Brightness-by-hue profile: value histogram (5 bands) per hue bin
+    value_bin = np.minimum((value * 5).astype(np.int64), 4)
+    hue_value_hist = np.bincount((hue_bin * 5 + value_bin)[leaf], minlength=HUE_BINS * 5)
+
+    gray = 0.299 * r + 0.587 * g + 0.114 * b
+
+    # 8-neighbour local binary patterns over the interior pixels
+    center = gray[1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.int64)
+    neighbours = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+    height, width = gray.shape
+    for bit, (dy, dx) in enumerate(neighbours):
+        shifted = gray[1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        codes |= (shifted >= center).astype(np.int64) << bit
+    lbp_hist = np.bincount(_UNIFORM_LBP[codes][leaf[1:-1, 1:-1]], minlength=LBP_BINS)
+
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy)
+    orientation = (np.arctan2(gy, gx) % np.pi) / np.pi
+    orientation_bin = np.minimum((orientation * GRADIENT_BINS).astype(np.int64), GRADIENT_BINS - 1)
+    gradient_hist = np.bincount(orientation_bin[leaf], weights=magnitude[leaf], minlength=GRADIENT_BINS)
+
+    return np.concatenate([
+        _l2(colour_hist.astype(np.float32)),
+        _l2(lesion_shares) * 0.5,
+        _l2(lbp_hist.astype(np.float32)),
+        _l2(gradient_hist.astype(np.float32)) * 0.5,
+        _l2(hue_value_hist.astype(np.float32)),
+    ]).astype(np.float32)
+
+
+class KNNIndex:
+    """Brute-force cosine k-NN over unit feature vectors, partitioned by crop"""
+
+    def __init__(self):
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._labels: Dict[str, List[str]] = {}
+        # Display name, symptoms and treatment per disease code
+        self.descriptions: Dict[str, Dict[str, str]] = {}
+
+    def add(self, crop: str, label: str, vector: np.ndarray, description: Dict[str, str] = None):
+        crop = crop.lower()
+        vector = _l2(vector.astype(np.float32))[None, :]
+        if crop in self._vectors:
+            self._vectors[crop] = np.vstack([self._vectors[crop], vector])
+        else:
+            self._vectors[crop] = vector
+        self._labels.setdefault(crop, []).append(label)
+        if description:
+            self.descriptions[label] = description
+
+    def count(self, crop: str = None) -> int:
+        if crop:
+            return len(self._labels.get(crop.lower(), []))
+        return sum(len(labels) for labels in self._labels.values())
+
+    def query(self, crop: str, vector: np.ndarray, k: int = K) -> List[Tuple[str, float]]:
+        """The k nearest (label, cosine similarity) pairs for a crop, best first"""
+        vectors = self._vectors.get(crop.lower())
+        if vectors is None:
+            return []
+        similarities = vectors @ _l2(vector.astype(np.float32))
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        labels = self._labels[crop.lower()]
+        return [(labels[i], float(similarities[i])) for i in top]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {}
+        for crop, vectors in self._vectors.items():
+            arrays[f'vectors__{crop}'] = vectors
+            arrays[f'labels__{crop}'] = np.array(self._labels[crop])
+        arrays['descriptions'] = np.array([json.dumps(self.descriptions)])
+        tmp_path = f'{path}.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'KNNIndex':
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            for name in data.files:
+                if name.startswith('vectors__'):
+                    crop = name[len('vectors__'):]
+                    index._vectors[crop] = data[name].astype(np.float32)
+                    index._labels[crop] = [str(label) for label in data[f'labels__{crop}']]
+            if 'descriptions' in data.files:
+                index.descriptions = json.loads(str(data['descriptions'][0]))
+        return index
+
+
+@contextlib.contextmanager
+def _index_file_lock(path: str):
+    """Exclusive lock held by whichever process is saving the index at path"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class LocalDiseaseClassifier:
+    """First-pass classifier that answers confident cases and escalates the rest"""
+
+    def __init__(self, index_path: str = INDEX_PATH):
+        self.index_path = index_path
+        self.index = KNNIndex()
+        self._lock = threading.Lock()
+        self._loaded = False
+        # Examples learned since the last save, as KNNIndex.add arguments
+        self._unsaved: List[Tuple[str, str, np.ndarray, Dict[str, str]]] = []
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if os.path.exists(self.index_path):
+            try:
+                self.index = KNNIndex.load(self.index_path)
+                logger.info("Local disease classifier loaded %s examples", self.index.count())
+            except Exception as e:
+                logger.error("Error loading local disease classifier index: %s", e)
+
+    def covers(self, crop_type: str) -> bool:
+        return ENABLED and (crop_type or '').strip().lower() in SUPPORTED_CROPS
+
+    def predict(self, source: Union[str, bytes], crop_type: str) -> Optional[Dict[str, Any]]:
+        """
+        Classify an image for a supported crop.
+
+        Returns None when the crop is not covered or has too few examples,
+        otherwise {'detection', 'agreement', 'similarity', 'confident',
+        'features', 'elapsed_ms'}. 'features' can be passed to learn().
+        """
+        if not self.covers(crop_type):
+            return None
+        started = time.perf_counter()
+        crop = crop_type.strip().lower()
+        with self._lock:
+            self._ensure_loaded()
+            enough = self.index.count(crop) >= MIN_EXAMPLES_PER_CROP
+        features = extract_features(load_rgb(source))
+        if not enough:
+            return {'detection': None, 'confident': False, 'features': features,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+        with self._lock:
+            neighbours = self.index.query(crop, features)
+        votes: Dict[str, float] = {}
+        for label, similarity in neighbours:
+            votes[label] = votes.get(label, 0.0) + max(similarity, 0.0)
+        label, weight = max(votes.items(), key=lambda item: item[1])
+        agreement = weight / (sum(votes.values()) or 1.0)
+        similarity = neighbours[0][1]
+
+        description = self.index.descriptions.get(label, {})
+        detection = {
+            'disease_name': description.get('disease_name', label.replace('_', ' ').title()),
+            'disease_code': label,
+            # Neighbour agreement scaled by how close the best match is
+            'confidence': round(agreement * min(1.0, similarity), 3),
+            'symptoms': description.get('symptoms', ''),
+            'treatment': description.get('treatment', ''),
+        }
+        return {
+            'detection': detection,
+            'agreement': round(agreement, 3),
+            'similarity': round(similarity, 3),
+            'confident': agreement >= MIN_AGREEMENT and similarity >= MIN_SIMILARITY,
+            'features': features,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def learn(self, features: np.ndarray, crop_type: str, detection: Dict[str, Any]):
+        """Add a confident Gemini diagnosis as a training example"""
+        if features is None or not self.covers(crop_type) or not detection.get('disease_code'):
+            return
+        if (detection.get('confidence') or 0) < LEARN_MIN_CONFIDENCE:
+            return
+        example = (crop_type, detection['disease_code'], features, {
+            'disease_name': detection['disease_name'],
+            'symptoms': detection.get('symptoms', ''),
+            'treatment': detection.get('treatment', ''),
+        })
+        with self._lock:
+            self._ensure_loaded()
+            self.index.add(*example)
+            self._unsaved.append(example)
+            if len(self._unsaved) >= SAVE_EVERY:
+                self._save_locked()
+
+    def _save_locked(self):
+        """Merge this process's new examples into the index file and adopt the result"""
+        try:
+            with _index_file_lock(self.index_path):
+                merged = KNNIndex.load(self.index_path) if os.path.exists(self.index_path) else KNNIndex()
+                for example in self._unsaved:
+                    merged.add(*example)
+                merged.save(self.index_path)
+            self.index = merged
+            self._unsaved = []
+        except Exception as e:
+            logger.error("Error saving local disease classifier index: %s", e)
+
+
+def build_index(root: str, index_path: str = INDEX_PATH) -> KNNIndex:
+    """Build an index from labelled photos under <root>/<crop>/<disease name>/"""
+    import disease_analysis
+
+    index = KNNIndex()
+    for crop in sorted(os.listdir(root)):
+        crop_dir = os.path.join(root, crop)
+        if not os.path.isdir(crop_dir):
+            continue
+        for disease in sorted(os.listdir(crop_dir)):
+            disease_dir = os.path.join(crop_dir, disease)
+            if not os.path.isdir(disease_dir):
+                continue
+            name, _ = disease_analysis.normalize_disease_name(disease.replace('_', ' '))
+            code = disease_analysis.disease_code(name)
+            for filename in sorted(os.listdir(disease_dir)):
+                try:
+                    features = extract_features(load_rgb(os.path.join(disease_dir, filename)))
+                except Exception as e:
+                    print(f"Skipping {filename}: {str(e)}")
+                    continue
+                index.add(crop, code, features, {'disease_name': name})
+    index.save(index_path)
+    print(f"Saved {index.count()} examples to {index_path}")
+    return index
+
+
+# Shared classifier used by the API process
+classifier = LocalDiseaseClassifier()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'build':
+        build_index(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else INDEX_PATH)
+    else:
+        print(__doc__)
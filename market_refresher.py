@@ -0,0 +1,262 @@
+"""
+Scheduled market price ingestion for FarmAssistAI.
+
+Prices used to be generated inline by /api/market_prices whenever no rows
+were found. The refresher now owns ingestion: a background thread writes one
+MarketPriceSnapshot document per crop per day (plus the individual
+MarketPrice rows used by aggregation and price alerts), and the endpoint only
+reads the latest snapshots together with their staleness metadata.
+
+Under gunicorn the scheduler runs in one worker only (see gunicorn.conf.py),
+but any worker can be asked for a crop nobody tracks yet. That worker
+ingests the crop's first snapshot itself. The stored snapshots double as the
+list of tracked crops, because every process adds the crops it finds in the
+last two days' snapshots. The scheduler therefore keeps a crop fresh from
+then on, whichever worker first asked for it.
+"""
+import os
+import logging
+import time
+import random
+import threading
+import datetime
+from typing import List, Dict, Any, Optional
+
+from firebase_models import MarketPrice, MarketPriceSnapshot
+import market_stats
+import price_alerts
+
+logger = logging.getLogger(__name__)
+
+# Crops and markets covered by the generated price feed
+SUPPORTED_CROPS = [
+    'Rice', 'Wheat', 'Cotton', 'Sugarcane', 'Maize',
+    'Soybean', 'Potato', 'Tomato', 'Chickpea', 'Mustard',
+    'Groundnut', 'Chilli', 'Onion', 'Turmeric', 'Ginger',
+    'Millet', 'Barley', 'Jute', 'Sunflower'
+]
+
+MARKETS = ['Delhi', 'Mumbai', 'Kolkata', 'Chennai', 'Lucknow', 'Bangalore', 'Hyderabad']
+
+# Realistic base prices for different crops (in ₹ per quintal)
+BASE_PRICES = {
+    'Rice': 2200,
+    'Wheat': 2000,
+    'Cotton': 6000,
+    'Sugarcane': 300,
+    'Maize': 1800,
+    'Soybean': 4000,
+    'Potato': 1500,
+    'Tomato': 2000,
+    'Chickpea': 5000,
+    'Mustard': 5500,
+    'Groundnut': 5800,
+    'Chilli': 8000,
+    'Onion': 1200,
+    'Turmeric': 7500,
+    'Ginger': 6500,
+    'Millet': 2800,
+    'Barley': 2200,
+    'Jute': 4500,
+    'Sunflower': 5600
+}
+
+# How often the background thread checks whether today's snapshot exists
+REFRESH_CHECK_INTERVAL = int(os.environ.get('MARKET_REFRESH_CHECK_INTERVAL', '300'))
+
+# Snapshots older than this are reported as stale
+STALE_AFTER_SECONDS = int(os.environ.get('MARKET_SNAPSHOT_STALE_AFTER', str(36 * 3600)))
+
+# Upper bound on crops requested by clients that the refresher will start tracking
+MAX_TRACKED_CROPS = 100
+
+# Set MARKET_REFRESH_ENABLED=0 on processes that should only read snapshots
+REFRESH_ENABLED = os.environ.get('MARKET_REFRESH_ENABLED', '1') != '0'
+
+
+def generate_crop_prices(crop: str, date: str, generated_at: str) -> List[Dict[str, Any]]:
+    """Generate one price row per market for a crop"""
+    base_price = BASE_PRICES.get(crop, 2000)
+    variation_pct = random.uniform(-0.1, 0.1)
+
+    rows = []
+    for market in MARKETS:
+        # Add market-specific variation
+        market_variation = random.uniform(-0.05, 0.05)
+        final_price = round(base_price * (1 + variation_pct + market_variation), 0)
+
+        rows.append({
+            # Deterministic ID so a repeated refresh for the same day overwrites
+            'id': f"{MarketPriceSnapshot.snapshot_id(crop, date)}_{market.lower()}",
+            'crop_type': crop,
+            'market_name': market,
+            'price': final_price,
+            'min_price': round(final_price * 0.95, 0),
+            'max_price': round(final_price * 1.1, 0),
+            'date': generated_at,
+            'source': 'Generated Data'
+        })
+    return rows
+
+
+def snapshot_staleness(snapshot: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Describe how fresh a snapshot is for API consumers"""
+    if not snapshot:
+        return {'date': None, 'generated_at': None, 'version': None, 'age_seconds': None, 'stale': True}
+
+    age = None
+    try:
+        generated = datetime.datetime.fromisoformat(snapshot['generated_at'])
+        age = int((datetime.datetime.utcnow() - generated).total_seconds())
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    return {
+        'date': snapshot.get('date'),
+        'generated_at': snapshot.get('generated_at'),
+        'version': snapshot.get('version'),
+        'age_seconds': age,
+        'stale': age is None or age > STALE_AFTER_SECONDS,
+    }
+
+
+class MarketPriceRefresher:
+    """Background ingestion of daily market price snapshots"""
+
+    def __init__(self, crops: List[str] = None, check_interval: int = REFRESH_CHECK_INTERVAL):
+        self.crops = list(crops or SUPPORTED_CROPS)
+        self.check_interval = check_interval
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._loaded_at = 0.0
+
+    def start(self):
+        """Start the scheduler thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='market-price-refresher', daemon=True)
+        self._thread.start()
+
+    def request_refresh(self, crop_type: str = None):
+        """Ask the scheduler to refresh soon, optionally adding a new crop"""
+        added = False
+        if crop_type:
+            with self._lock:
+                if crop_type not in self.crops and len(self.crops) < MAX_TRACKED_CROPS:
+                    self.crops.append(crop_type)
+                    added = True
+        if self._thread and self._thread.is_alive():
+            self._wakeup.set()
+        elif added and REFRESH_ENABLED:
+            # The scheduler runs in another process; ingest the new crop here once
+            threading.Thread(target=self._refresh_new_crop, args=(crop_type,),
+                             name='market-price-ingest', daemon=True).start()
+
+    def _refresh_new_crop(self, crop_type: str):
+        try:
+            self.refresh([crop_type])
+        except Exception as e:
+            logger.error("Error ingesting market prices for %s: %s", crop_type, e)
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_if_due()
+            except Exception as e:
+                logger.error("Error refreshing market prices: %s", e)
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+
+    def refresh_if_due(self) -> bool:
+        """Refresh when any tracked crop has no snapshot for today"""
+        today = datetime.datetime.utcnow().date().isoformat()
+        self._load_snapshots()
+        with self._lock:
+            due = [crop for crop in self.crops
+                   if self._snapshots.get(crop, {}).get('date') != today]
+        if due:
+            self.refresh(due)
+            return True
+        return False
+
+    def refresh(self, crops: List[str] = None) -> List[Dict[str, Any]]:
+        """Generate and persist today's prices and snapshots for the given crops"""
+        with self._refresh_lock:
+            now = datetime.datetime.utcnow()
+            today = now.date().isoformat()
+            generated_at = now.isoformat()
+            version = int(now.timestamp() * 1000)
+
+            price_rows, snapshots = [], []
+            for crop in crops or self.crops:
+                rows = generate_crop_prices(crop, today, generated_at)
+                price_rows.extend(rows)
+                snapshots.append({
+                    'id': MarketPriceSnapshot.snapshot_id(crop, today),
+                    'crop_type': crop,
+                    'date': today,
+                    'generated_at': generated_at,
+                    'version': version,
+                    'source': 'Generated Data',
+                    'prices': [{key: row[key] for key in ('market_name', 'price', 'min_price', 'max_price')}
+                               for row in rows],
+                })
+
+            MarketPrice.create_many(price_rows)
+            MarketPriceSnapshot.create_many(snapshots)
+
+            with self._lock:
+                for snapshot in snapshots:
+                    self._snapshots[snapshot['crop_type']] = snapshot
+
+            # New rows invalidate cached aggregates and may trigger price alerts
+            market_stats.invalidate_market_stats()
+            try:
+                price_alerts.engine.evaluate_many(price_rows)
+                price_alerts.engine.flush()
+            except Exception as e:
+                logger.error("Error evaluating price alerts: %s", e)
+
+            logger.info("Refreshed market price snapshots for %s crops", len(snapshots))
+            return snapshots
+
+    def _load_snapshots(self):
+        """Warm the in-process snapshot cache, re-reading it every check interval"""
+        if time.time() - self._loaded_at < self.check_interval:
+            return
+        today = datetime.datetime.utcnow().date()
+        for day in (today, today - datetime.timedelta(days=1)):
+            snapshots = MarketPriceSnapshot.get_by_date(day.isoformat())
+            with self._lock:
+                for snapshot in snapshots:
+                    current = self._snapshots.get(snapshot.get('crop_type'))
+                    if not current or current.get('date', '') < snapshot.get('date', ''):
+                        self._snapshots[snapshot['crop_type']] = snapshot
+                    # Crops first ingested by another process are tracked from now on
+                    if snapshot['crop_type'] not in self.crops and len(self.crops) < MAX_TRACKED_CROPS:
+                        self.crops.append(snapshot['crop_type'])
+        self._loaded_at = time.time()
+
+    def latest(self, crop_type: str = None) -> List[Dict[str, Any]]:
+        """Return the latest snapshot for one crop or for every tracked crop"""
+        self._load_snapshots()
+        with self._lock:
+            if crop_type:
+                snapshot = self._snapshots.get(crop_type)
+            else:
+                return [self._snapshots[crop] for crop in self.crops if crop in self._snapshots]
+
+        if snapshot is None:
+            # Another process may have written it; fall back to a single read
+            snapshot = MarketPriceSnapshot.get_latest_for_crop(crop_type)
+            if snapshot:
+                with self._lock:
+                    self._snapshots[crop_type] = snapshot
+        return [snapshot] if snapshot else []
+
+
+# Shared refresher used by the API process
+refresher = MarketPriceRefresher()
@@ -0,0 +1,284 @@
+"""
+Market price aggregation for FarmAssistAI.
+Computes grouped statistics (by crop, market, day or week) and rolling window
+trends over MarketPrice documents so the mobile client no longer has to
+download every raw row and aggregate it on-device.
+"""
+import os
+import threading
+import time
+import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from firebase_models import MarketPrice
+
+# Dimensions a caller may group by, in the order they are applied
+GROUP_BY_FIELDS = ('crop', 'market', 'day', 'week')
+
+# Percentiles reported for every group
+PERCENTILES = (25, 50, 75, 90)
+
+# Windows the market screen asks for (7-day and 30-day trends)
+DEFAULT_WINDOWS = (7, 30)
+MAX_WINDOW_DAYS = 365
+
+# Span of the rolling mean reported inside each window's daily series
+ROLLING_SPAN_DAYS = 7
+
+# Aggregates are cached per (window, grouping, crop) for this many seconds
+CACHE_TTL_SECONDS = int(os.environ.get('MARKET_STATS_CACHE_TTL', '900'))
+
+_cache: Dict[Tuple, Tuple[float, Dict[str, Any]]] = {}
+_cache_lock = threading.Lock()
+
+
+def _day_ordinal(value: str) -> Optional[int]:
+    """Convert an ISO date/datetime string into a proleptic Gregorian ordinal"""
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def load_price_frame(window_days: int, crop_type: str = None,
+                     today: datetime.date = None) -> Dict[str, np.ndarray]:
+    """
+    Load MarketPrice documents for the trailing window into columnar arrays.
+
+    Returns a dict of equally sized NumPy arrays: 'crop' and 'market' (object
+    labels), 'day' (date ordinals) and 'price' (float64).
+    """
+    today = today or datetime.datetime.utcnow().date()
+    start = today - datetime.timedelta(days=window_days - 1)
+
+    filters = [{'field': 'date', 'op': '>=', 'value': start.isoformat()}]
+    if crop_type:
+        filters.append({'field': 'crop_type', 'value': crop_type})
+    rows = MarketPrice.list(filters=filters)
+
+    crops, markets, days, prices = [], [], [], []
+    end_ordinal = today.toordinal()
+    for row in rows:
+        day = _day_ordinal(row.get('date', ''))
+        price = row.get('price')
+        if day is None or price is None or day > end_ordinal:
+            continue
+        crops.append(row.get('crop_type', ''))
+        markets.append(row.get('market_name', ''))
+        days.append(day)
+        prices.append(price)
+
+    return {
+        'crop': np.asarray(crops, dtype=object),
+        'market': np.asarray(markets, dtype=object),
+        'day': np.asarray(days, dtype=np.int64),
+        'price': np.asarray(prices, dtype=np.float64),
+    }
+
+
+def _group_columns(frame: Dict[str, np.ndarray], group_by: List[str]) -> List[np.ndarray]:
+    """Return the key column for every requested grouping dimension"""
+    columns = []
+    for dimension in group_by:
+        if dimension == 'week':
+            # Bucket by the Monday that starts the ISO week (ordinal 1 is a Monday)
+            days = frame['day']
+            columns.append(days - ((days - 1) % 7))
+        else:
+            columns.append(frame[dimension])
+    return columns
+
+
+def _percentiles(sorted_prices: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> Dict[int, np.ndarray]:
+    """Linear-interpolated percentiles for each contiguous sorted segment"""
+    result = {}
+    for q in PERCENTILES:
+        position = starts + (q / 100.0) * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        weight = position - lower
+        result[q] = sorted_prices[lower] * (1 - weight) + sorted_prices[upper] * weight
+    return result
+
+
+def grouped_stats(frame: Dict[str, np.ndarray], group_by: List[str]) -> List[Dict[str, Any]]:
+    """
+    Compute count/min/max/mean/std/spread and percentiles for every group.
+
+    All work happens in a handful of vectorized passes: one factorisation of the
+    group keys, one lexsort and one reduceat per statistic.
+    """
+    prices = frame['price']
+    if prices.size == 0:
+        return []
+
+    # Factorise each key column and combine them into a single group code
+    labels, codes = [], np.zeros(prices.size, dtype=np.int64)
+    for column in _group_columns(frame, group_by):
+        uniques, inverse = np.unique(column, return_inverse=True)
+        labels.append(uniques)
+        codes = codes * len(uniques) + inverse
+
+    # Sort by group, then by price so percentiles can be read off directly
+    order = np.lexsort((prices, codes))
+    sorted_codes = codes[order]
+    sorted_prices = prices[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.diff(np.r_[starts, sorted_codes.size])
+
+    sums = np.add.reduceat(sorted_prices, starts)
+    squares = np.add.reduceat(sorted_prices * sorted_prices, starts)
+    means = sums / counts
+    stds = np.sqrt(np.maximum(squares / counts - means * means, 0.0))
+    mins = sorted_prices[starts]
+    maxs = sorted_prices[starts + counts - 1]
+    pcts = _percentiles(sorted_prices, starts, counts)
+
+    # Decode the combined group code back into the original labels
+    group_codes = sorted_codes[starts]
+    decoded = []
+    for uniques in reversed(labels):
+        decoded.append(uniques[group_codes % len(uniques)])
+        group_codes = group_codes // len(uniques)
+    decoded.reverse()
+
+    groups = []
+    for i in range(starts.size):
+        group = {}
+        for dimension, values in zip(group_by, decoded):
+            value = values[i]
+            if dimension in ('day', 'week'):
+                value = datetime.date.fromordinal(int(value)).isoformat()
+            group[dimension] = value
+        group.update({
+            'count': int(counts[i]),
+            'min': round(float(mins[i]), 2),
+            'max': round(float(maxs[i]), 2),
+            'mean': round(float(means[i]), 2),
+            'std': round(float(stds[i]), 2),
+            'spread': round(float(maxs[i] - mins[i]), 2),
+            'percentiles': {f'p{q}': round(float(pcts[q][i]), 2) for q in PERCENTILES},
+        })
+        groups.append(group)
+    return groups
+
+
+def rolling_trends(frame: Dict[str, np.ndarray], window_days: int,
+                   today: datetime.date = None) -> List[Dict[str, Any]]:
+    """
+    Per-crop daily national average with a trailing ROLLING_SPAN_DAYS mean.
+
+    Daily means are scattered onto a dense day grid with np.bincount and the
+    rolling mean is taken from cumulative sums, so the cost is linear in the
+    number of rows plus days regardless of the window size.
+    """
+    prices = frame['price']
+    if prices.size == 0:
+        return []
+
+    today = today or datetime.datetime.utcnow().date()
+    end = today.toordinal()
+    first = end - window_days + 1
+    n_days = window_days
+
+    crop_labels, crop_codes = np.unique(frame['crop'], return_inverse=True)
+    slot = crop_codes * n_days + (frame['day'] - first)
+    size = len(crop_labels) * n_days
+
+    totals = np.bincount(slot, weights=prices, minlength=size).reshape(len(crop_labels), n_days)
+    counts = np.bincount(slot, minlength=size).reshape(len(crop_labels), n_days)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily_mean = totals / counts
+
+    # Trailing rolling mean over the days that actually have observations
+    span = min(ROLLING_SPAN_DAYS, n_days)
+    cum_totals = np.cumsum(np.nan_to_num(daily_mean), axis=1)
+    cum_counts = np.cumsum(counts > 0, axis=1)
+    lagged_totals = np.zeros_like(cum_totals)
+    lagged_counts = np.zeros_like(cum_counts)
+    lagged_totals[:, span:] = cum_totals[:, :-span]
+    lagged_counts[:, span:] = cum_counts[:, :-span]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rolling_mean = (cum_totals - lagged_totals) / (cum_counts - lagged_counts)
+
+    # Compare the second half of the window against the first half
+    half = max(n_days // 2, 1)
+    head_totals, head_counts = totals[:, :half].sum(axis=1), counts[:, :half].sum(axis=1)
+    tail_totals, tail_counts = totals[:, half:].sum(axis=1), counts[:, half:].sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        head_mean = head_totals / head_counts
+        tail_mean = tail_totals / tail_counts
+        change_pct = (tail_mean - head_mean) / head_mean * 100
+
+    trends = []
+    for i, crop in enumerate(crop_labels):
+        series = []
+        for d in range(n_days):
+            if counts[i, d] == 0:
+                continue
+            series.append({
+                'date': datetime.date.fromordinal(first + d).isoformat(),
+                'mean': round(float(daily_mean[i, d]), 2),
+                'rolling_mean': round(float(rolling_mean[i, d]), 2),
+                'markets': int(counts[i, d]),
+            })
+        valid = counts[i] > 0
+        trends.append({
+            'crop': crop,
+            'window_days': window_days,
+            'mean': round(float(totals[i].sum() / counts[i].sum()), 2),
+            'min_daily_mean': round(float(np.nanmin(daily_mean[i, valid])), 2),
+            'max_daily_mean': round(float(np.nanmax(daily_mean[i, valid])), 2),
+            'change_pct': None if np.isnan(change_pct[i]) else round(float(change_pct[i]), 2),
+            'series': series,
+        })
+    return trends
+
+
+def parse_group_by(value: str) -> List[str]:
+    """Parse a comma separated group_by parameter, raising ValueError if invalid"""
+    group_by = [part.strip() for part in (value or 'crop').split(',') if part.strip()]
+    invalid = [part for part in group_by if part not in GROUP_BY_FIELDS]
+    if invalid:
+        raise ValueError(f"Unsupported group_by value(s): {', '.join(invalid)}")
+    if 'day' in group_by and 'week' in group_by:
+        raise ValueError("group_by cannot contain both 'day' and 'week'")
+    return group_by
+
+
+def get_market_stats(window_days: int, group_by: List[str], crop_type: str = None) -> Dict[str, Any]:
+    """Return cached aggregates for the window, recomputing them when stale"""
+    key = (window_days, tuple(group_by), crop_type or '')
+    now = time.time()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and now - cached[0] < CACHE_TTL_SECONDS:
+            return cached[1]
+
+    today = datetime.datetime.utcnow().date()
+    frame = load_price_frame(window_days, crop_type, today)
+    stats = {
+        'window_days': window_days,
+        'group_by': group_by,
+        'crop_type': crop_type,
+        'rows': int(frame['price'].size),
+        'groups': grouped_stats(frame, group_by),
+        'trends': rolling_trends(frame, window_days, today),
+        'generated_at': datetime.datetime.utcnow().isoformat(),
+    }
+
+    with _cache_lock:
+        _cache[key] = (now, stats)
+    return stats
+
+
+def invalidate_market_stats():
+    """Drop every cached aggregate, e.g. after new prices have been ingested"""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,46 @@
+"""
+In-process counters for operational metrics.
+
+Counters are keyed by name plus optional labels and exposed as JSON through
+/api/metrics, e.g.
+
+    metrics.increment('disease_analysis.parse', outcome='ok')
+
+Values are per process; aggregate across gunicorn workers in the scraper.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict, Any, Tuple
+
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = defaultdict(int)
+_lock = threading.Lock()
+
+
+def increment(name: str, amount: int = 1, **labels):
+    """Add to a counter"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] += amount
+
+
+def value(name: str, **labels) -> int:
+    """Current value of one counter (labels must match exactly)"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        return _counters.get(key, 0)
+
+
+def total(name: str) -> int:
+    """Sum of a counter across all label combinations"""
+    with _lock:
+        return sum(count for (counter, _), count in _counters.items() if counter == name)
+
+
+def snapshot() -> Dict[str, Any]:
+    """All counters as {name: [{'labels': {...}, 'value': n}, ...]}"""
+    with _lock:
+        items = list(_counters.items())
+    result: Dict[str, Any] = {}
+    for (name, labels), count in sorted(items):
+        result.setdefault(name, []).append({'labels': dict(labels), 'value': count})
+    return result
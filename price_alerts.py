@@ -0,0 +1,307 @@
+"""
+Incremental price-alert evaluation for MarketFavorite documents.
+
+Favorites are indexed by (crop_type, market_name) into two sorted threshold
+lists, so a new MarketPrice only has to binary-search its key instead of
+scanning every favorite:
+
+- price_alert_min fires when the price falls to or below the threshold
+- price_alert_max fires when the price rises to or above the threshold
+
+A favorite with an empty market_name watches every market for its crop.
+Triggered alerts are deduplicated per favorite, direction and price date and
+written to the notification outbox in batches.
+
+Favorites are created through whichever worker serves the request, while
+prices are evaluated in the worker that ingests them. Before every
+evaluation the engine therefore reads the favorites changed and deleted
+since its last look (updated_at and tombstone cursors, as in sync.py).
+"""
+import logging
+import bisect
+import threading
+import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from firebase_models import MarketFavorite, NotificationOutbox, Tombstone
+
+logger = logging.getLogger(__name__)
+
+BELOW_MIN = 'below_min'
+ABOVE_MAX = 'above_max'
+
+# Flush the outbox once this many notifications are buffered
+OUTBOX_BATCH_SIZE = 200
+
+# Favorites read per query when catching up with changes from other processes
+SYNC_PAGE_SIZE = 500
+
+
+def _to_float(value) -> Optional[float]:
+    """Coerce a stored threshold to float, ignoring blanks and bad values"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _ThresholdList:
+    """Thresholds kept sorted alongside the ids of the favorites that own them"""
+
+    def __init__(self):
+        self.thresholds: List[float] = []
+        self.ids: List[str] = []
+
+    def add(self, threshold: float, favorite_id: str):
+        pos = bisect.bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(pos, threshold)
+        self.ids.insert(pos, favorite_id)
+
+    def remove(self, threshold: float, favorite_id: str):
+        lo = bisect.bisect_left(self.thresholds, threshold)
+        hi = bisect.bisect_right(self.thresholds, threshold)
+        for pos in range(lo, hi):
+            if self.ids[pos] == favorite_id:
+                del self.thresholds[pos]
+                del self.ids[pos]
+                return
+
+    def bulk_load(self, pairs: List[Tuple[float, str]]):
+        pairs.sort(key=lambda pair: pair[0])
+        self.thresholds = [pair[0] for pair in pairs]
+        self.ids = [pair[1] for pair in pairs]
+
+    def at_or_above(self, price: float) -> List[str]:
+        """Ids whose threshold is >= price (min alerts the price has fallen to)"""
+        return self.ids[bisect.bisect_left(self.thresholds, price):]
+
+    def at_or_below(self, price: float) -> List[str]:
+        """Ids whose threshold is <= price (max alerts the price has risen to)"""
+        return self.ids[:bisect.bisect_right(self.thresholds, price)]
+
+    def __len__(self):
+        return len(self.thresholds)
+
+
+class PriceAlertIndex:
+    """In-memory index of favorite price thresholds keyed by (crop, market)"""
+
+    def __init__(self):
+        self._mins: Dict[Tuple[str, str], _ThresholdList] = {}
+        self._maxs: Dict[Tuple[str, str], _ThresholdList] = {}
+        self._favorites: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _key(crop_type: str, market_name: str) -> Tuple[str, str]:
+        return ((crop_type or '').strip().lower(), (market_name or '').strip().lower())
+
+    def add(self, favorite: Dict[str, Any]):
+        """Index (or re-index) a favorite"""
+        favorite_id = favorite.get('id')
+        if not favorite_id:
+            return
+        if favorite_id in self._favorites:
+            self.remove(favorite_id)
+
+        alert_min = _to_float(favorite.get('price_alert_min'))
+        alert_max = _to_float(favorite.get('price_alert_max'))
+        if alert_min is None and alert_max is None:
+            return
+
+        key = self._key(favorite.get('crop_type'), favorite.get('market_name'))
+        if alert_min is not None:
+            self._mins.setdefault(key, _ThresholdList()).add(alert_min, favorite_id)
+        if alert_max is not None:
+            self._maxs.setdefault(key, _ThresholdList()).add(alert_max, favorite_id)
+        self._favorites[favorite_id] = {**favorite, 'price_alert_min': alert_min, 'price_alert_max': alert_max}
+
+    def remove(self, favorite_id: str):
+        """Drop a favorite from the index"""
+        favorite = self._favorites.pop(favorite_id, None)
+        if not favorite:
+            return
+        key = self._key(favorite.get('crop_type'), favorite.get('market_name'))
+        if favorite['price_alert_min'] is not None and key in self._mins:
+            self._mins[key].remove(favorite['price_alert_min'], favorite_id)
+        if favorite['price_alert_max'] is not None and key in self._maxs:
+            self._maxs[key].remove(favorite['price_alert_max'], favorite_id)
+
+    def bulk_load(self, favorites: List[Dict[str, Any]]):
+        """Replace the index contents, sorting each key once instead of inserting"""
+        mins: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        maxs: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        self._favorites = {}
+
+        for favorite in favorites:
+            favorite_id = favorite.get('id')
+            alert_min = _to_float(favorite.get('price_alert_min'))
+            alert_max = _to_float(favorite.get('price_alert_max'))
+            if not favorite_id or (alert_min is None and alert_max is None):
+                continue
+            key = self._key(favorite.get('crop_type'), favorite.get('market_name'))
+            if alert_min is not None:
+                mins.setdefault(key, []).append((alert_min, favorite_id))
+            if alert_max is not None:
+                maxs.setdefault(key, []).append((alert_max, favorite_id))
+            self._favorites[favorite_id] = {**favorite, 'price_alert_min': alert_min, 'price_alert_max': alert_max}
+
+        self._mins, self._maxs = {}, {}
+        for key, pairs in mins.items():
+            self._mins[key] = _ThresholdList()
+            self._mins[key].bulk_load(pairs)
+        for key, pairs in maxs.items():
+            self._maxs[key] = _ThresholdList()
+            self._maxs[key].bulk_load(pairs)
+
+    def match(self, crop_type: str, market_name: str, price: float) -> List[Tuple[str, str]]:
+        """
+        Return (favorite_id, direction) pairs triggered by a price.
+
+        Looks up the exact market and the crop-wide ('') key; each lookup is a
+        binary search plus a slice of the k matching ids.
+        """
+        crop_key, market_key = self._key(crop_type, market_name)
+        matches = []
+        for key in {(crop_key, market_key), (crop_key, '')}:
+            if key in self._mins:
+                matches.extend((fid, BELOW_MIN) for fid in self._mins[key].at_or_above(price))
+            if key in self._maxs:
+                matches.extend((fid, ABOVE_MAX) for fid in self._maxs[key].at_or_below(price))
+        return matches
+
+    def get(self, favorite_id: str) -> Optional[Dict[str, Any]]:
+        return self._favorites.get(favorite_id)
+
+    def __len__(self):
+        return len(self._favorites)
+
+
+class PriceAlertEngine:
+    """Evaluates new MarketPrice rows against favorites and fills the outbox"""
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.index = PriceAlertIndex()
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._pending: List[Dict[str, Any]] = []
+        # Keys of alerts already queued, as (favorite_id, direction, price_date)
+        self._sent = set()
+        self._sent_date = None
+        # (updated_at, id) of the newest favorite and tombstone already applied
+        self._favorites_cursor = None
+        self._tombstones_cursor = None
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            self._sync_favorites()
+            return
+        self._tombstones_cursor = (datetime.datetime.utcnow().isoformat(), '')
+        favorites = MarketFavorite.list()
+        self.index.bulk_load(favorites)
+        self._favorites_cursor = max(((f.get('updated_at', ''), f.get('id', '')) for f in favorites), default=None)
+        self._loaded = True
+        logger.info("Price alert index loaded with %s favorites", len(self.index))
+
+    def _sync_favorites(self):
+        """Apply favorites created, updated or deleted by other processes since the last look"""
+        while True:
+            changed = MarketFavorite.changes(after=self._favorites_cursor, limit=SYNC_PAGE_SIZE)
+            for favorite in changed:
+                self.index.add(favorite)
+            if changed:
+                self._favorites_cursor = (changed[-1].get('updated_at', ''), changed[-1].get('id', ''))
+            if len(changed) < SYNC_PAGE_SIZE:
+                break
+
+        tombstones = Tombstone.changes([{'field': 'collection', 'value': MarketFavorite.collection_name}],
+                                       after=self._tombstones_cursor)
+        for tombstone in tombstones:
+            self.index.remove(tombstone.get('doc_id'))
+        if tombstones:
+            self._tombstones_cursor = (tombstones[-1].get('updated_at', ''), tombstones[-1].get('id', ''))
+
+    def add_favorite(self, favorite: Dict[str, Any]):
+        """Index a newly created or updated favorite"""
+        with self._lock:
+            if self._loaded:
+                self.index.add(favorite)
+
+    def remove_favorite(self, favorite_id: str):
+        """Stop evaluating a deleted favorite"""
+        with self._lock:
+            if self._loaded:
+                self.index.remove(favorite_id)
+
+    def evaluate(self, price_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Queue notifications for every alert a single price triggers"""
+        return self.evaluate_many([price_data])
+
+    def evaluate_many(self, prices: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Queue notifications for a batch of prices and flush full batches"""
+        queued = []
+        with self._lock:
+            self._ensure_loaded()
+            for price_data in prices:
+                price = _to_float(price_data.get('price'))
+                if price is None:
+                    continue
+                price_date = (price_data.get('date') or datetime.datetime.utcnow().isoformat())[:10]
+                self._roll_dedup_window(price_date)
+
+                for favorite_id, direction in self.index.match(
+                        price_data.get('crop_type'), price_data.get('market_name'), price):
+                    dedup_key = (favorite_id, direction, price_date)
+                    if dedup_key in self._sent:
+                        continue
+                    self._sent.add(dedup_key)
+
+                    favorite = self.index.get(favorite_id)
+                    notification = {
+                        'type': 'price_alert',
+                        'user_id': favorite.get('user_id'),
+                        'favorite_id': favorite_id,
+                        'crop_type': price_data.get('crop_type'),
+                        'market_name': price_data.get('market_name'),
+                        'direction': direction,
+                        'threshold': favorite['price_alert_min'] if direction == BELOW_MIN else favorite['price_alert_max'],
+                        'price': price,
+                        'price_date': price_date,
+                        'status': 'pending',
+                    }
+                    self._pending.append(notification)
+                    queued.append(notification)
+
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+        return queued
+
+    def _roll_dedup_window(self, price_date: str):
+        # Only the current price date can produce duplicates worth tracking
+        if self._sent_date is None or price_date > self._sent_date:
+            self._sent = {key for key in self._sent if key[2] >= price_date}
+            self._sent_date = price_date
+
+    def flush(self) -> int:
+        """Write all buffered notifications to the outbox in batched commits"""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        try:
+            NotificationOutbox.create_many(pending)
+        except Exception as e:
+            logger.error("Error writing price alerts to notification outbox: %s", e)
+            # Keep them buffered so the next flush retries
+            self._pending = pending + self._pending
+            return 0
+        return len(pending)
+
+
+# Shared engine used by the API process
+engine = PriceAlertEngine()
@@ -0,0 +1,480 @@
+"""
+Prompt templates for every Gemini call.
+
+Templates are registered once at import: their text is dedented (the old
+inline f-strings sent the source indentation to the model as tokens), their
+placeholders are parsed and checked, and the token cost of the constant
+part is measured up front. Rendering joins the precompiled literal and
+field parts.
+
+Every template carries a version. Bump it whenever the wording changes, so
+metrics (prompts.rendered{template, version}) and anything cached on a
+model answer can tell prompt generations apart.
+
+Token counts are estimated without a tokenizer round trip: about four
+characters per token for Latin script and about 2.5 for Devanagari, which
+is close to Gemini's SentencePiece counts for the prompts used here.
+Templates can declare clippable fields (free-form client input such as
+previous fertilizer applications) that are shortened when a render exceeds
+its budget, and chat history is packed into CHAT_HISTORY_BUDGET tokens by
+build_history().
+"""
+import os
+import string
+import textwrap
+from typing import Dict, Any, List, Tuple
+
+import metrics
+
+# Budgets in estimated tokens
+CHAT_HISTORY_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+CHAT_MESSAGE_MAX_TOKENS = int(os.environ.get('CHAT_MESSAGE_MAX_TOKENS', '300'))
+HISTORY_SUMMARY_BUDGET = int(os.environ.get('CHAT_HISTORY_SUMMARY_BUDGET', '400'))
+DEFAULT_PROMPT_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '8000'))
+
+LATIN_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.5
+
+ELLIPSIS = '…'
+
+_formatter = string.Formatter()
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Gemini token count of a string"""
+    if not text:
+        return 0
+    latin = len(text.encode('ascii', 'ignore'))
+    other = len(text) - latin
+    return int(latin / LATIN_CHARS_PER_TOKEN + other / OTHER_CHARS_PER_TOKEN) + 1
+
+
+def clip_to_tokens(text: str, max_tokens: int) -> str:
+    """Shorten text to roughly max_tokens, cutting at a word boundary"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Scale by the text's own chars-per-token ratio, then back off to a space
+    limit = max(int(len(text) * max_tokens / estimate_tokens(text)), 1)
+    clipped = text[:limit]
+    cut = clipped.rfind(' ')
+    if cut > limit // 2:
+        clipped = clipped[:cut]
+    return clipped.rstrip() + ELLIPSIS
+
+
+class PromptTemplate:
+    """A dedented, validated prompt with precomputed constant token cost"""
+
+    def __init__(self, name: str, version: int, text: str, clip: Tuple[str, ...] = (),
+                 max_tokens: int = DEFAULT_PROMPT_BUDGET):
+        self.name = name
+        self.version = version
+        self.text = textwrap.dedent(text).strip('\n')
+        self.clip = clip
+        self.max_tokens = max_tokens
+        self.fields = []
+        # Precompiled as alternating literal text and field names for a plain join
+        self._parts: List[Tuple[str, str]] = []
+        constant = []
+        for literal, field, spec, conversion in _formatter.parse(self.text):
+            constant.append(literal)
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f"Prompt {name}: only plain {{name}} placeholders are supported, got {field!r}")
+            self._parts.append((literal, field))
+            if field is not None and field not in self.fields:
+                self.fields.append(field)
+        unknown = set(clip) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Prompt {name}: clip fields {sorted(unknown)} are not placeholders")
+        self.constant_tokens = estimate_tokens(''.join(constant))
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def render(self, **values) -> str:
+        """Fill the placeholders, clipping declared fields if over max_tokens"""
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Prompt {self.name} is missing values for {missing}")
+        values = {field: '' if values[field] is None else str(values[field]) for field in self.fields}
+
+        # Every estimate is at most len / OTHER_CHARS_PER_TOKEN + 1, so short
+        # renders skip the per-field token count entirely
+        if self.clip and self.constant_tokens + sum(len(value) / OTHER_CHARS_PER_TOKEN + 1
+                                                    for value in values.values()) > self.max_tokens:
+            self._clip(values)
+
+        text = ''.join(literal + values[field] if field is not None else literal
+                       for literal, field in self._parts)
+        metrics.increment('prompts.rendered', template=self.name, version=self.version)
+        metrics.increment('prompts.estimated_tokens', estimate_tokens(text), template=self.name)
+        return text
+
+    def _clip(self, values: Dict[str, str]):
+        """Shrink the largest clippable values first until the render fits max_tokens"""
+        sizes = {field: estimate_tokens(value) for field, value in values.items()}
+        excess = self.constant_tokens + sum(sizes.values()) - self.max_tokens
+        if excess <= 0:
+            return
+        for field in sorted(self.clip, key=lambda f: -sizes[f]):
+            keep = max(sizes[field] - excess, 0)
+            values[field] = clip_to_tokens(values[field], keep) if keep else ELLIPSIS
+            excess -= sizes[field] - estimate_tokens(values[field])
+            if excess <= 0:
+                break
+        metrics.increment('prompts.clipped', template=self.name)
+
+TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register(name: str, version: int, text: str, **options) -> PromptTemplate:
+    template = PromptTemplate(name, version, text, **options)
+    TEMPLATES[name] = template
+    return template
+
+
+def render(name: str, **values) -> str:
+    """Render a registered template"""
+    return TEMPLATES[name].render(**values)
+
+
+def versions() -> Dict[str, int]:
+    """Current version of every template, e.g. for /api/metrics"""
+    return {name: template.version for name, template in TEMPLATES.items()}
+
+
+# --- Chat history ------------------------------------------------------------
+
+USER_ROLE = "किसान"
+ASSISTANT_ROLE = "AI किसान"
+
+
+def _summarize_dropped(entries: List[Dict[str, Any]], budget: int) -> str:
+    """Compact stand-in for turns that no longer fit: the farmer's earlier questions"""
+    questions = [entry.get('message', '') for entry in entries if entry.get('sender') == 'user']
+    if not questions:
+        return ''
+    lines, used = [], 0
+    # Keep the most recent questions that fit, in their original order
+    for question in reversed(questions):
+        line = f"- {clip_to_tokens(question, 40)}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    lines.reverse()
+    return "Earlier questions from the farmer:\n" + "\n".join(lines) if lines else ''
+
+
+def build_history(entries: List[Dict[str, Any]], budget: int = CHAT_HISTORY_BUDGET,
+                  message_max_tokens: int = CHAT_MESSAGE_MAX_TOKENS,
+                  summary: str = None, max_messages: int = None) -> Dict[str, Any]:
+    """
+    Pack previous chat turns (oldest first) into a token budget.
+
+    Each message is clipped to message_max_tokens, and the newest turns (at
+    most max_messages) are kept while they fit. Older ones are folded into a
+    preface of at most HISTORY_SUMMARY_BUDGET tokens: the given running
+    summary, followed by an extractive list of the dropped questions.
+    Returns {'text', 'tokens', 'turns_used', 'turns_dropped'}.
+    """
+    if not entries and not summary:
+        return {'text': '', 'tokens': 0, 'turns_used': 0, 'turns_dropped': 0}
+
+    lines, used = [], 0
+    kept = 0
+    for entry in reversed(entries):
+        if max_messages is not None and kept >= max_messages:
+            break
+        role = USER_ROLE if entry.get('sender') == 'user' else ASSISTANT_ROLE
+        line = f"{role}: {clip_to_tokens(entry.get('message', ''), message_max_tokens)}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+        kept += 1
+    lines.reverse()
+
+    dropped = entries[:len(entries) - kept]
+    preface = clip_to_tokens(summary, HISTORY_SUMMARY_BUDGET) if summary else ''
+    if dropped:
+        remaining = HISTORY_SUMMARY_BUDGET - estimate_tokens(preface)
+        questions = _summarize_dropped(dropped, remaining) if remaining > 0 else ''
+        preface = "\n".join(part for part in (preface, questions) if part)
+
+    text = "Previous conversation:\n"
+    if preface:
+        text += preface + "\n"
+    text += "\n".join(lines) + ("\n" if lines else '')
+    if dropped:
+        metrics.increment('prompts.history_truncated')
+    return {'text': text, 'tokens': estimate_tokens(text), 'turns_used': kept, 'turns_dropped': len(dropped)}
+
+# --- Templates ---------------------------------------------------------------
+
+CHAT_SYSTEM = register('chat_system', 1, """
+    You are AI Kisan, an expert agricultural assistant for farmers in India.
+    You provide helpful, practical advice on farming practices, crop management, disease identification,
+    weather interpretations, and market trends. Your responses should be:
+
+    1. Practical and actionable for farmers
+    2. Based on scientific agricultural knowledge
+    3. Relevant to Indian farming conditions
+    4. Considerate of both traditional and modern farming approaches
+    5. Clear and easy to understand
+    6. ALWAYS IN HINDI LANGUAGE using Devanagari script
+    7. Contextually aware of the ongoing conversation
+
+    When responding to queries about crop problems, ask for specifics like symptoms,
+    affected plant parts, and growth stage. For weather-related queries, explain implications
+    for farming activities. Always suggest sustainable practices when appropriate.
+
+    IMPORTANT: Reference previous messages in the conversation to maintain context.
+    If the farmer is asking follow-up questions, make sure to connect your answer to previous exchanges.
+    REMEMBER: You MUST respond in Hindi language. Your users are rural Indian farmers who primarily speak Hindi.
+    Even if the question is in English, always respond in Hindi.
+""")
+
+CHAT = register('chat', 1, """
+    {system}
+
+    {conversation}
+
+    किसान का वर्तमान प्रश्न: {message}
+
+    कृपया हिंदी में विस्तृत और संदर्भ के अनुसार मददगार उत्तर दें:
+    {field_context}
+""", clip=('message', 'field_context'))
+
+CHAT_FALLBACK = register('chat_fallback', 1, """
+    {system}
+
+    {conversation}
+
+    Farmer's current question: {message}
+
+    Your expert response in Hindi:
+""", clip=('message',))
+
+CHAT_SUMMARY = register('chat_summary', 1, """
+    Update the running summary of a conversation between an Indian farmer and AI Kisan, a farming assistant.
+    Keep only what later answers depend on: the farmer's crops, location, soil and field details, the problems
+    and symptoms described, advice already given and questions still open. Write in Hindi as short bullet
+    points, at most {max_words} words in total. Do not add anything that was not said.
+
+    Current summary:
+    {summary}
+
+    New messages:
+    {messages}
+
+    Updated summary:
+""", clip=('messages',))
+
+DISEASE_ANALYSIS = register('disease_analysis', 1, """
+    You are an expert agricultural pathologist. Analyze this crop image and identify any disease. Respond with JSON only. Use the common English disease name (not the pathogen) for disease_name, or "Healthy" if the plant shows no disease. Set confidence between 0 and 1. List the visible symptoms and 2-3 specific treatment recommendations. If you cannot identify a specific disease with certainty, make your best educated guess based on the visible symptoms.
+""")
+
+DISEASE_IMAGE_CONTEXT = register('disease_image_context', 1, """
+    This is a {crop_type} plant. Please analyze it for diseases.
+""")
+
+FARM_GUIDANCE = register('farm_guidance', 1, """
+    As an agricultural expert, provide comprehensive farming guidance for the following field:
+
+    Field Name: {name}
+    Location: {location}
+    Area: {area} hectares
+    Crop Type: {crop_type}
+    Soil Type: {soil_type}
+    Planting Date: {planting_date}
+
+    Please provide structured farming recommendations in the following categories:
+    1. General Recommendations: Overall management practices for this field
+    2. Crop-Specific Advice: Best practices for growing {crop_type} successfully
+    3. Fertilizer Recommendations: What fertilizers to use, when and how much
+    4. Pest Management: Common pests/diseases for {crop_type} and how to prevent/treat them
+    5. Irrigation Guidance: Best irrigation practices for {crop_type} in {soil_description} soil
+    6. Sustainable Practices: Environmentally friendly farming techniques
+
+    Format the response in JSON with arrays of advice for each category.
+""")
+
+FIELD_FERTILIZER = register('field_fertilizer', 1, """
+    {context}
+
+    Based on the above information, provide fertilizer recommendations including:
+    1. Recommended fertilizer types
+    2. Application rates in kg/hectare
+    3. Timing of application
+    4. Application method
+    5. Special considerations for this crop and soil type
+""", clip=('context',))
+
+QUICK_GUIDANCE = register('quick_guidance', 1, """
+    You are an agricultural expert commissioned to write a comprehensive farming manual. Create a detailed, practical guide for {crop_type} cultivation in {soil_type} soil that combines traditional practices and modern techniques.
+
+    FORMAT YOUR RESPONSE AS A COMPLETE ARTICLE WITH HEADINGS AND SUBHEADINGS. DO NOT include any JSON content or code blocks in the main article. Write in clear, professional language suitable for publishing in an agricultural journal.
+
+    ## ARTICLE STRUCTURE AND CONTENT:
+
+    # {crop_type} Cultivation Guide for {soil_type} Soil
+    Begin with a thorough introduction (250-300 words) explaining why {crop_type} is well-suited (or what challenges it faces) in {soil_type} soil. Include regional considerations and economic importance.
+
+    ## Detailed Cultivation Timeline
+    Create a chronological, month-by-month or season-by-season breakdown of the complete growing cycle with SPECIFIC DATES AND TIMINGS:
+    - Pre-planting soil preparation (beginning 45-60 days before planting date)
+    - Seed selection and treatment recommendations with EXACT seed rates (kg/ha)
+    - Planting window with PRECISE spacing measurements (e.g., 45cm between rows, 15cm between plants)
+    - Post-planting care with timing
+    - Critical growth stages with SPECIFIC DURATION of each stage
+    - Harvest timing indicators with EXACT maturity signs
+    - Post-harvest handling and storage recommendations
+
+    ## Soil Management Techniques
+    Provide soil-specific guidance:
+    - Detailed analysis of {soil_type} soil properties and how they affect {crop_type}
+    - Step-by-step soil preparation procedures with SPECIFIC amendment quantities
+    - Optimal pH range with EXACT adjustment methods (e.g., "Add 500kg/ha of agricultural lime to raise pH from 5.5 to 6.5")
+    - Organic matter incorporation with EXACT rates and timing
+    - Tillage recommendations (depth, frequency, tools)
+
+    ## Precise Irrigation Strategy
+    Develop a complete irrigation plan:
+    - Water requirements throughout each growth stage with EXACT quantities (mm or L/plant)
+    - Irrigation frequency with SPECIFIC intervals based on crop stage and weather conditions
+    - Irrigation system recommendations specifically for {soil_type} soil
+    - Water conservation techniques with implementation details
+    - Signs of water stress or excess with remediation strategies
+    - Drainage considerations specific to {soil_type} soil
+
+    ## Comprehensive Fertilization Plan
+    Create a complete nutritional program:
+    - SPECIFIC NPK ratio requirements for each growth stage (e.g., 12-24-12 at planting)
+    - PRECISE application rates in kg/ha for each application
+    - Detailed timing of fertilizer applications tied to growth stages
+    - Micronutrient requirements with SPECIFIC products and rates
+    - Organic fertilization alternatives with EXACT application rates
+    - Foliar feeding recommendations with SPECIFIC dilution rates
+
+    ## Integrated Pest and Disease Management
+    Provide a complete protection strategy:
+    - List of common pests specific to {crop_type} in {soil_type} soil with IDENTIFICATION FEATURES
+    - List of common diseases with EARLY SYMPTOMS
+    - Preventive measures with SPECIFIC timing relative to growth stages
+    - Monitoring techniques with EXACT frequency (e.g., "Scout fields twice weekly")
+    - Organic control options with PRECISE application rates and timing
+    - Conventional chemical options with SPECIFIC active ingredients, rates, and safety intervals
+    - Resistance management strategies
+
+    ## Modern Farming Technologies
+    Detail relevant technological innovations:
+    - Appropriate mechanization options for different farm sizes
+    - Precision agriculture techniques applicable to {crop_type} in {soil_type} soil
+    - Sensor and monitoring technologies with implementation guidance
+    - Digital tools and software recommendations for farm management
+    - Cost-benefit analysis of technology adoption
+
+    ## Sustainable Farming Practices
+    Outline environmental conservation approaches:
+    - SPECIFIC crop rotation recommendations with exact crop sequences
+    - Cover cropping strategies with NAMED species recommendations
+    - Soil conservation practices tailored to {soil_type}
+    - Biodiversity enhancement techniques around fields
+    - Carbon sequestration approaches for {crop_type} cultivation
+    - Water conservation strategies beyond irrigation management
+
+    ## Economic Considerations
+    Provide business guidance:
+    - Estimated yields for {crop_type} in {soil_type} soil under different management intensities
+    - Production costs breakdown with REALISTIC figures
+    - Market opportunities and value-addition possibilities
+    - Storage and handling for market timing
+
+    IMPORTANT: Your response should be as comprehensive as a book chapter. Write the COMPLETE ARTICLE. Include SPECIFIC, ACTIONABLE information with EXACT measurements, timing, and application rates. Avoid generalizations - be precise throughout. Emphasize PRACTICAL IMPLEMENTATION.
+""")
+
+FERTILIZER_PLAN = register('fertilizer_plan', 1, """
+    As an agricultural expert, provide detailed fertilizer recommendations for:
+
+    Crop: {crop_type}
+    Soil Type: {soil_type}
+    Growth Stage: {growth_stage}
+    Field Size: {field_size} hectares
+    {planting_line}
+    {location_line}
+
+    Soil Test Results:
+    - Nitrogen Level: {nitrogen_level}
+    - Phosphorus Level: {phosphorus_level}
+    - Potassium Level: {potassium_level}
+    - pH Level: {ph_level}
+    - Organic Matter: {organic_matter}
+
+    Previous Fertilizer Applications:
+    {previous_applications}
+
+    Provide a comprehensive fertilizer application plan with:
+    1. Specific NPK fertilizer ratios and brands/types for each growth stage
+    2. Precise application rates in kg/hectare
+    3. Exact timing of applications related to growth stages
+    4. Application methods (broadcast, banding, foliar, etc.)
+    5. Secondary nutrients and micronutrients if needed
+    6. Both organic and conventional fertilizer options
+    7. Cost-effective fertilizer combinations to maximize yield
+
+    Format your response as a JSON object with these keys:
+    "primary_recommendations": [array of main fertilizer recommendations with product, ratio, rate, timing, method]
+    "secondary_nutrients": [recommendations for secondary nutrients if needed]
+    "micronutrients": [recommendations for micronutrients if needed]
+    "organic_alternatives": [organic fertilizer options]
+    "application_schedule": [detailed timing of applications]
+    "expected_benefits": [expected yield impact]
+    "precautions": [warnings and precautions]
+    "cost_estimate": estimated cost per hectare
+""", clip=('previous_applications',))
+
+IRRIGATION_PLAN = register('irrigation_plan', 1, """
+    As an irrigation expert, provide detailed irrigation recommendations for:
+
+    Crop: {crop_type}
+    Soil Type: {soil_type}
+    Growth Stage: {growth_stage}
+    Field Size: {field_size} hectares
+    Current Soil Moisture: {soil_moisture}
+    Irrigation System: {irrigation_system}
+    {location_line}
+    Season: {season}
+
+    Weather Data:
+    - Temperature: {temperature}°C
+    - Humidity: {humidity}%
+    - 5-day Precipitation Forecast (mm): {precipitation_forecast}
+    - Evapotranspiration: {evapotranspiration} mm/day
+
+    Previous Irrigation:
+    {previous_irrigation}
+
+    Provide a comprehensive irrigation plan with:
+    1. Exact water requirements in mm or liters per hectare
+    2. Frequency of irrigation (daily, every 2 days, weekly, etc.)
+    3. Duration of each irrigation session in minutes or hours
+    4. Best time of day to irrigate
+    5. Adjustments needed based on weather forecast
+    6. Water conservation techniques
+    7. Signs of over/under irrigation to monitor
+
+    Format your response as a JSON object with these keys:
+    "water_requirement": daily water requirement in mm
+    "frequency": recommended irrigation frequency
+    "duration": duration of each irrigation session
+    "best_time": optimal time of day for irrigation
+    "weather_adjustments": adjustments based on forecast
+    "conservation_techniques": water conservation methods
+    "monitoring_indicators": signs to watch for
+    "irrigation_schedule": detailed schedule for next 7 days
+    "expected_benefits": expected benefits of following this plan
+""", clip=('previous_irrigation',))
@@ -70,11 +70,13 @@ function startPythonAPI() {
   
   // Start the Python process with appropriate flags for the environment
   const pythonArgs = isProduction 
-    ? ['api.py'] // In production mode, debug is already disabled via env var
+    ? ['-m', 'gunicorn', '-c', 'gunicorn.conf.py'] // Production profile, see gunicorn.conf.py
     : ['api.py', '--debug'];
     
   console.log(`Starting Python API with args: ${pythonArgs.join(' ')}`);
-  const pythonProcess = spawn('python3', pythonArgs);
+  const pythonProcess = spawn('python3', pythonArgs, {
+    env: { ...process.env, API_PORT: String(API_PORT) }
+  });
   
   pythonProcess.stdout.on('data', (data) => {
     console.log(`Python API: ${data}`);
@@ -0,0 +1,110 @@
+"""
+Lazy imports and background warm-up for the API process.
+
+Importing api.py used to call genai.list_models() (a network round trip),
+initialize Firebase (which can run create_firebase_credential.py in a
+subprocess) and import the Gemini SDK, most of a second on its own. Cold
+starts paid for all of it before the first request could be served, and the
+module could not be imported offline.
+
+Now the heavy SDKs are LazyModule proxies that import on first attribute
+access, and Firebase and model discovery happen on first use. Once the
+process is ready to serve, warmup runs the same steps on a background
+thread, so the first real request usually finds them done. A request that
+arrives earlier performs the step itself; every step is safe to run twice
+concurrently and only does its work once.
+
+Warm-up timings are in /api/metrics (startup.warmup_ms).
+"""
+import logging
+import time
+import types
+import importlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    on_load is called once with the real module, e.g. to configure it.
+    Attributes assigned on the proxy shadow the module's own.
+    """
+
+    def __init__(self, name: str, on_load: Optional[Callable[[types.ModuleType], None]] = None):
+        super().__init__(name)
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> types.ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    if self._on_load:
+                        self._on_load(module)
+                    self._module = module
+                    metrics.increment('startup.import_ms', int((time.perf_counter() - started) * 1000),
+                                      module=self.__name__)
+        return self._module
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+class Warmup:
+    """Named start-up steps run once, in order, on a background thread"""
+
+    def __init__(self):
+        self._tasks: List[Tuple[str, Callable[[], Any]]] = []
+        self._status: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name: str, task: Callable[[], Any]):
+        with self._lock:
+            self._tasks.append((name, task))
+            self._status[name] = 'pending'
+
+    def start(self):
+        """Run the registered steps in the background (idempotent per process)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='startup-warmup', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with self._lock:
+            tasks = [(name, task) for name, task in self._tasks if self._status[name] != 'done']
+        for name, task in tasks:
+            started = time.perf_counter()
+            try:
+                task()
+                status = 'done'
+            except Exception as e:
+                logger.error("Warm-up step %s failed: %s", name, e)
+                status = 'failed'
+            metrics.increment('startup.warmup_ms', int((time.perf_counter() - started) * 1000), task=name)
+            with self._lock:
+                self._status[name] = status
+
+    def status(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._status)
+
+
+# Shared warm-up used by the API process
+warmup = Warmup()
@@ -0,0 +1,130 @@
+"""
+Delta synchronisation for the Flutter client's offline cache.
+
+Instead of refetching whole collections when it comes back online, the app
+sends the watermark from its previous sync and receives only the documents
+created, updated or deleted since then. Every FirebaseModel write stamps
+updated_at and deletes from synced collections leave a Tombstone, so each
+collection is read with a single query ordered by (updated_at, document ID).
+
+Documents created before create() stamped updated_at have no such field
+and are invisible to those queries. Backfill them once before enabling
+/api/sync:
+
+    python sync.py backfill
+
+Watermarks are opaque tokens holding a per-collection (updated_at, id)
+cursor, and each page starts after it. Including the document ID means a
+page that ends inside a group of documents sharing one timestamp (e.g. a
+batched write) resumes exactly where it stopped.
+"""
+import sys
+import json
+import base64
+import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from firebase_models import Field, DiseaseReport, MarketFavorite, ChatHistory, Tombstone
+
+# Collections exposed through the sync API, keyed by their public name
+SYNCED_MODELS = {
+    'fields': Field,
+    'disease_reports': DiseaseReport,
+    'market_favorites': MarketFavorite,
+    'chat_history': ChatHistory,
+}
+
+TOMBSTONE_CURSOR = 'tombstones'
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidWatermark(ValueError):
+    """Raised when a client sends a watermark that cannot be decoded"""
+
+
+def encode_watermark(cursors: Dict[str, Tuple[str, str]]) -> str:
+    """Encode per-collection (updated_at, id) cursors as an opaque token"""
+    payload = json.dumps(cursors, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_watermark(token: Optional[str]) -> Dict[str, Tuple[str, str]]:
+    """Decode a watermark token; an empty token means a full initial sync"""
+    if not token:
+        return {}
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursors = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return {name: (cursor[0], cursor[1]) for name, cursor in cursors.items()}
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise InvalidWatermark(f'Invalid sync watermark: {str(e)}')
+
+
+def _read_page(model, user_id: str, cursor: Optional[Tuple[str, str]], limit: int):
+    """Read up to `limit` changes after the cursor, and whether more are waiting"""
+    docs = model.changed_since(user_id, tuple(cursor) if cursor else None, limit=limit + 1)
+    return docs[:limit], len(docs) > limit
+
+
+def collect_changes(user_id: str, watermark: str = None, collections: List[str] = None,
+                    limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Gather upserts and deletes for a user since the watermark.
+
+    Returns the changes per collection, the watermark to send next time and
+    whether more changes are waiting (the client should call again at once).
+    """
+    cursors = decode_watermark(watermark)
+    names = collections or list(SYNCED_MODELS)
+    unknown = [name for name in names if name not in SYNCED_MODELS]
+    if unknown:
+        raise ValueError(f"Unsupported collection(s): {', '.join(unknown)}")
+
+    changes = {name: {'upserts': [], 'deletes': []} for name in names}
+    next_cursors = dict(cursors)
+    has_more = False
+
+    for name in names:
+        docs, more = _read_page(SYNCED_MODELS[name], user_id, cursors.get(name), limit)
+        changes[name]['upserts'] = docs
+        has_more = has_more or more
+        if docs:
+            next_cursors[name] = (docs[-1].get('updated_at', ''), docs[-1].get('id', ''))
+
+    # A first sync only needs current documents, but tombstones still advance
+    # the cursor so deletes that happen later are not missed
+    tombstones, more = _read_page(Tombstone, user_id, cursors.get(TOMBSTONE_CURSOR), limit)
+    has_more = has_more or more
+    for tombstone in tombstones:
+        if watermark and tombstone.get('collection') in changes:
+            changes[tombstone['collection']]['deletes'].append({
+                'id': tombstone.get('doc_id'),
+                'deleted_at': tombstone.get('deleted_at')
+            })
+    if tombstones:
+        next_cursors[TOMBSTONE_CURSOR] = (tombstones[-1].get('updated_at', ''), tombstones[-1].get('id', ''))
+
+    return {
+        'changes': changes,
+        'watermark': encode_watermark(next_cursors),
+        'has_more': has_more,
+        'full_sync': not watermark,
+        'server_time': datetime.datetime.utcnow().isoformat()
+    }
+
+
+def backfill_updated_at() -> Dict[str, int]:
+    """Stamp updated_at on synced documents that predate it; returns counts per collection"""
+    counts = {name: model.backfill_updated_at() for name, model in SYNCED_MODELS.items()}
+    counts[TOMBSTONE_CURSOR] = Tombstone.backfill_updated_at()
+    return counts
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'backfill':
+        for name, count in backfill_updated_at().items():
+            print(f"{name}: stamped updated_at on {count} documents")
+    else:
+        print(__doc__)
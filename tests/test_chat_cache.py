@@ -0,0 +1,102 @@
+"""Safety rails of the semantic chat cache, on the CPU embedder"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_cache  # noqa: E402
+from chat_cache import HashingEmbedder, SemanticChatCache, _VectorIndex  # noqa: E402
+
+QUESTION = 'which fertilizer for wheat crop'
+
+
+class SameVector:
+    """Embeds everything identically, so only the guards can reject a match"""
+    name = 'same'
+
+    def embed(self, normalized):
+        vector = np.zeros(8, dtype=np.float32)
+        vector[0] = 1.0
+        return vector
+
+
+def assert_consistent(cache):
+    for name, index in cache._indexes.items():
+        assert sorted(index.ids) == sorted(index._rows)
+        assert all(index._rows[entry_id] == row for row, entry_id in enumerate(index.ids))
+        assert set(index.ids) == {entry_id for entry_id, entry in cache._entries.items() if entry['embedder'] == name}
+
+
+def test_paraphrase_reuses_answer():
+    cache = SemanticChatCache(embedders=[HashingEmbedder()])
+    cache.store(QUESTION, ['fertilizer'], 'Apply urea in two splits')
+
+    hit = cache.lookup('Which fertilizer for the wheat crop?', ['fertilizer'])
+
+    assert hit['answer'] == 'Apply urea in two splits'
+    assert hit['match'] == 'semantic'
+
+
+def test_answer_needs_same_intents_and_crops():
+    cache = SemanticChatCache(embedders=[SameVector()])
+    cache.store(QUESTION, ['fertilizer'], 'wheat answer')
+
+    assert cache.lookup(QUESTION, ['fertilizer', 'disease']) is None
+    assert cache.lookup('which fertilizer for rice crop', ['fertilizer']) is None
+    assert cache.lookup('which fertilizer for gehu crop', ['fertilizer'])['answer'] == 'wheat answer'
+
+
+def test_weather_and_market_questions_are_never_cached():
+    cache = SemanticChatCache(embedders=[HashingEmbedder()])
+    cache.store('will it rain tomorrow', ['weather'], 'Yes')
+    cache.store('wheat price in mandi', ['market', 'crop_info'], '2400 per quintal')
+
+    assert cache.stats()['entries'] == 0
+    assert cache.lookup('will it rain tomorrow', ['weather']) is None
+    assert cache.lookup('wheat price in mandi', ['market', 'crop_info']) is None
+
+
+def test_expired_answer_is_evicted(monkeypatch):
+    cache = SemanticChatCache(embedders=[HashingEmbedder()])
+    cache.store(QUESTION, ['fertilizer'], 'old answer')
+    cache.store('how to grow tomato', ['crop_info'], 'other answer')
+    now = chat_cache.time.time()
+    monkeypatch.setattr(chat_cache.time, 'time', lambda: now + 8 * 24 * 3600)
+
+    assert cache.lookup('Which fertilizer for the wheat crop?', ['fertilizer']) is None
+    assert cache.lookup(QUESTION, ['fertilizer']) is None
+    assert [entry['question'] for entry in cache._entries.values()] == ['how to grow tomato']
+    assert_consistent(cache)
+
+
+def test_lru_eviction_keeps_index_consistent():
+    cache = SemanticChatCache(max_entries=3, embedders=[HashingEmbedder()])
+    crops = ['wheat', 'rice', 'cotton', 'tomato', 'potato']
+    for crop in crops:
+        cache.store(f'how to grow {crop}', ['crop_info'], f'{crop} answer')
+        # Keep wheat recently used so it survives
+        cache.lookup('how to grow wheat', ['crop_info'])
+
+    assert sorted(entry['question'] for entry in cache._entries.values()) == [
+        'how to grow potato', 'how to grow tomato', 'how to grow wheat']
+    assert_consistent(cache)
+    for crop in ('wheat', 'tomato', 'potato'):
+        assert cache.lookup(f'how to grow {crop} ?', ['crop_info'])['answer'] == f'{crop} answer'
+
+
+def test_vector_index_remove_moves_last_row_into_hole():
+    index = _VectorIndex()
+    vectors = {name: np.eye(4, dtype=np.float32)[i] for i, name in enumerate('abcd')}
+    for name, vector in vectors.items():
+        index.add(name, vector)
+
+    index.remove('b')
+    index.remove('missing')
+
+    assert index.ids == ['a', 'd', 'c']
+    assert index._rows == {'a': 0, 'd': 1, 'c': 2}
+    for name in 'acd':
+        assert index.search(vectors[name], 1) == [(name, 1.0)]
+    assert index.search(vectors['b'], 3)[0][1] == 0.0
@@ -0,0 +1,27 @@
+"""Chat sessions include messages that are still buffered"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_writes  # noqa: E402
+from firebase_models import ChatHistory  # noqa: E402
+
+
+def message(session_id, text, timestamp):
+    return {'user_id': 'sessions-user', 'session_id': session_id, 'message': text,
+            'sender': 'user', 'timestamp': timestamp}
+
+
+def test_buffered_messages_appear_in_sessions(tmp_path):
+    ChatHistory.create(message('old', 'stored question', '2024-11-10T08:00:00'))
+    writer = chat_writes.ChatWriteBehind(wal_path=str(tmp_path / 'chat_wal.jsonl'), enabled=True)
+    writer.append(message('old', 'buffered follow-up', '2024-11-10T09:00:00'))
+    writer.append(message('new', 'brand new conversation', '2024-11-10T10:00:00'))
+
+    sessions = writer.merge_sessions(ChatHistory.get_sessions('sessions-user'), 'sessions-user')
+
+    assert [(s['session_id'], s['last_message']) for s in sessions] == [
+        ('new', 'brand new conversation'),
+        ('old', 'buffered follow-up'),
+    ]
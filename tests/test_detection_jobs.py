@@ -0,0 +1,136 @@
+"""Detection job recovery, retries and backpressure with a stub handler"""
+import os
+import sys
+import time
+import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detection_jobs  # noqa: E402
+from firebase_models import DetectionJob, generate_id  # noqa: E402
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def stranded_job(status, attempts):
+    """A job left behind by a process that stopped renewing its lease"""
+    expired = (datetime.datetime.utcnow() - datetime.timedelta(minutes=5)).isoformat()
+    return DetectionJob.create({
+        'id': generate_id(), 'user_id': 'stranded-user', 'status': status,
+        'payload': {'image_path': 'leaf.jpg'}, 'callback_url': None,
+        'attempts': attempts, 'max_attempts': 3, 'result': None, 'error': None,
+        'created_at': expired, 'started_at': expired, 'finished_at': None,
+        'owner': 'stopped-process', 'lease_expires_at': expired,
+    })
+
+
+def test_recovers_jobs_of_a_stopped_process():
+    running = stranded_job(detection_jobs.RUNNING, attempts=1)
+    exhausted = stranded_job(detection_jobs.RUNNING, attempts=3)
+    queue = detection_jobs.DetectionJobQueue(workers=1)
+
+    queue.start(lambda **payload: ({'disease_name': 'Leaf Rust'}, 200))
+
+    assert wait_for(lambda: DetectionJob.get(running['id'])['status'] == detection_jobs.SUCCEEDED)
+    recovered = DetectionJob.get(running['id'])
+    assert recovered['owner'] == queue.owner
+    assert recovered['attempts'] == 2
+    assert recovered['lease_expires_at'] is None
+    assert wait_for(lambda: DetectionJob.get(exhausted['id'])['status'] == detection_jobs.FAILED)
+
+
+def test_live_lease_is_not_claimed():
+    job = stranded_job(detection_jobs.QUEUED, attempts=0)
+    now = datetime.datetime.utcnow().isoformat()
+    later = (datetime.datetime.utcnow() + datetime.timedelta(minutes=2)).isoformat()
+
+    assert DetectionJob.claim(job['id'], 'first', later, now)
+    assert DetectionJob.claim(job['id'], 'second', later, now) is None
+    assert DetectionJob.get(job['id'])['owner'] == 'first'
+
+
+def test_retry_into_a_full_queue_fails_the_job():
+    queue = detection_jobs.DetectionJobQueue(workers=0, max_queue=1)
+    job_id = queue.submit({'image_path': 'leaf.jpg'}, user_id='full-user')['id']
+
+    # Workers are not running, so the queue is still full when the retry comes due
+    queue._enqueue(queue._jobs[job_id])
+
+    assert queue.get(job_id)['status'] == detection_jobs.FAILED
+    assert queue._in_flight['full-user'] == 0
+
+
+def test_backpressure_rejects_full_queue_and_busy_user():
+    queue = detection_jobs.DetectionJobQueue(workers=0, max_queue=3, max_per_user=2)
+    queue.submit({'image_path': 'a.jpg'}, user_id='busy-user')
+    queue.submit({'image_path': 'b.jpg'}, user_id='busy-user')
+
+    with pytest.raises(detection_jobs.TooManyJobs) as too_many:
+        queue.submit({'image_path': 'c.jpg'}, user_id='busy-user')
+    assert too_many.value.status == 429
+
+    queue.submit({'image_path': 'd.jpg'}, user_id='other-user')
+    with pytest.raises(detection_jobs.QueueFull) as full:
+        queue.submit({'image_path': 'e.jpg'}, user_id='third-user')
+    assert full.value.status == 503
+    assert queue._in_flight == {'busy-user': 2, 'other-user': 1}
+
+
+def run_job(monkeypatch, responses, max_attempts=3):
+    """Run one job against a handler answering with `responses` in turn"""
+    monkeypatch.setattr(detection_jobs, 'RETRY_BASE_DELAY', 0.01)
+    calls = []
+
+    def handler(**payload):
+        calls.append(payload)
+        outcome = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    queue = detection_jobs.DetectionJobQueue(workers=1, max_attempts=max_attempts)
+    queue.start(handler)
+    job_id = queue.submit({'image_path': 'leaf.jpg'}, user_id='retry-user')['id']
+    assert wait_for(lambda: queue.get(job_id)['status'] in detection_jobs.TERMINAL_STATES)
+    return queue, queue.get(job_id), calls
+
+
+def test_server_errors_are_retried(monkeypatch):
+    queue, job, calls = run_job(monkeypatch, [({'error': 'Gemini overloaded'}, 503), RuntimeError('timeout'),
+                                              ({'disease_name': 'Leaf Rust'}, 200)])
+
+    assert job['status'] == detection_jobs.SUCCEEDED
+    assert job['attempts'] == len(calls) == 3
+    assert job['result'] == {'disease_name': 'Leaf Rust'}
+    assert queue._in_flight['retry-user'] == 0
+
+
+def test_client_errors_fail_without_retry(monkeypatch):
+    queue, job, calls = run_job(monkeypatch, [({'error': 'Unsupported or corrupt image'}, 400)])
+
+    assert job['status'] == detection_jobs.FAILED
+    assert job['error'] == 'Unsupported or corrupt image'
+    assert len(calls) == 1
+    assert queue._in_flight['retry-user'] == 0
+
+
+def test_exhausted_retries_fail_and_release_the_user_once(monkeypatch):
+    queue, job, calls = run_job(monkeypatch, [({'error': 'Gemini overloaded'}, 500)], max_attempts=2)
+
+    assert job['status'] == detection_jobs.FAILED
+    assert job['error'] == 'Gemini overloaded'
+    assert len(calls) == 2
+
+    # A later update of a finished job (e.g. webhook status) must not decrement again
+    queue._in_flight['retry-user'] = 1
+    queue._update(queue._jobs[job['id']], webhook_status=204)
+    assert queue._in_flight['retry-user'] == 1
@@ -0,0 +1,97 @@
+"""Parsing and name normalization of structured disease analyses"""
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+from disease_analysis import normalize_disease_name, parse_analysis  # noqa: E402
+
+
+def analysis(**overrides):
+    data = {'disease_name': 'Early blight', 'confidence': 0.82,
+            'symptoms': ['Concentric rings on lower leaves'], 'treatments': ['Spray mancozeb']}
+    data.update(overrides)
+    return json.dumps(data)
+
+
+def counted(outcome):
+    return metrics.value('disease_analysis.parse', outcome=outcome)
+
+
+def test_valid_analysis():
+    before = counted('ok')
+
+    detection = parse_analysis(analysis())
+
+    assert detection == {
+        'disease_name': 'Early Blight',
+        'confidence': 0.82,
+        'symptoms': '- Concentric rings on lower leaves',
+        'treatment': '- Spray mancozeb',
+        'disease_code': 'early_blight',
+        'name_normalized': True,
+    }
+    assert counted('ok') == before + 1
+
+
+@pytest.mark.parametrize('text', ['not json', '{"disease_name": ', None])
+def test_invalid_json(text):
+    before = counted('invalid_json')
+
+    assert parse_analysis(text) is None
+    assert counted('invalid_json') == before + 1
+
+
+@pytest.mark.parametrize('text', [
+    '["Early blight"]',
+    analysis(disease_name='  '),
+    analysis(confidence='high'),
+    analysis(confidence=True),
+    analysis(confidence=250),
+    analysis(confidence=-0.1),
+    analysis(symptoms=[1, 2]),
+])
+def test_invalid_schema(text):
+    before = counted('invalid_schema')
+
+    assert parse_analysis(text) is None
+    assert counted('invalid_schema') == before + 1
+
+
+@pytest.mark.parametrize('value, expected', [(85, 0.85), (100, 1.0), (1, 1.0), (0, 0.0), (0.5, 0.5)])
+def test_percentage_confidence_is_rescaled(value, expected):
+    assert parse_analysis(analysis(confidence=value))['confidence'] == expected
+
+
+def test_single_string_lists_are_accepted():
+    detection = parse_analysis(analysis(symptoms='Yellow streaks', treatments=['Propiconazole', ' ']))
+
+    assert detection['symptoms'] == '- Yellow streaks'
+    assert detection['treatment'] == '- Propiconazole'
+
+
+@pytest.mark.parametrize('name, pathogen, expected', [
+    ('EARLY BLIGHT', None, 'Early Blight'),
+    ('Alternaria leaf spot', None, 'Early Blight'),
+    ('early blight (Alternaria solani)', None, 'Early Blight'),
+    ('Leaf spots', 'Alternaria solani', 'Early Blight'),
+    ('yellow rust disease', None, 'Stripe Rust'),
+    ('Tomato Late Blight', None, 'Late Blight'),
+    ('Paddy blast', None, 'Rice Blast'),
+    ('Powdery mildrew', None, 'Powdery Mildew'),
+])
+def test_names_map_to_the_vocabulary(name, pathogen, expected):
+    assert normalize_disease_name(name, pathogen) == (expected, True)
+
+
+def test_unmatched_name_is_title_cased():
+    assert normalize_disease_name('sooty  mould on mango (Capnodium)') == ('Sooty Mould On Mango', False)
+
+    detection = parse_analysis(analysis(disease_name='zinc toxicity'))
+    assert detection['disease_name'] == 'Zinc Toxicity'
+    assert detection['disease_code'] == 'zinc_toxicity'
+    assert detection['name_normalized'] is False
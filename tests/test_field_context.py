@@ -0,0 +1,46 @@
+"""Field context cache invalidation and bookkeeping"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import field_context  # noqa: E402
+from firebase_models import Field  # noqa: E402
+
+
+def test_invalidation_keeps_no_state_for_idle_users():
+    cache = field_context.FieldContextCache(max_users=2)
+    for i in range(50):
+        cache.get(f'idle-user-{i}')
+        cache.invalidate(f'idle-user-{i}')
+
+    assert cache._loading == {}
+    assert cache.stats()['users'] <= 2
+
+
+def test_load_racing_with_a_write_is_not_cached(monkeypatch):
+    Field.create({'user_id': 'racing-user', 'name': 'North plot', 'crop_type': 'Wheat'})
+    cache = field_context.FieldContextCache()
+    loading, release = threading.Event(), threading.Event()
+    get_by_user_id = Field.get_by_user_id
+
+    def slow_load(user_id):
+        fields = get_by_user_id(user_id)
+        loading.set()
+        release.wait(5)
+        return fields
+
+    monkeypatch.setattr(Field, 'get_by_user_id', slow_load)
+    reader = threading.Thread(target=cache.get, args=('racing-user',))
+    reader.start()
+    loading.wait(5)
+    cache.invalidate('racing-user')
+    release.set()
+    reader.join(5)
+
+    assert 'racing-user' not in cache._entries
+    assert cache._loading == {}
+    monkeypatch.setattr(Field, 'get_by_user_id', get_by_user_id)
+    assert 'North plot' in cache.get('racing-user')
+    assert 'racing-user' in cache._entries
@@ -0,0 +1,34 @@
+"""Oversized uploads fail per image instead of failing the batch"""
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_preprocess  # noqa: E402
+
+
+def save_png(path, size):
+    Image.new('RGB', size, (40, 120, 40)).save(path, 'PNG')
+    return str(path)
+
+
+def test_decompression_bomb_is_rejected(tmp_path, monkeypatch):
+    path = save_png(tmp_path / 'leaf.png', (64, 64))
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+
+    with pytest.raises(ValueError, match='too large'):
+        image_preprocess.preprocess_image(path)
+
+
+def test_decompression_bomb_fails_only_its_image(tmp_path, monkeypatch):
+    small = save_png(tmp_path / 'small.png', (16, 16))
+    large = save_png(tmp_path / 'large.png', (64, 64))
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    monkeypatch.setattr(image_preprocess, 'POOL_WORKERS', 1)
+
+    results = image_preprocess.preprocess_many([small, large, small])
+
+    assert ['error' in result for result in results] == [False, True, False]
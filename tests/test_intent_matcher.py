@@ -0,0 +1,66 @@
+"""Keyword matching rules of the chat intent matcher"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_matcher import IntentMatcher, matcher  # noqa: E402
+
+
+def intents(message):
+    return matcher.classify(message)['intents']
+
+
+def test_short_keyword_needs_a_word_start():
+    assert 'greeting' not in intents('which seed should I use')
+    assert 'greeting' in intents('hi, which seed should I use')
+
+
+def test_keywords_of_three_letters_need_a_trailing_boundary():
+    assert 'fertilizer' not in intents('a dapper tractor')
+    assert 'fertilizer' in intents('how much dap per acre')
+    assert 'disease' not in intents('rogue plants')
+    # Longer keywords still match inflected forms
+    assert 'weather' in intents('is it raining tomorrow')
+
+
+def test_chandrabindu_and_anusvara_spellings_match_alike():
+    both = IntentMatcher(intent_keywords={'wheat': ['गेहूं']})
+
+    assert both.classify('गेहूँ की फसल')['intents'] == ['wheat']
+    assert both.classify('गेहूं की फसल')['intents'] == ['wheat']
+
+
+def test_intents_are_reported_in_priority_order():
+    result = matcher.classify('market price of urea fertilizer after the rain, hello')
+
+    assert result['intents'] == ['greeting', 'weather', 'fertilizer', 'market']
+
+
+def test_unmatched_message_is_a_general_query():
+    result = matcher.classify('')
+
+    assert result == {'intents': ['general_query'], 'response_key': None,
+                      'field_context': False, 'contains_question': False}
+
+
+def test_classify_many_maps_hits_to_their_own_messages():
+    messages = ['', 'hi', 'rain', '', 'mandi bhav kya hai?', 'which', 'खेत में पानी']
+
+    results = matcher.classify_many(messages)
+
+    assert [result['intents'] for result in results] == [
+        ['general_query'], ['greeting'], ['weather'], ['general_query'],
+        ['market'], ['general_query'], ['irrigation'],
+    ]
+    assert [result['contains_question'] for result in results] == [False, False, False, False, True, False, False]
+    assert [result['field_context'] for result in results] == [False, False, False, False, False, False, True]
+    assert results == [matcher.classify(message) for message in messages]
+
+
+def test_classify_many_keeps_adjacent_messages_apart():
+    # Joined, 'ra' + 'in' would spell a keyword across the boundary
+    results = matcher.classify_many(['ra', 'in', 'h', 'i'])
+
+    assert [result['intents'] for result in results] == [['general_query']] * 4
+    assert matcher.classify_many([]) == []
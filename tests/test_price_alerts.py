@@ -0,0 +1,35 @@
+"""Price alerts for favorites created through other worker processes"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import price_alerts  # noqa: E402
+from firebase_models import MarketFavorite  # noqa: E402
+
+
+def price(crop_type, market_name, value):
+    return {'crop_type': crop_type, 'market_name': market_name, 'price': value, 'date': '2024-11-10'}
+
+
+def test_favorite_created_elsewhere_fires_after_index_load():
+    engine = price_alerts.PriceAlertEngine()
+    engine.evaluate_many([price('Saffron', 'Delhi', 1000)])
+
+    # Created through another worker, so this engine's add_favorite never ran
+    favorite = MarketFavorite.create({'user_id': 'alerts-user', 'crop_type': 'Saffron',
+                                      'market_name': 'Delhi', 'price_alert_min': 900})
+    queued = engine.evaluate_many([price('Saffron', 'Delhi', 850)])
+
+    assert [(n['favorite_id'], n['direction']) for n in queued] == [(favorite['id'], price_alerts.BELOW_MIN)]
+
+
+def test_favorite_deleted_elsewhere_stops_firing():
+    favorite = MarketFavorite.create({'user_id': 'alerts-user', 'crop_type': 'Vanilla',
+                                      'market_name': 'Kochi', 'price_alert_max': 100})
+    engine = price_alerts.PriceAlertEngine()
+    engine.evaluate_many([price('Vanilla', 'Kochi', 10)])
+
+    MarketFavorite.delete(favorite['id'])
+
+    assert engine.evaluate_many([price('Vanilla', 'Kochi', 500)]) == []
@@ -0,0 +1,53 @@
+"""Thumbnails of sources that cannot be decoded"""
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thumbnails  # noqa: E402
+
+
+@pytest.fixture
+def thumbnail_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, 'THUMBNAIL_DIR', str(tmp_path / 'derivatives'))
+    monkeypatch.setattr(thumbnails, '_unsupported', {})
+    return tmp_path
+
+
+def test_decompression_bomb_is_unsupported_and_not_decoded_again(thumbnail_dir, monkeypatch):
+    source = str(thumbnail_dir / 'huge.png')
+    Image.new('RGB', (64, 64), (30, 140, 30)).save(source)
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+
+    with pytest.raises(ValueError, match='too large'):
+        thumbnails.ensure_thumbnail(source, 'a' * 64, 128)
+
+    def decode_again(*args):
+        raise AssertionError('decoded an unsupported source again')
+
+    monkeypatch.setattr(thumbnails, '_decode', decode_again)
+    with pytest.raises(ValueError, match='too large'):
+        thumbnails.ensure_thumbnail(source, 'a' * 64, 512)
+
+
+def test_truncated_source_is_unsupported(thumbnail_dir):
+    source = str(thumbnail_dir / 'truncated.jpg')
+    Image.new('RGB', (256, 256), (200, 40, 40)).save(source, 'JPEG')
+    with open(source, 'r+b') as f:
+        f.truncate(300)
+
+    with pytest.raises(ValueError, match='not a supported image'):
+        thumbnails.ensure_thumbnail(source, 'b' * 64, 128)
+
+
+def test_thumbnail_is_generated(thumbnail_dir):
+    source = str(thumbnail_dir / 'leaf.png')
+    Image.new('RGB', (800, 400), (30, 140, 30)).save(source)
+
+    path = thumbnails.ensure_thumbnail(source, 'c' * 64, 128)
+
+    with Image.open(path) as thumbnail:
+        assert (thumbnail.format, thumbnail.size) == ('WEBP', (128, 64))
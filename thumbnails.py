@@ -0,0 +1,182 @@
+"""
+Thumbnail derivatives for disease report images.
+
+Report listings used to link only the full-size originals, which the app
+downloaded just to draw list thumbnails. Derivatives are generated as WebP
+at fixed sizes (THUMBNAIL_SIZES, longest edge in pixels), either right after
+an upload (in a small background pool) or lazily on the first request, and
+cached on disk under
+
+    THUMBNAIL_DIR/<size>/ab/cd/<sha256 of the source>.webp
+
+Because the name is derived from the source content, a derivative never
+changes once written and can be served with a year-long immutable cache
+lifetime.
+"""
+import os
+import logging
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import upload_storage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (128, 512)
+THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', os.path.join(upload_storage.UPLOAD_DIR, 'derivatives'))
+THUMBNAIL_QUALITY = 75
+
+# Generate thumbnails in the background as soon as an image is uploaded
+GENERATE_ON_UPLOAD = os.environ.get('THUMBNAILS_ON_UPLOAD', '1') != '0'
+
+# Cache lifetimes: content-addressed derivatives never change
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+LEGACY_MAX_AGE = 24 * 3600
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+# sha256 of legacy (non content-addressed) sources, keyed by (path, mtime, size)
+_legacy_digests: Dict[tuple, str] = {}
+
+# Sources that cannot be decoded, by digest, so repeated requests fail without decoding again
+MAX_UNSUPPORTED = 1000
+_unsupported: Dict[str, str] = {}
+
+
+def image_key(image_path: Optional[str]) -> Optional[str]:
+    """Key used in thumbnail URLs: the path relative to the uploads directory"""
+    if not image_path:
+        return None
+    prefix = upload_storage.UPLOAD_DIR.rstrip('/') + '/'
+    return image_path[len(prefix):] if image_path.startswith(prefix) else None
+
+
+def thumbnail_urls(image_path: Optional[str]) -> Optional[Dict[str, str]]:
+    """Thumbnail URLs for every size, keyed by size, or None for non-upload paths"""
+    key = image_key(image_path)
+    if not key:
+        return None
+    return {str(size): f"/api/thumbnails/{size}/{key}" for size in THUMBNAIL_SIZES}
+
+
+def source_path(key: str) -> Optional[str]:
+    """Resolve a thumbnail key to a readable file inside the uploads directory"""
+    if upload_storage.is_storage_key(key):
+        path = upload_storage.resolve_local_path(key)
+    else:
+        path = os.path.join(upload_storage.UPLOAD_DIR, key)
+    if not path or not os.path.isfile(path):
+        return None
+    root = os.path.realpath(upload_storage.UPLOAD_DIR)
+    real = os.path.realpath(path)
+    # Never serve files outside uploads/ or derivatives of derivatives
+    if not real.startswith(root + os.sep) or real.startswith(os.path.realpath(THUMBNAIL_DIR) + os.sep):
+        return None
+    return path
+
+
+def source_digest(key: str, path: str) -> str:
+    """Content hash of a source image (free for content-addressed keys)"""
+    if upload_storage.is_storage_key(key):
+        return key.rsplit('/', 1)[-1]
+    stat = os.stat(path)
+    cache_key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _legacy_digests.get(cache_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(upload_storage.CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = _legacy_digests[cache_key] = sha.hexdigest()
+    return digest
+
+
+def derivative_path(digest: str, size: int) -> str:
+    return os.path.join(THUMBNAIL_DIR, str(size), digest[:2], digest[2:4], f"{digest}.webp")
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _decode(source: str, size: int) -> Image.Image:
+    """Upright thumbnail of the source, fully loaded"""
+    with Image.open(source) as image:
+        image.draft('RGB', (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        image.thumbnail((size, size), Image.LANCZOS)
+        return image
+
+
+def ensure_thumbnail(source: str, digest: str, size: int) -> str:
+    """
+    Return the derivative path, generating it first if it does not exist yet.
+
+    Raises ValueError if the source is not an image that can be decoded
+    (unknown format, truncated, or over Pillow's decompression bomb limit).
+    """
+    path = derivative_path(digest, size)
+    if os.path.exists(path):
+        return path
+    if digest in _unsupported:
+        raise ValueError(_unsupported[digest])
+
+    # One generator per derivative; concurrent requests wait for it
+    with _lock_for(path):
+        if os.path.exists(path):
+            return path
+        try:
+            image = _decode(source, size)
+        except FileNotFoundError:
+            raise
+        except (Image.DecompressionBombError, UnidentifiedImageError, OSError) as e:
+            message = ('Source image is too large' if isinstance(e, Image.DecompressionBombError)
+                       else 'Source is not a supported image')
+            with _locks_guard:
+                _unsupported[digest] = message
+                while len(_unsupported) > MAX_UNSUPPORTED:
+                    del _unsupported[next(iter(_unsupported))]
+                _locks.pop(path, None)
+            raise ValueError(message)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                image.save(tmp, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    with _locks_guard:
+        _locks.pop(path, None)
+    return path
+
+
+def generate_all(image_path: str):
+    """Create every thumbnail size for an uploaded image (errors are logged)"""
+    key = image_key(image_path)
+    if not key:
+        return
+    try:
+        digest = source_digest(key, image_path)
+        for size in THUMBNAIL_SIZES:
+            ensure_thumbnail(image_path, digest, size)
+    except Exception as e:
+        logger.error("Error generating thumbnails for %s: %s", image_path, e)
+
+
+def schedule(image_path: str):
+    """Generate thumbnails for a new upload in the background"""
+    if GENERATE_ON_UPLOAD:
+        _executor.submit(generate_all, image_path)
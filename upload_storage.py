@@ -0,0 +1,209 @@
+"""
+Content-addressed storage for uploaded images.
+
+Uploads are streamed to a temporary file in fixed-size chunks while their
+SHA-256 is computed, then moved atomically to a hash-sharded path:
+
+    uploads/ab/cd/abcd1234...   (first two byte pairs of the digest)
+
+Identical uploads map to the same file, so retries and re-uploads are stored
+once, names can never collide, and no directory grows beyond a few hundred
+entries. Two backends share this layout:
+
+- LocalUploadStorage keeps files under UPLOAD_DIR
+- FirebaseUploadStorage also stores each file in Firebase Storage
+  (firebase['bucket']) and keeps the local copy as a read-through cache
+
+Set UPLOAD_STORAGE_BACKEND=local to force local storage in production.
+"""
+import os
+import logging
+import hashlib
+import tempfile
+import threading
+from typing import BinaryIO, Dict, Any, Optional
+
+from firebase_init import firebase
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', 'uploads')
+UPLOAD_STORAGE_BACKEND = os.environ.get('UPLOAD_STORAGE_BACKEND', 'auto')
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(25 * 1024 * 1024)))
+
+# Object prefix used in the Firebase Storage bucket
+BUCKET_PREFIX = 'uploads'
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+
+def shard_key(digest: str) -> str:
+    """Relative storage key for a SHA-256 hex digest: ab/cd/<digest>"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def is_storage_key(value: str) -> bool:
+    parts = value.split('/')
+    return (len(parts) == 3 and len(parts[2]) == 64 and parts[0] == parts[2][:2]
+            and parts[1] == parts[2][2:4] and all(c in '0123456789abcdef' for c in parts[2]))
+
+
+class LocalUploadStorage:
+    """Content-addressed uploads on the local filesystem"""
+
+    def __init__(self, root: str = UPLOAD_DIR, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._tmp_dir = os.path.join(root, '.tmp')
+
+    def local_path(self, key: str) -> str:
+        """Filesystem path of a stored upload"""
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def _stream_to_temp(self, stream: BinaryIO):
+        """Copy a stream to a temp file chunk by chunk, hashing as it goes"""
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f'Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit')
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if size == 0:
+            os.unlink(tmp_path)
+            raise ValueError('Empty upload')
+        return tmp_path, digest.hexdigest(), size
+
+    def _commit_local(self, tmp_path: str, key: str) -> bool:
+        """Atomically move a temp file into place; returns False if it was already stored"""
+        final_path = self.local_path(key)
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+            return False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # os.replace is atomic, so readers never see a partial file and a
+        # concurrent identical upload simply replaces it with the same bytes
+        os.replace(tmp_path, final_path)
+        return True
+
+    def save_stream(self, stream: BinaryIO, filename: str = None) -> Dict[str, Any]:
+        """
+        Store an upload from a file-like object.
+
+        Returns {'key', 'path', 'sha256', 'size', 'deduplicated', 'filename'};
+        'path' is a local file that detection code can open directly.
+        """
+        tmp_path, digest, size = self._stream_to_temp(stream)
+        key = shard_key(digest)
+        stored = self._commit_local(tmp_path, key)
+        return {
+            'key': key,
+            'path': self.local_path(key),
+            'sha256': digest,
+            'size': size,
+            'deduplicated': not stored,
+            'filename': filename,
+        }
+
+
+class FirebaseUploadStorage(LocalUploadStorage):
+    """Uploads stored in Firebase Storage with a local read-through cache"""
+
+    def __init__(self, bucket, root: str = UPLOAD_DIR, max_bytes: int = MAX_UPLOAD_BYTES):
+        super().__init__(root, max_bytes)
+        self.bucket = bucket
+        self._download_lock = threading.Lock()
+
+    def _blob(self, key: str):
+        return self.bucket.blob(f"{BUCKET_PREFIX}/{key}")
+
+    def exists(self, key: str) -> bool:
+        return super().exists(key) or self._blob(key).exists()
+
+    def fetch(self, key: str) -> str:
+        """Local path of an upload, downloading it from the bucket on a cache miss"""
+        path = self.local_path(key)
+        if os.path.exists(path):
+            return path
+        with self._download_lock:
+            if not os.path.exists(path):
+                os.makedirs(self._tmp_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+                os.close(fd)
+                try:
+                    self._blob(key).download_to_filename(tmp_path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+                self._commit_local(tmp_path, key)
+        return path
+
+    def save_stream(self, stream: BinaryIO, filename: str = None) -> Dict[str, Any]:
+        saved = super().save_stream(stream, filename)
+        blob = self._blob(saved['key'])
+        if blob.exists():
+            saved['deduplicated'] = True
+        else:
+            blob.upload_from_filename(saved['path'])
+        saved['url'] = f"gs://{self.bucket.name}/{BUCKET_PREFIX}/{saved['key']}"
+        return saved
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> LocalUploadStorage:
+    """Storage backend for this process: Firebase Storage when a bucket is configured"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            bucket = firebase.get('bucket')
+            if bucket is not None and UPLOAD_STORAGE_BACKEND != 'local':
+                _storage = FirebaseUploadStorage(bucket)
+                logger.info("Storing uploads in Firebase Storage bucket %s", bucket.name)
+            else:
+                _storage = LocalUploadStorage()
+        return _storage
+
+
+def resolve_local_path(image_path: str) -> Optional[str]:
+    """
+    Map a client-supplied image_path (a storage key, a stored path or a
+    legacy flat uploads/ file) to a readable local file, or None.
+    """
+    storage = get_storage()
+    key = image_path
+    prefix = storage.root.rstrip('/') + '/'
+    if key.startswith(prefix):
+        key = key[len(prefix):]
+    if is_storage_key(key):
+        if isinstance(storage, FirebaseUploadStorage):
+            try:
+                return storage.fetch(key)
+            except Exception as e:
+                logger.error("Error fetching upload %s: %s", key, e)
+                return None
+        path = storage.local_path(key)
+        return path if os.path.exists(path) else None
+    return image_path if os.path.exists(image_path) else None